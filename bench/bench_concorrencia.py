@@ -0,0 +1,107 @@
+"""
+Teste de concorrência das contagens: várias threads registram contagens
+ao mesmo tempo via POST /api/contagens, todas no mesmo lote e em lotes
+novos criados simultaneamente por todas. Ao final, confere que nenhuma
+atualização se perdeu (quantidade de cada lote, lotes duplicados e
+estoque_totais comparado às contagens) e informa a vazão obtida.
+Sai com erro se alguma verificação falhar: serve de teste de regressão.
+
+Uso: python bench/bench_concorrencia.py [--threads 8] [--contagens 50]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from dados import criar_app, limpar_banco
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--contagens', type=int, default=50, help='contagens por thread')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    app = criar_app(args.database_url)
+    from src.services.totais import verificar_totais
+    with app.app_context():
+        limpar_banco()
+    app.test_client().post('/api/produtos', json={'codigo': '1', 'nome': 'PRODUTO CONCORRENCIA'})
+
+    erros = []
+    barreira = threading.Barrier(args.threads)
+
+    def registrar(client, lote):
+        r = client.post('/api/contagens', json={
+            'codigo_produto': '1',
+            'lote': lote,
+            'validade_mes': 12,
+            'validade_ano': 2030,
+            'quantidade': 1
+        })
+        if r.status_code not in (200, 201):
+            erros.append(r.get_json().get('message'))
+
+    def contar():
+        client = app.test_client()
+        barreira.wait()
+        for i in range(args.contagens):
+            registrar(client, 'LOTE-CONCORRENTE')
+            # Todas as threads criam o mesmo lote novo ao mesmo tempo
+            registrar(client, f'LOTE-NOVO-{i:04d}')
+
+    threads = [threading.Thread(target=contar) for _ in range(args.threads)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    enviadas = 2 * args.threads * args.contagens
+    contagens = app.test_client().get('/api/contagens/produto/0001').get_json()['contagens']
+    quantidades = {c['lote']: c['quantidade'] for c in contagens}
+    total_tabela = app.test_client().get('/api/contagens/totais').get_json()['total_geral']
+    with app.app_context():
+        divergencias = verificar_totais()
+
+    falhas = []
+
+    def verificar(descricao, condicao):
+        if not condicao:
+            falhas.append(descricao)
+
+    verificar(f'{len(erros)} requisições com erro: {erros[:3]}', not erros)
+    verificar(f'lotes duplicados: {len(contagens)} linhas para {len(quantidades)} lotes',
+              len(contagens) == len(quantidades))
+    verificar(f'lote concorrente: esperado {args.threads * args.contagens}, '
+              f'obtido {quantidades.get("LOTE-CONCORRENTE")}',
+              quantidades.get('LOTE-CONCORRENTE') == args.threads * args.contagens)
+    novos = {lote: quantidade for lote, quantidade in quantidades.items() if lote.startswith('LOTE-NOVO-')}
+    verificar(f'lotes novos: esperados {args.contagens} com {args.threads} cada, obtidos {len(novos)} '
+              f'com {sorted(set(novos.values()))}',
+              len(novos) == args.contagens and set(novos.values()) <= {args.threads})
+    verificar(f'total geral: esperado {enviadas}, obtido {total_tabela}', total_tabela == enviadas)
+    verificar(f'estoque_totais diverge das contagens: {divergencias[:3]}', not divergencias)
+
+    print(json.dumps({
+        'threads': args.threads,
+        'enviadas': enviadas,
+        'erros': len(erros),
+        'lotes': len(contagens),
+        'total_esperado': enviadas,
+        'total_estoque_totais': total_tabela,
+        'contagens_por_s': round(enviadas / duracao, 1),
+        'falhas': falhas,
+    }, indent=2))
+
+    if falhas:
+        for falha in falhas:
+            print(f'FALHOU: {falha}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark do relatório Excel: compara o caminho antigo (lista de dicts +
+DataFrame + pd.ExcelWriter + estilização via iterrows) com o escritor
+write-only do openpyxl. Cada variante roda em um processo separado para
+medir o pico de memória (RSS).
+
+Uso: python bench/bench_excel.py [--lotes 10000,100000,1000000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from dados import criar_app, popular
+
+LOTES_POR_PRODUTO = 100
+
+
+def excel_pandas(arquivo):
+    """Reprodução do relatório antigo via pandas, mantida apenas para comparação"""
+    import pandas as pd
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from src.services.resumo import iterar_linhas_relatorio
+
+    dados = [
+        {'Código': c, 'Nome do Produto': n, 'Lote': l, 'Validade': v, 'Quantidade': q, 'Tipo': t}
+        for c, n, l, v, q, t in iterar_linhas_relatorio()
+    ]
+    df = pd.DataFrame(dados)
+
+    with pd.ExcelWriter(arquivo, engine='openpyxl') as writer:
+        df[['Código', 'Nome do Produto', 'Lote', 'Validade', 'Quantidade']].to_excel(
+            writer, sheet_name='Relatório de Estoque', index=False
+        )
+        worksheet = writer.sheets['Relatório de Estoque']
+        for cell in worksheet[1]:
+            cell.font = Font(bold=True, color="FFFFFF")
+            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+            cell.alignment = Alignment(horizontal="center")
+        subtotal_fill = PatternFill(start_color="D9E2F3", end_color="D9E2F3", fill_type="solid")
+        total_fill = PatternFill(start_color="B4C6E7", end_color="B4C6E7", fill_type="solid")
+        for idx, row in df.iterrows():
+            if row['Tipo'] in ('Subtotal', 'Total'):
+                for col in range(1, 6):
+                    cell = worksheet.cell(row=idx + 2, column=col)
+                    cell.fill = subtotal_fill if row['Tipo'] == 'Subtotal' else total_fill
+                    cell.font = Font(bold=True)
+
+
+def excel_write_only(arquivo):
+    from src.services.relatorio_excel import gerar_excel
+    gerar_excel(arquivo)
+
+
+VARIANTES = {
+    'pandas': excel_pandas,
+    'write_only': excel_write_only,
+}
+
+
+def executar_variante(nome, database_url):
+    """Executado no processo filho: gera o relatório e imprime as medições"""
+    app = criar_app(database_url)
+    with app.app_context():
+        arquivo = tempfile.TemporaryFile()
+        inicio = time.perf_counter()
+        VARIANTES[nome](arquivo)
+        duracao = time.perf_counter() - inicio
+        tamanho = arquivo.tell()
+    # ru_maxrss é informado em KB no Linux
+    pico_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'s': round(duracao, 2), 'pico_rss_mb': round(pico_kb / 1024, 1), 'bytes': tamanho}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lotes', default='10000,100000,1000000')
+    parser.add_argument('--variantes', default=','.join(VARIANTES))
+    parser.add_argument('--variante', help=argparse.SUPPRESS)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    if args.variante:
+        executar_variante(args.variante, args.database_url)
+        return
+
+    caminho = os.path.join(tempfile.mkdtemp(prefix='bench_excel_'), 'estoque.db')
+    database_url = args.database_url or f'sqlite:///{caminho}'
+    app = criar_app(database_url)
+
+    resultados = []
+    for n_lotes in [int(n) for n in args.lotes.split(',')]:
+        with app.app_context():
+            lotes = popular(max(1, n_lotes // LOTES_POR_PRODUTO), LOTES_POR_PRODUTO)
+        resultado = {'lotes': lotes}
+        for variante in args.variantes.split(','):
+            saida = subprocess.run(
+                [sys.executable, __file__, '--variante', variante, '--database-url', database_url],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            resultado[variante] = json.loads(saida)
+        resultados.append(resultado)
+        print(json.dumps(resultado), file=sys.stderr)
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    main()
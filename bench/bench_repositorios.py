@@ -0,0 +1,265 @@
+"""
+Conformidade e desempenho dos backends de src/services/repositorio.py.
+Executa as mesmas verificações (busca e criação de produtos, soma de
+contagens, concorrência no mesmo lote, resumo, exportação, chaves de
+idempotência e as chaves dos dicts retornados, que devem ser as mesmas
+nos dois) em cada backend e, em seguida, mede as operações sobre um
+estoque sintético.
+Sai com erro se alguma verificação falhar.
+
+Uso: python bench/bench_repositorios.py [--backends sqlite,sqlalchemy] [--produtos 500] [--lotes 20]
+                                        [--database-url URL] [--threads 8]
+
+--database-url vale para o backend sqlalchemy (PostgreSQL, por exemplo);
+sem ele, os dois backends usam arquivos SQLite temporários.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from dados import criar_app
+
+
+def preparar(backend, args):
+    """Retorna (repositório, fábrica de contexto para cada thread)"""
+    if backend == 'sqlite':
+        from src.services.repositorio_sqlite import RepositorioSQLite
+        repositorio = RepositorioSQLite(os.path.join(tempfile.mkdtemp(prefix='bench_repo_'), 'estoque.db'))
+        repositorio.criar_tabelas()
+        return repositorio, nullcontext
+
+    app = criar_app(args.database_url)
+    from src.database import db
+    from src.models.contagem import Contagem
+    with app.app_context():
+        if db.session.query(Contagem.id).first() is not None:
+            sys.exit('O backend sqlalchemy precisa de um banco vazio')
+    return app.extensions['repositorio'], app.app_context
+
+
+def ler_exportacao(repositorio, args):
+    _, partes = repositorio.exportar(args)
+    return b''.join(p if isinstance(p, bytes) else p.encode() for p in partes)
+
+
+# Chaves dos dicts retornados pelos dois backends (Produto.to_dict() e Contagem.to_dict())
+CHAVES_PRODUTO = {'id', 'codigo', 'nome', 'created_at'}
+CHAVES_CONTAGEM = {
+    'id', 'produto_id', 'lote', 'validade_mes', 'validade_ano', 'validade_formatada',
+    'quantidade', 'created_at', 'updated_at'
+}
+CHAVES_RESUMO = {'produto', 'contagens', 'total_quantidade'}
+
+
+def data_iso(valor):
+    try:
+        datetime.fromisoformat(valor)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def verificar_conformidade(repositorio, contexto, threads):
+    """Retorna a lista de verificações que falharam"""
+    from src.services.listagem import ParametroInvalido
+    from src.services.repositorio import ProdutoExistente, ChavesRepetidas
+
+    falhas = []
+
+    def verificar(descricao, condicao):
+        if not condicao:
+            falhas.append(descricao)
+
+    def verificar_chaves(descricao, dicts, esperadas):
+        for item in dicts:
+            if set(item) != esperadas:
+                falhas.append(f'{descricao}: chaves {sorted(item)}, esperadas {sorted(esperadas)}')
+                return
+            if not data_iso(item['created_at']):
+                falhas.append(f'{descricao}: created_at {item["created_at"]!r} fora do formato ISO 8601')
+                return
+
+    with contexto():
+        p2 = repositorio.criar_produto('0002', 'PRODUTO 2')
+        p1 = repositorio.criar_produto('0001', 'PRODUTO 1')
+        repositorio.criar_produto('0003', 'SEM CONTAGENS')
+        verificar('criar_produto retorna o produto', (p1.codigo, p1.nome) == ('0001', 'PRODUTO 1'))
+        try:
+            repositorio.criar_produto('0001', 'REPETIDO')
+            verificar('código repetido levanta ProdutoExistente', False)
+        except ProdutoExistente:
+            pass
+
+        verificar('buscar_produto encontra pelo código', repositorio.buscar_produto('0002').id == p2.id)
+        verificar('buscar_produto retorna None', repositorio.buscar_produto('9999') is None)
+        verificar('listar_produtos em ordem de código',
+                  [p['codigo'] for p in repositorio.listar_produtos()] == ['0001', '0002', '0003'])
+        verificar_chaves('criar_produto e buscar_produto', [p1.to_dict(), repositorio.buscar_produto('0002').to_dict()],
+                         CHAVES_PRODUTO)
+        verificar_chaves('listar_produtos', repositorio.listar_produtos(), CHAVES_PRODUTO)
+
+        item = {'produto_id': p1.id, 'lote': ' l1 ', 'validade_mes': 5, 'validade_ano': 2030, 'quantidade': 4}
+        contagem, criou = repositorio.somar_contagens([item])[(p1.id, 'L1')]
+        verificar('lote novo é criado (lote normalizado)', criou and contagem['lote'] == 'L1' and contagem['quantidade'] == 4)
+        aplicadas = repositorio.somar_contagens([
+            dict(item, lote='L1', quantidade=6, validade_mes=9),
+            {'produto_id': p1.id, 'lote': 'L0', 'validade_mes': 1, 'validade_ano': 2031, 'quantidade': 0},
+            {'produto_id': p2.id, 'lote': 'L1', 'validade_mes': 2, 'validade_ano': 2032, 'quantidade': 3},
+        ])
+        contagem, criou = aplicadas[(p1.id, 'L1')]
+        verificar('lote existente soma a quantidade e mantém a validade',
+                  not criou and contagem['quantidade'] == 10 and contagem['validade_mes'] == 5)
+        verificar('vários lotes em uma chamada', aplicadas[(p1.id, 'L0')][1] and aplicadas[(p2.id, 'L1')][1])
+        verificar_chaves('somar_contagens', [contagem for contagem, _ in aplicadas.values()], CHAVES_CONTAGEM)
+
+        contagens, total = repositorio.contagens_do_produto(p1)
+        verificar('contagens_do_produto em ordem de lote', [c['lote'] for c in contagens] == ['L0', 'L1'] and total == 10)
+        verificar_chaves('contagens_do_produto', contagens, CHAVES_CONTAGEM)
+
+    # Registros simultâneos no mesmo lote: nenhuma soma pode se perder
+    por_thread = 25
+    barreira = threading.Barrier(threads)
+    erros = []
+
+    def somar():
+        with contexto():
+            barreira.wait()
+            for _ in range(por_thread):
+                try:
+                    repositorio.somar_contagens([dict(item, lote='CONCORRENTE', quantidade=1)])
+                except Exception as e:
+                    erros.append(str(e))
+
+    execucoes = [threading.Thread(target=somar) for _ in range(threads)]
+    for execucao in execucoes:
+        execucao.start()
+    for execucao in execucoes:
+        execucao.join()
+
+    with contexto():
+        contagens, _ = repositorio.contagens_do_produto(p1)
+        concorrente = next((c['quantidade'] for c in contagens if c['lote'] == 'CONCORRENTE'), 0)
+        verificar(f'concorrência: {threads * por_thread} somas, obtido {concorrente}, erros {erros[:1]}',
+                  concorrente == threads * por_thread and not erros)
+
+        resumo, total_geral = repositorio.resumo()
+        verificar('resumo com todos os produtos em ordem de código',
+                  [r['produto']['codigo'] for r in resumo] == ['0001', '0002', '0003'])
+        verificar('total geral do resumo', total_geral == sum(r['total_quantidade'] for r in resumo) == 13 + concorrente)
+        verificar('chaves do resumo', all(set(r) == CHAVES_RESUMO for r in resumo))
+        verificar_chaves('produtos do resumo', [r['produto'] for r in resumo], CHAVES_PRODUTO)
+        verificar_chaves('contagens do resumo', [c for r in resumo for c in r['contagens']], CHAVES_CONTAGEM)
+        resumo, _ = repositorio.resumo(incluir_zerados=False)
+        verificar('resumo sem produtos zerados', [r['produto']['codigo'] for r in resumo] == ['0001', '0002'])
+
+        linhas = [json.loads(linha) for linha in ler_exportacao(repositorio, {}).splitlines()]
+        verificar('exportação NDJSON em ordem de código e lote',
+                  [(l['produto']['codigo'], l['lote']) for l in linhas] ==
+                  [('0001', 'CONCORRENTE'), ('0001', 'L0'), ('0001', 'L1'), ('0002', 'L1')])
+        verificar_chaves('exportação NDJSON', [{k: v for k, v in l.items() if k != 'produto'} for l in linhas],
+                         CHAVES_CONTAGEM)
+        verificar_chaves('produto na exportação NDJSON', [l['produto'] for l in linhas], CHAVES_PRODUTO)
+        tabela = list(csv.reader(io.StringIO(
+            ler_exportacao(repositorio, {'format': 'csv', 'fields': 'lote,quantidade,produto.codigo'}).decode()
+        )))
+        verificar('exportação CSV com cabeçalho e campos escolhidos',
+                  tabela[0] == ['lote', 'quantidade', 'produto.codigo'] and tabela[-1] == ['L1', '3', '0002'])
+        try:
+            repositorio.exportar({'format': 'xml'})
+            verificar('formato inválido levanta ParametroInvalido', False)
+        except ParametroInvalido:
+            pass
+
+        repositorio.somar_contagens([dict(item, lote='L2', quantidade=5)], ['chave-1'])
+        try:
+            repositorio.somar_contagens([dict(item, lote='L2', quantidade=5)], ['chave-2', 'chave-1'])
+            verificar('chave repetida levanta ChavesRepetidas', False)
+        except ChavesRepetidas as e:
+            verificar('ChavesRepetidas informa só as chaves já registradas', e.chaves == {'chave-1'})
+        repositorio.somar_contagens([dict(item, lote='L2', quantidade=5)], ['chave-2'])
+        contagens, total = repositorio.contagens_do_produto(p1)
+        verificar('envio com chave repetida não é somado (nem as chaves novas)',
+                  next(c['quantidade'] for c in contagens if c['lote'] == 'L2') == 10)
+
+    return falhas
+
+
+def medir(repositorio, contexto, args):
+    """Tempos das operações sobre produtos 1000..1000+produtos com `lotes` lotes cada"""
+    rnd = random.Random(args.seed)
+    resultado = {}
+
+    with contexto():
+        produtos = [repositorio.criar_produto(f'{1000 + i:04d}', f'PRODUTO {i}') for i in range(args.produtos)]
+
+        itens = [
+            {'produto_id': p.id, 'lote': f'L{l:04d}', 'validade_mes': 1 + l % 12,
+             'validade_ano': 2030, 'quantidade': rnd.randint(0, 50)}
+            for p in produtos for l in range(args.lotes)
+        ]
+        inicio = time.perf_counter()
+        for i in range(0, len(itens), 500):
+            repositorio.somar_contagens(itens[i:i + 500])
+        resultado['upsert_lote_linhas_por_s'] = round(len(itens) / (time.perf_counter() - inicio))
+
+        operacoes = 500
+        inicio = time.perf_counter()
+        for _ in range(operacoes):
+            repositorio.somar_contagens([rnd.choice(itens)])
+        resultado['upsert_unitario_ms'] = round((time.perf_counter() - inicio) / operacoes * 1000, 3)
+
+        inicio = time.perf_counter()
+        for _ in range(operacoes * 10):
+            repositorio.buscar_produto(f'{1000 + rnd.randrange(args.produtos):04d}')
+        resultado['buscar_produto_us'] = round((time.perf_counter() - inicio) / (operacoes * 10) * 1e6, 1)
+
+        inicio = time.perf_counter()
+        resumo, _ = repositorio.resumo()
+        resultado['resumo_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+
+        inicio = time.perf_counter()
+        linhas = ler_exportacao(repositorio, {}).count(b'\n')
+        resultado['exportar_linhas_por_s'] = round(linhas / (time.perf_counter() - inicio))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='sqlite,sqlalchemy')
+    parser.add_argument('--produtos', type=int, default=500, help='até 8999')
+    parser.add_argument('--lotes', type=int, default=20, help='lotes por produto')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # Estado compartilhado (cache do catálogo, versão do estoque) novo a cada execução
+    os.environ.setdefault('ESTOQUE_ESTADO_DIR', tempfile.mkdtemp(prefix='bench_estado_'))
+
+    resultado = {}
+    falhou = False
+    for backend in args.backends.split(','):
+        repositorio, contexto = preparar(backend, args)
+        falhas = verificar_conformidade(repositorio, contexto, args.threads)
+        for falha in falhas:
+            print(f'{backend}: FALHOU {falha}', file=sys.stderr)
+        falhou = falhou or bool(falhas)
+        resultado[backend] = {'falhas': len(falhas), **medir(repositorio, contexto, args)}
+        print(f'{backend}: {json.dumps(resultado[backend])}', file=sys.stderr)
+
+    print(json.dumps(resultado, indent=2))
+    if falhou:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark do resumo de estoque: compara o laço N+1 antigo (uma ou duas
+consultas por produto) com o montador de resumo em consulta única,
+variando o tamanho do catálogo.
+
+Uso: python bench/bench_resumo.py [--produtos 100,1000,5000] [--lotes 3]
+"""
+import argparse
+import json
+import time
+
+from dados import criar_app, popular, contar_consultas
+
+
+def resumo_n_mais_um():
+    """Reprodução do resumo antigo, mantida apenas para comparação"""
+    from src.database import db
+    from src.models.produto import Produto
+    from src.models.contagem import Contagem
+    from sqlalchemy import func
+
+    resumo = []
+    total_geral = 0
+    for produto in Produto.query.order_by(Produto.codigo).all():
+        total_produto = db.session.query(func.sum(Contagem.quantidade)).filter_by(
+            produto_id=produto.id
+        ).scalar() or 0
+        contagens = Contagem.query.filter_by(produto_id=produto.id).order_by(Contagem.lote).all()
+        resumo.append({
+            'produto': produto.to_dict(),
+            'contagens': [c.to_dict() for c in contagens],
+            'total_quantidade': total_produto
+        })
+        total_geral += total_produto
+    return resumo, total_geral
+
+
+def medir(funcao, engine):
+    from src.database import db
+
+    db.session.expunge_all()
+    with contar_consultas(engine) as contador:
+        inicio = time.perf_counter()
+        resumo, total = funcao()
+        duracao = time.perf_counter() - inicio
+    return {
+        'consultas': contador['consultas'],
+        'ms': round(duracao * 1000, 2),
+        'produtos': len(resumo),
+        'total_geral': total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--produtos', default='100,1000,5000')
+    parser.add_argument('--lotes', type=int, default=3)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    app = criar_app(args.database_url)
+
+    from src.database import db
+    from src.services.resumo import montar_resumo
+
+    resultados = []
+    with app.app_context():
+        for n_produtos in [int(n) for n in args.produtos.split(',')]:
+            n_lotes = popular(n_produtos, args.lotes)
+            antigo = medir(resumo_n_mais_um, db.engine)
+            novo = medir(montar_resumo, db.engine)
+            assert antigo['total_geral'] == novo['total_geral']
+            resultados.append({
+                'produtos': n_produtos,
+                'lotes': n_lotes,
+                'n_mais_um': antigo,
+                'consulta_unica': novo,
+            })
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    main()
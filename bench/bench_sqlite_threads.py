@@ -0,0 +1,174 @@
+"""
+Vazão da variante SQLite (src/main_final.py) no gunicorn com 1 worker e
+número crescente de threads: clientes simultâneos misturam leituras
+(contagens de um produto) e registros de contagem. Informa requisições
+por segundo, latência, erros ("database is locked") e confere se alguma
+soma de contagem se perdeu.
+
+Uso: python bench/bench_sqlite_threads.py [--threads 1,2,4,8] [--clientes 16]
+                                          [--duracao 5] [--escritas 0.2]
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo"""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def popular(caminho, produtos, lotes):
+    """Cria as tabelas (init_database, ao importar a variante) e insere os dados de uma vez"""
+    os.environ['ESTOQUE_SQLITE'] = caminho
+    sys.path.insert(0, RAIZ)
+    import src.main_final
+
+    conn = sqlite3.connect(caminho)
+    conn.executemany('INSERT INTO produtos (codigo, nome) VALUES (?, ?)',
+                     [(f'{i:04d}', f'PRODUTO {i:04d}') for i in range(1, produtos + 1)])
+    conn.executemany(
+        'INSERT INTO contagens (produto_id, lote, validade_mes, validade_ano, quantidade) VALUES (?, ?, ?, ?, ?)',
+        [(p, f'L{l:03d}', 1 + l % 12, 2030, 10) for p in range(1, produtos + 1) for l in range(lotes)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def total_contagens(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute('SELECT COALESCE(SUM(quantidade), 0) FROM contagens').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def iniciar_servidor(threads, porta, caminho):
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', '1', '--worker-class', 'gthread',
+         '--threads', str(threads), '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+         'src.main_final:app'],
+        cwd=RAIZ, env=dict(os.environ, ESTOQUE_SQLITE=caminho)
+    )
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=1)
+            conexao.request('GET', '/api/produtos/1')
+            conexao.getresponse().read()
+            conexao.close()
+            return processo
+        except OSError:
+            time.sleep(0.1)
+    processo.terminate()
+    sys.exit('gunicorn não respondeu em 30s')
+
+
+def medir(porta, args):
+    """Clientes com conexões keep-alive durante args.duracao segundos"""
+    latencias = []
+    erros = []
+    escritas = [0]
+    trava = threading.Lock()
+    fim = time.monotonic() + args.duracao
+
+    def cliente(indice):
+        rnd = random.Random(args.seed + indice)
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        minhas, meus_erros, minhas_escritas = [], [], 0
+        while time.monotonic() < fim:
+            codigo = f'{rnd.randint(1, args.produtos):04d}'
+            escrita = rnd.random() < args.escritas
+            inicio = time.perf_counter()
+            if escrita:
+                corpo = json.dumps({
+                    'codigo_produto': codigo, 'lote': f'L{rnd.randrange(args.lotes):03d}',
+                    'validade_mes': 1, 'validade_ano': 2030, 'quantidade': 1
+                })
+                conexao.request('POST', '/api/contagens', corpo, {'Content-Type': 'application/json'})
+            else:
+                conexao.request('GET', f'/api/contagens/produto/{codigo}')
+            resposta = conexao.getresponse()
+            dados = resposta.read()
+            minhas.append(time.perf_counter() - inicio)
+            if resposta.status >= 400:
+                meus_erros.append(json.loads(dados).get('message'))
+            elif escrita:
+                minhas_escritas += 1
+        conexao.close()
+        with trava:
+            latencias.extend(minhas)
+            erros.extend(meus_erros)
+            escritas[0] += minhas_escritas
+
+    clientes = [threading.Thread(target=cliente, args=(i,)) for i in range(args.clientes)]
+    inicio = time.perf_counter()
+    for c in clientes:
+        c.start()
+    for c in clientes:
+        c.join()
+    duracao = time.perf_counter() - inicio
+    return latencias, erros, escritas[0], duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', default='1,2,4,8', help='threads do gunicorn a medir')
+    parser.add_argument('--clientes', type=int, default=16, help='conexões simultâneas')
+    parser.add_argument('--duracao', type=float, default=5, help='segundos por medição')
+    parser.add_argument('--escritas', type=float, default=0.2, help='fração de registros de contagem')
+    parser.add_argument('--produtos', type=int, default=500)
+    parser.add_argument('--lotes', type=int, default=10, help='lotes por produto')
+    parser.add_argument('--porta', type=int, default=5099)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    caminho = os.path.join(tempfile.mkdtemp(prefix='bench_sqlite_'), 'estoque.db')
+    popular(caminho, args.produtos, args.lotes)
+
+    resultados = []
+    for threads in map(int, args.threads.split(',')):
+        antes = total_contagens(caminho)
+        servidor = iniciar_servidor(threads, args.porta, caminho)
+        try:
+            latencias, erros, escritas, duracao = medir(args.porta, args)
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+        resultado = {
+            'threads': threads,
+            'requisicoes': len(latencias),
+            'req_por_s': round(len(latencias) / duracao, 1),
+            'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+            'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+            'erros': len(erros),
+            'erros_bloqueio': sum('locked' in (m or '') for m in erros),
+            # Cada escrita bem-sucedida soma 1: a diferença são somas perdidas
+            'atualizacoes_perdidas': escritas - (total_contagens(caminho) - antes),
+        }
+        resultados.append(resultado)
+        print(json.dumps(resultado), file=sys.stderr)
+
+    print(json.dumps({
+        'clientes': args.clientes,
+        'escritas': args.escritas,
+        'lotes': args.produtos * args.lotes,
+        'resultados': resultados,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
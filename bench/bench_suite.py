@@ -0,0 +1,322 @@
+"""
+Suíte de benchmarks da aplicação: gera um estoque sintético (até 9.999
+produtos, com lotes por produto em distribuição assimétrica) e mede os
+endpoints principais pelo test client do Flask. Cada cenário roda em um
+processo separado para medir o pico de memória (RSS) e informa latência
+p50/p95, vazão e instruções SQL por requisição em JSON, para comparar
+commits.
+
+As leituras são medidas sem cache (a versão do estoque é incrementada
+antes de cada requisição); --com-cache mede as respostas já em cache.
+
+Uso: python bench/bench_suite.py [--produtos 2000] [--lotes 50] [--distribuicao assimetrica]
+                                 [--database-url URL] [--cenarios resumo,pdf] [--threads 1]
+                                 [--saida resultado.json] [--comparar anterior.json]
+
+Exemplo com cerca de 2 milhões de lotes em um PostgreSQL local:
+    python bench/bench_suite.py --produtos 9999 --lotes 200 --database-url postgresql://localhost/estoque_bench
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from dados import criar_app, popular, contar_consultas
+
+# Tempo máximo (segundos) esperando uma importação em segundo plano terminar
+LIMITE_IMPORTACAO = 600
+
+
+def ler_corpo(resposta):
+    """Lê a resposta inteira (respostas em partes consultam o banco durante a leitura)"""
+    resposta.get_data()
+    return resposta.status_code < 400
+
+
+def invalidar_caches(contexto):
+    if not contexto['com_cache']:
+        # Direto na conexão DBAPI: fora da contagem de instruções SQL do cenário
+        engine = contexto['engine']
+        conexao = engine.raw_connection()
+        try:
+            if engine.dialect.name == 'postgresql':
+                conexao.cursor().execute("SELECT nextval('versao_estoque')")
+            else:
+                conexao.cursor().execute("UPDATE sequencias SET valor = valor + 1 WHERE nome = 'versao_estoque'")
+            conexao.commit()
+        finally:
+            conexao.close()
+
+
+def cenario_contagens_post(contexto):
+    rnd = contexto['rnd']
+    return ler_corpo(contexto['client'].post('/api/contagens', json={
+        'codigo_produto': str(rnd.randint(1, contexto['produtos'])),
+        'lote': f'BENCH{rnd.randint(0, 999):03d}',
+        'validade_mes': rnd.randint(1, 12),
+        'validade_ano': rnd.randint(2025, 2030),
+        'quantidade': rnd.randint(1, 50)
+    }))
+
+
+def cenario_resumo(contexto):
+    return ler_corpo(contexto['client'].get('/api/contagens/resumo'))
+
+
+def cenario_relatorio_pdf(contexto):
+    return ler_corpo(contexto['client'].get('/api/relatorio/pdf'))
+
+
+def cenario_relatorio_excel(contexto):
+    return ler_corpo(contexto['client'].get('/api/relatorio/excel'))
+
+
+def planilha_importacao(produtos, variante):
+    """XLSX com todos os produtos existentes renomeados"""
+    from openpyxl import Workbook
+
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet('Produtos')
+    planilha.append(['Código', 'Nome do Produto'])
+    for i in range(1, produtos + 1):
+        planilha.append([f'{i:04d}', f'PRODUTO IMPORTADO {variante} {i:04d}'])
+    arquivo = io.BytesIO()
+    livro.save(arquivo)
+    return arquivo.getvalue()
+
+
+def cenario_importar(contexto):
+    """Envia a planilha e espera a importação em segundo plano terminar"""
+    if 'planilhas' not in contexto:
+        # Duas planilhas alternadas: cada importação altera o nome de todos os produtos
+        contexto['planilhas'] = [planilha_importacao(contexto['produtos'], v) for v in 'AB']
+    contexto['importacoes'] = contexto.get('importacoes', 0) + 1
+    planilha = contexto['planilhas'][contexto['importacoes'] % 2]
+
+    client = contexto['client']
+    resposta = client.post('/api/produtos/importar', data={
+        'arquivo': (io.BytesIO(planilha), 'produtos.xlsx')
+    }, content_type='multipart/form-data')
+    if resposta.status_code != 202:
+        return False
+
+    status_url = resposta.get_json()['status_url']
+    limite = time.perf_counter() + LIMITE_IMPORTACAO
+    while time.perf_counter() < limite:
+        status = client.get(status_url).get_json()['status']
+        if status == 'concluida':
+            return True
+        if status == 'erro':
+            return False
+        time.sleep(0.01)
+    return False
+
+
+# nome: (função, requisições padrão, invalida caches antes de cada requisição)
+CENARIOS = {
+    'contagens_post': (cenario_contagens_post, 500, False),
+    'resumo': (cenario_resumo, 20, True),
+    'relatorio_pdf': (cenario_relatorio_pdf, 5, True),
+    'relatorio_excel': (cenario_relatorio_excel, 5, True),
+    'importar': (cenario_importar, 3, False),
+}
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo"""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def pico_rss_mb():
+    # ru_maxrss é informado em KB no Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def executar_cenario(nome, args):
+    """Executado no processo filho: roda o cenário e imprime as medições"""
+    funcao, padrao, invalida = CENARIOS[nome]
+    requisicoes = args.requisicoes or padrao
+    app = criar_app(args.database_url)
+    from src.database import db
+    with app.app_context():
+        engine = db.engine
+
+    # Uma requisição fora da medição: importações e caches de consulta do SQLAlchemy
+    contexto = {
+        'client': app.test_client(),
+        'rnd': random.Random(args.seed),
+        'produtos': args.produtos,
+        'com_cache': args.com_cache,
+        'engine': engine,
+    }
+    funcao(contexto)
+    rss_inicial = pico_rss_mb()
+
+    latencias = []
+    erros = [0]
+    trava = threading.Lock()
+
+    def executar_parte(quantidade, indice):
+        local = dict(contexto, client=app.test_client(), rnd=random.Random(args.seed + indice))
+        for _ in range(quantidade):
+            if invalida:
+                invalidar_caches(local)
+            inicio = time.perf_counter()
+            sucesso = funcao(local)
+            duracao = time.perf_counter() - inicio
+            with trava:
+                latencias.append(duracao)
+                erros[0] += not sucesso
+
+    threads = max(1, min(args.threads, requisicoes))
+    partes = [requisicoes // threads + (i < requisicoes % threads) for i in range(threads)]
+    with contar_consultas(engine) as contador:
+        inicio = time.perf_counter()
+        execucoes = [threading.Thread(target=executar_parte, args=(q, i)) for i, q in enumerate(partes)]
+        for execucao in execucoes:
+            execucao.start()
+        for execucao in execucoes:
+            execucao.join()
+        duracao = time.perf_counter() - inicio
+
+    print(json.dumps({
+        'requisicoes': requisicoes,
+        'threads': threads,
+        'erros': erros[0],
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'max_ms': round(max(latencias) * 1000, 2),
+        'req_por_s': round(requisicoes / duracao, 2),
+        'consultas_por_requisicao': round(contador['consultas'] / requisicoes, 1),
+        'rss_inicial_mb': rss_inicial,
+        'pico_rss_mb': pico_rss_mb(),
+    }))
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, arquivo):
+    """Mostra no stderr a variação de cada medição em relação a outra execução"""
+    with open(arquivo) as f:
+        anterior = json.load(f)
+    print(f'Comparação com {anterior.get("commit") or arquivo}:', file=sys.stderr)
+    for nome, medicao in atual['cenarios'].items():
+        base = anterior.get('cenarios', {}).get(nome)
+        if not base:
+            continue
+        variacoes = []
+        for campo in ('p50_ms', 'p95_ms', 'req_por_s', 'consultas_por_requisicao', 'pico_rss_mb'):
+            if base.get(campo):
+                variacoes.append(f'{campo} {(medicao[campo] / base[campo] - 1) * 100:+.1f}%')
+        print(f'  {nome}: ' + ', '.join(variacoes), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--produtos', type=int, default=2000, help='até 9999')
+    parser.add_argument('--lotes', type=int, default=50, help='média de lotes por produto')
+    parser.add_argument('--distribuicao', choices=('assimetrica', 'uniforme'), default='assimetrica')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--manter-dados', action='store_true',
+                        help='não recriar os dados (banco já populado em execução anterior)')
+    parser.add_argument('--cenarios', default=','.join(CENARIOS))
+    parser.add_argument('--requisicoes', type=int, default=None,
+                        help='requisições por cenário (padrão próprio de cada cenário)')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--com-cache', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--saida', help='grava o resultado JSON neste arquivo')
+    parser.add_argument('--comparar', help='resultado JSON de outra execução')
+    parser.add_argument('--cenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not 1 <= args.produtos <= 9999:
+        parser.error('--produtos deve estar entre 1 e 9999')
+
+    if args.cenario:
+        executar_cenario(args.cenario, args)
+        return
+
+    if args.database_url is None:
+        caminho = os.path.join(tempfile.mkdtemp(prefix='bench_suite_'), 'estoque.db')
+        args.database_url = f'sqlite:///{caminho}'
+    # Estado compartilhado (versão do estoque, cache de relatórios) novo a cada execução
+    os.environ.setdefault('ESTOQUE_ESTADO_DIR', tempfile.mkdtemp(prefix='bench_estado_'))
+
+    app = criar_app(args.database_url)
+    from src.database import db
+    from src.models.contagem import Contagem
+
+    with app.app_context():
+        inicio = time.perf_counter()
+        if not args.manter_dados or db.session.query(Contagem.id).first() is None:
+            popular(args.produtos, args.lotes, seed=args.seed, distribuicao=args.distribuicao)
+        geracao = time.perf_counter() - inicio
+        total_lotes = db.session.query(Contagem.id).count()
+        banco = db.engine.dialect.name
+    print(f'{total_lotes} lotes prontos em {geracao:.1f}s', file=sys.stderr)
+
+    repassar = ['--database-url', args.database_url, '--produtos', str(args.produtos),
+                '--threads', str(args.threads), '--seed', str(args.seed)]
+    if args.requisicoes:
+        repassar += ['--requisicoes', str(args.requisicoes)]
+    if args.com_cache:
+        repassar.append('--com-cache')
+
+    cenarios = {}
+    for nome in args.cenarios.split(','):
+        if nome not in CENARIOS:
+            parser.error(f'cenário desconhecido: {nome}')
+        processo = subprocess.run(
+            [sys.executable, __file__, '--cenario', nome] + repassar,
+            capture_output=True, text=True
+        )
+        if processo.returncode != 0:
+            sys.exit(f'Cenário {nome} falhou:\n{processo.stderr}')
+        saida = processo.stdout.strip().splitlines()[-1]
+        cenarios[nome] = json.loads(saida)
+        print(f'{nome}: {saida}', file=sys.stderr)
+
+    resultado = {
+        'commit': commit_atual(),
+        'banco': banco,
+        'python': platform.python_version(),
+        'dados': {
+            'produtos': args.produtos,
+            'lotes': total_lotes,
+            'distribuicao': args.distribuicao,
+            'geracao_s': round(geracao, 1),
+        },
+        'com_cache': args.com_cache,
+        'cenarios': cenarios,
+    }
+
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump(resultado, f, indent=2)
+    print(json.dumps(resultado, indent=2))
+
+    if args.comparar:
+        comparar(resultado, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Utilitários compartilhados pelos benchmarks: criação da aplicação
+apontando para um banco descartável e geração de dados sintéticos.
+"""
+import os
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Lotes por instrução de inserção em popular()
+TAMANHO_BLOCO = 50000
+
+# Distribuição assimétrica de lotes por produto (ver sortear_lotes)
+ALFA_PARETO = 1.5
+MEDIA_PARETO = ALFA_PARETO / (ALFA_PARETO - 1)
+MAX_CONCENTRACAO = 50
+
+
+def criar_app(database_url=None):
+    """Importa a aplicação Flask usando o banco informado (SQLite temporário por padrão)"""
+    if database_url is None:
+        caminho = os.path.join(tempfile.mkdtemp(prefix='bench_estoque_'), 'estoque.db')
+        database_url = f'sqlite:///{caminho}'
+    os.environ['DATABASE_URL'] = database_url
+
+    from src.main import app
+    return app
+
+
+def limpar_banco():
+    """Remove todas as contagens e produtos"""
+    from src.database import db
+    from src.models.produto import Produto
+    from src.models.contagem import Contagem
+    from src.models.estoque_total import EstoqueTotal
+
+    db.session.query(EstoqueTotal).delete()
+    db.session.query(Contagem).delete()
+    db.session.query(Produto).delete()
+    db.session.commit()
+
+
+def sortear_lotes(rnd, media, distribuicao):
+    """Quantidade de lotes de um produto com a média informada"""
+    if distribuicao == 'assimetrica':
+        # Pareto com alfa 1,5: poucos produtos concentram a maior parte dos lotes
+        return min(int(media * rnd.paretovariate(ALFA_PARETO) / MEDIA_PARETO), media * MAX_CONCENTRACAO)
+    return rnd.randint(0, 2 * media)
+
+
+def popular(n_produtos, lotes_por_produto, seed=42, distribuicao='uniforme'):
+    """
+    Gera n_produtos com códigos sequenciais e, em média, lotes_por_produto
+    lotes cada (distribuição 'uniforme' ou 'assimetrica'). Retorna o número
+    de lotes inseridos.
+    """
+    from src.database import db
+    from src.models.produto import Produto
+    from src.models.contagem import Contagem
+
+    rnd = random.Random(seed)
+    limpar_banco()
+
+    db.session.execute(Produto.__table__.insert(), [
+        {'codigo': f'{i:04d}', 'nome': f'PRODUTO {i:04d}'}
+        for i in range(1, n_produtos + 1)
+    ])
+    ids = [row[0] for row in db.session.query(Produto.id).order_by(Produto.codigo)]
+
+    # Inserção em blocos para gerar milhões de lotes sem montar a lista inteira
+    total = 0
+    contagens = []
+    for produto_id in ids:
+        for n in range(sortear_lotes(rnd, lotes_por_produto, distribuicao)):
+            contagens.append({
+                'produto_id': produto_id,
+                'lote': f'L{n:05d}',
+                'validade_mes': rnd.randint(1, 12),
+                'validade_ano': rnd.randint(2025, 2030),
+                'quantidade': rnd.randint(0, 500),
+            })
+        if len(contagens) >= TAMANHO_BLOCO:
+            db.session.execute(Contagem.__table__.insert(), contagens)
+            total += len(contagens)
+            contagens = []
+    if contagens:
+        db.session.execute(Contagem.__table__.insert(), contagens)
+        total += len(contagens)
+    db.session.commit()
+    return total
+
+
+@contextmanager
+def contar_consultas(engine):
+    """Conta as instruções SQL enviadas ao banco dentro do bloco"""
+    from sqlalchemy import event
+
+    contador = {'consultas': 0}
+
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        contador['consultas'] += 1
+
+    event.listen(engine, 'before_cursor_execute', _antes)
+    try:
+        yield contador
+    finally:
+        event.remove(engine, 'before_cursor_execute', _antes)
@@ -0,0 +1,170 @@
+"""
+Auditoria dos planos de consulta: gera um estoque grande (1 milhão de lotes
+por padrão), captura as instruções SQL enviadas por cada endpoint de leitura
+e executa EXPLAIN ANALYZE (PostgreSQL) ou EXPLAIN QUERY PLAN (SQLite) em
+cada uma. Varreduras completas da tabela contagens são apontadas como
+regressão (saída com erro).
+
+Os resumos e relatórios (JSON, PDF e Excel) usam consulta_estoque(),
+explicada diretamente (com as colunas de cada um) para não montar o
+relatório de um milhão de lotes.
+
+Uso: python bench/explicar_consultas.py [--lotes 1000000] [--database-url URL] [--manter-dados]
+"""
+import argparse
+import json
+import sys
+import time
+
+from dados import criar_app, popular
+
+# Códigos vão de 0001 a 9999 (popular numera a partir de 1)
+MAX_PRODUTOS = 9999
+
+ENDPOINTS = [
+    '/api/produtos',
+    '/api/produtos?limite=500',
+    '/api/produtos?limite=500&cursor={cursor_produto}',
+    '/api/contagens?limite=500',
+    '/api/contagens?limite=500&cursor={cursor_contagem}',
+    '/api/contagens?limite=500&fields=lote,quantidade,produto.codigo',
+    '/api/contagens/produto/{codigo}',
+    '/api/contagens/totais',
+    '/api/contagens/vencimento?ate=02/2025',
+]
+
+# Trechos do plano que indicam leitura da tabela inteira de contagens
+VARREDURAS_COMPLETAS = {
+    'postgresql': ['Seq Scan on contagens'],
+    'sqlite': ['SCAN contagens'],
+}
+
+
+def capturar(engine, funcao):
+    """Executa funcao() e retorna as instruções SELECT enviadas ao banco"""
+    from sqlalchemy import event
+
+    instrucoes = []
+
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            instrucoes.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', _antes)
+    try:
+        funcao()
+    finally:
+        event.remove(engine, 'before_cursor_execute', _antes)
+    return instrucoes
+
+
+def explicar(engine, statement, parameters):
+    """Retorna (linhas do plano, tempo de execução em ms)"""
+    dialeto = engine.dialect.name
+    with engine.connect() as conn:
+        if dialeto == 'postgresql':
+            linhas = conn.exec_driver_sql('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters).all()
+            plano = [linha[0] for linha in linhas]
+            tempo = next((float(p.split(':')[1].split()[0]) for p in plano
+                          if p.startswith('Execution Time')), None)
+            return plano, tempo
+
+        linhas = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        plano = [linha[-1] for linha in linhas]
+        inicio = time.perf_counter()
+        conn.exec_driver_sql(statement, parameters).all()
+        return plano, round((time.perf_counter() - inicio) * 1000, 2)
+
+
+def varredura_completa(dialeto, plano):
+    padroes = VARREDURAS_COMPLETAS.get(dialeto, [])
+    for linha in plano:
+        for padrao in padroes:
+            # No SQLite "SCAN contagens USING INDEX" percorre um índice, não a tabela
+            if padrao in linha and 'USING' not in linha:
+                return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lotes', type=int, default=1000000, help='total aproximado de lotes')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--manter-dados', action='store_true',
+                        help='não recriar os dados (banco já populado em execução anterior)')
+    parser.add_argument('--mostrar-planos', action='store_true')
+    args = parser.parse_args()
+
+    app = criar_app(args.database_url)
+    from src.database import db
+    from src.models.contagem import Contagem
+    from src.services.resumo import consulta_estoque, projecao_relatorio, projecao_resumo
+
+    engine = None
+    with app.app_context():
+        engine = db.engine
+        if not args.manter_dados or db.session.query(Contagem.id).first() is None:
+            inicio = time.perf_counter()
+            lotes = popular(MAX_PRODUTOS, max(1, args.lotes // MAX_PRODUTOS))
+            print(f'{lotes} lotes gerados em {time.perf_counter() - inicio:.1f}s', file=sys.stderr)
+        if engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+        total_lotes = db.session.query(Contagem.id).count()
+
+    client = app.test_client()
+    meio_produtos = client.get('/api/produtos?limite=5000').get_json()['proximo_cursor']
+    meio_contagens = client.get('/api/contagens?limite=5000&fields=id').get_json()['proximo_cursor']
+    parametros = {'cursor_produto': meio_produtos, 'cursor_contagem': meio_contagens, 'codigo': '5000'}
+
+    consultas = []
+    for endpoint in ENDPOINTS:
+        url = endpoint.format(**parametros)
+        # Cada URL é pedida uma única vez: a resposta não vem do cache do worker.
+        # O corpo é lido dentro da captura (respostas em partes consultam o banco ao serem lidas)
+        for statement, parameters in capturar(engine, lambda: client.get(url).get_data()):
+            consultas.append((endpoint, statement, parameters))
+
+    with app.app_context():
+        for nome, projecao in (('resumo', projecao_resumo), ('relatorios', projecao_relatorio)):
+            for incluir_zerados in (True, False):
+                def primeira_linha():
+                    # Lê só a primeira linha do cursor: o plano é o da consulta completa
+                    resultado = db.session.execute(
+                        consulta_estoque(projecao(), incluir_zerados),
+                        execution_options={'yield_per': 100}
+                    )
+                    resultado.fetchone()
+                    resultado.close()
+
+                origem = f'{nome} (incluir_zerados={str(incluir_zerados).lower()})'
+                for statement, parameters in capturar(engine, primeira_linha):
+                    consultas.append((origem, statement, parameters))
+
+    resultados = []
+    regressoes = 0
+    for origem, statement, parameters in consultas:
+        plano, tempo_ms = explicar(engine, statement, parameters)
+        completa = varredura_completa(engine.dialect.name, plano)
+        regressoes += completa
+        resultados.append({
+            'origem': origem,
+            'tempo_ms': tempo_ms,
+            'varredura_completa_contagens': completa,
+            'plano': plano if args.mostrar_planos or completa else plano[:3],
+        })
+
+    print(json.dumps({
+        'banco': engine.dialect.name,
+        'lotes': total_lotes,
+        'consultas': resultados,
+        'regressoes': regressoes,
+    }, indent=2, ensure_ascii=False))
+
+    if regressoes:
+        print(f'FALHOU: {regressoes} consultas leem a tabela contagens inteira', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
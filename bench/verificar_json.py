@@ -0,0 +1,51 @@
+"""
+Verifica que resposta_json (src/services/serializacao.py) produz os mesmos
+bytes que o jsonify do Flask para textos com acentos, caracteres de
+controle, DEL, aspas, barras e caracteres fora do plano básico.
+Sai com erro se alguma saída divergir.
+
+Uso: python bench/verificar_json.py
+"""
+import sys
+
+from dados import criar_app
+
+TEXTOS = [
+    'NORMAL',
+    'AÇÚCAR "REFINADO"',
+    'CAFÉ \\ BARRA/1',
+    'TAB\tNL\nCR\rNUL\x00',
+    'DEL\x7fX',
+    '\x7f',
+    'ÿ\x80\x9f',
+    'EMOJI 😀',
+    '  ',
+    '',
+]
+
+
+def main():
+    app = criar_app()
+
+    from flask import jsonify
+    from src.services.serializacao import resposta_json, codificador_rapido_ativo
+
+    divergentes = 0
+    with app.app_context():
+        print(f'orjson ativo: {codificador_rapido_ativo()}')
+        casos = [{'nome': texto, 'quantidade': 1, 'ativo': True, 'lote': None} for texto in TEXTOS]
+        casos.append({'produtos': casos[:], 'total': 2 ** 40})
+        for dados in casos:
+            esperado = jsonify(dados).get_data()
+            obtido = resposta_json(dados).get_data()
+            if obtido != esperado:
+                divergentes += 1
+                print(f'DIVERGE: {esperado!r} != {obtido!r}')
+
+    print(f'{len(casos)} casos, {divergentes} divergentes')
+    if divergentes:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,17 +5,64 @@ from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
 def init_database(app):
-    """Inicializa o banco de dados com a aplicação Flask"""
+    """
+    Inicializa o banco de dados com a aplicação Flask e registra o repositório
+    do backend em app.config['ESTOQUE_BACKEND'] (ver services/repositorio.py):
+    'sqlalchemy' (padrão, banco em SQLALCHEMY_DATABASE_URI) ou 'sqlite'
+    (sqlite3 direto, arquivo em ESTOQUE_SQLITE, sem o SQLAlchemy)
+    """
+    from src.services.repositorio import BACKENDS
+    backend = app.config.setdefault('ESTOQUE_BACKEND', 'sqlalchemy')
+    if backend not in BACKENDS:
+        raise RuntimeError(f'ESTOQUE_BACKEND deve ser um de: {", ".join(BACKENDS)}')
+    
+    if backend == 'sqlite':
+        from src.services.repositorio_sqlite import RepositorioSQLite
+        repositorio = RepositorioSQLite(app.config['ESTOQUE_SQLITE'])
+        repositorio.criar_tabelas()
+        app.extensions['repositorio'] = repositorio
+        return None
+    
     db.init_app(app)
     
     with app.app_context():
         # Importar todos os modelos para garantir que as tabelas sejam criadas
         from src.models.produto import Produto
         from src.models.contagem import Contagem
+        from src.models.estoque_total import EstoqueTotal
+        from src.models.alteracao import Sequencia, ContagemExcluida
+        from src.models.chave_idempotencia import ChaveIdempotencia
+        
+        # Contadores do pool de conexões (GET /api/metrics/pool)
+        from src.services.pool import registrar_eventos_pool
+        registrar_eventos_pool(db.engine)
         
         # Criar todas as tabelas
         db.create_all()
         
+        # Ajustes de esquema em bancos já existentes (índices, colunas novas)
+        from src.services.migracoes import aplicar_migracoes
+        aplicar_migracoes()
+        
+        # Totais por produto mantidos a cada alteração em contagens
+        from src.services.totais import registrar_manutencao, inicializar_totais
+        registrar_manutencao()
+        inicializar_totais()
+        
+        # Versão do estoque incrementada a cada commit que altera produtos/contagens
+        from src.services.versao import registrar_rastreamento, inicializar_versao
+        registrar_rastreamento()
+        inicializar_versao()
+        
+        # Feed de alterações: sequência de commit em contagens e registro das exclusões
+        from src.services.alteracoes import registrar_alteracoes, inicializar_alteracoes
+        registrar_alteracoes()
+        inicializar_alteracoes()
+        
+        # Operações de estoque comuns às rotas (ver services/repositorio.py)
+        from src.services.repositorio_sqlalchemy import RepositorioSQLAlchemy
+        app.extensions['repositorio'] = RepositorioSQLAlchemy()
+        
         print("Banco de dados inicializado com sucesso!")
         
     return db
@@ -4,9 +4,13 @@ import sys
 # DON\'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, request
 from flask_cors import CORS
 from src.database import db, init_database
+from src.services.pool import normalizar_url, opcoes_engine
+from src.services.instrumentacao import registrar_instrumentacao
+from src.services.compressao import registrar_compressao
+from src.services.estaticos import CatalogoEstaticos
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'estoque_app_secret_key_2025'
@@ -15,36 +19,63 @@ app.config['SECRET_KEY'] = 'estoque_app_secret_key_2025'
 CORS(app)
 
 # Configuração do banco de dados para PostgreSQL
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_DATABASE_URI'] = normalizar_url(os.environ.get('DATABASE_URL'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Pool de conexões (tamanho, pre-ping, reciclagem, timeout, modo PgBouncer) via variáveis de ambiente
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Backend do repositório (ver services/repositorio.py): as rotas de src/routes
+# também usam os modelos do SQLAlchemy diretamente
+app.config['ESTOQUE_BACKEND'] = 'sqlalchemy'
+
 # Inicializar banco de dados
 init_database(app)
 
+# Duração, instruções SQL e tamanho de cada requisição (GET /api/metrics e Server-Timing)
+with app.app_context():
+    registrar_instrumentacao(app, db.engine)
+
+# Respostas da API comprimidas com brotli/gzip (registrada depois: roda antes da
+# instrumentação, que passa a contar os bytes comprimidos)
+registrar_compressao(app)
+
 # Registrar blueprints
 from src.routes.produto import produto_bp
 from src.routes.contagem import contagem_bp
 from src.routes.relatorio import relatorio_bp
+from src.routes.metricas import metricas_bp
 
 app.register_blueprint(produto_bp, url_prefix='/api')
 app.register_blueprint(contagem_bp, url_prefix='/api')
 app.register_blueprint(relatorio_bp, url_prefix='/api')
+app.register_blueprint(metricas_bp, url_prefix='/api')
+
+# Comandos de manutenção (flask --app src.main totais verificar|reconstruir)
+from src.services.totais import totais_cli
+app.cli.add_command(totais_cli)
+from src.services.alteracoes import alteracoes_cli
+app.cli.add_command(alteracoes_cli)
+from src.services.idempotencia import idempotencia_cli
+app.cli.add_command(idempotencia_cli)
+
+# Arquivos do frontend em memória, com nomes com hash e variantes gzip/brotli
+estaticos = CatalogoEstaticos(app.static_folder) if app.static_folder else None
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
+    if estaticos is None:
             return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    if app.debug:
+        estaticos.recarregar_se_alterado()
+
+    # Caminhos que não são arquivos (rotas do frontend) recebem o index.html
+    estatico = estaticos.buscar(path) or estaticos.buscar('index.html')
+    if estatico is None:
+        return "index.html not found", 404
+    return estaticos.responder(estatico, request)
 
 
 if __name__ == '__main__':
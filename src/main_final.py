@@ -1,49 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
 import os
-import sqlite3
+import sys
+
+# Permite executar como script (python src/main_final.py) e importar o pacote src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from flask_cors import CORS
 from datetime import datetime
-import json
+from src.services.exportacao import FORMATOS
+from src.services.listagem import ParametroInvalido
+from src.database import init_database
+from src.services.pool import normalizar_url, opcoes_engine
+from src.services.repositorio import obter_repositorio, ProdutoExistente
 
 app = Flask(__name__)
 CORS(app)
 
-# Configuração do banco de dados
-DATABASE = '/tmp/estoque.db'
+# Configuração do banco de dados: sqlite (padrão, arquivo em ESTOQUE_SQLITE)
+# ou sqlalchemy (PostgreSQL em DATABASE_URL, mesmo esquema de src/main.py);
+# init_database registra o repositório do backend escolhido
+app.config['ESTOQUE_BACKEND'] = os.environ.get('ESTOQUE_BACKEND', 'sqlite')
+app.config['ESTOQUE_SQLITE'] = os.environ.get('ESTOQUE_SQLITE', '/tmp/estoque.db')
 
-def init_db():
-    """Inicializa o banco de dados"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Tabela de produtos
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS produtos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            codigo TEXT UNIQUE NOT NULL,
-            nome TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Tabela de contagens
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contagens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            produto_id INTEGER NOT NULL,
-            lote TEXT NOT NULL,
-            validade_mes INTEGER NOT NULL,
-            validade_ano INTEGER NOT NULL,
-            quantidade INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (produto_id) REFERENCES produtos (id),
-            UNIQUE(produto_id, lote)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print("Banco de dados inicializado!")
+if app.config['ESTOQUE_BACKEND'] == 'sqlalchemy':
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalizar_url(os.environ.get('DATABASE_URL'))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+
+init_database(app)
 
 def format_codigo(codigo):
     """Formata código para 4 dígitos"""
@@ -58,22 +42,9 @@ def format_codigo(codigo):
 # Rotas da API
 @app.route('/api/produtos', methods=['GET'])
 def listar_produtos():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM produtos ORDER BY codigo')
-    produtos = cursor.fetchall()
-    conn.close()
-    
     return jsonify({
         'success': True,
-        'produtos': [
-            {
-                'id': p[0],
-                'codigo': p[1],
-                'nome': p[2],
-                'created_at': p[3]
-            } for p in produtos
-        ]
+        'produtos': obter_repositorio().listar_produtos()
     })
 
 @app.route('/api/produtos', methods=['POST'])
@@ -87,24 +58,19 @@ def criar_produto():
         if not nome:
             raise ValueError("Nome é obrigatório")
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO produtos (codigo, nome) VALUES (?, ?)', (codigo, nome))
-        conn.commit()
-        produto_id = cursor.lastrowid
-        conn.close()
+        produto = obter_repositorio().criar_produto(codigo, nome)
         
         return jsonify({
             'success': True,
             'message': 'Produto criado com sucesso',
             'produto': {
-                'id': produto_id,
-                'codigo': codigo,
-                'nome': nome
+                'id': produto.id,
+                'codigo': produto.codigo,
+                'nome': produto.nome
             }
         }), 201
         
-    except sqlite3.IntegrityError:
+    except ProdutoExistente:
         return jsonify({
             'success': False,
             'message': 'Código já existe'
@@ -120,11 +86,7 @@ def buscar_produto(codigo):
     try:
         codigo_formatado = format_codigo(codigo)
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM produtos WHERE codigo = ?', (codigo_formatado,))
-        produto = cursor.fetchone()
-        conn.close()
+        produto = obter_repositorio().buscar_produto(codigo_formatado)
         
         if not produto:
             return jsonify({
@@ -134,12 +96,7 @@ def buscar_produto(codigo):
         
         return jsonify({
             'success': True,
-            'produto': {
-                'id': produto[0],
-                'codigo': produto[1],
-                'nome': produto[2],
-                'created_at': produto[3]
-            }
+            'produto': produto.to_dict()
         })
         
     except Exception as e:
@@ -154,7 +111,7 @@ def registrar_contagem():
     
     try:
         codigo = format_codigo(data['codigo_produto'])
-        lote = data['lote'].strip()
+        lote = data['lote'].strip().upper()
         validade_mes = int(data['validade_mes'])
         validade_ano = int(data['validade_ano'])
         quantidade = int(data['quantidade'])
@@ -169,42 +126,24 @@ def registrar_contagem():
         if quantidade < 0:
             raise ValueError("Quantidade não pode ser negativa")
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
         # Buscar produto
-        cursor.execute('SELECT id FROM produtos WHERE codigo = ?', (codigo,))
-        produto = cursor.fetchone()
+        repositorio = obter_repositorio()
+        produto = repositorio.buscar_produto(codigo)
         if not produto:
-            conn.close()
             return jsonify({
                 'success': False,
                 'message': 'Produto não encontrado'
             }), 404
         
-        produto_id = produto[0]
-        
-        # Verificar se lote já existe
-        cursor.execute('SELECT quantidade FROM contagens WHERE produto_id = ? AND lote = ?', 
-                      (produto_id, lote))
-        contagem_existente = cursor.fetchone()
-        
-        if contagem_existente:
-            # Somar quantidade
-            nova_quantidade = contagem_existente[0] + quantidade
-            cursor.execute('UPDATE contagens SET quantidade = ? WHERE produto_id = ? AND lote = ?',
-                          (nova_quantidade, produto_id, lote))
-            criou_novo = False
-        else:
-            # Criar nova contagem
-            cursor.execute('''INSERT INTO contagens 
-                             (produto_id, lote, validade_mes, validade_ano, quantidade) 
-                             VALUES (?, ?, ?, ?, ?)''',
-                          (produto_id, lote, validade_mes, validade_ano, quantidade))
-            criou_novo = True
-        
-        conn.commit()
-        conn.close()
+        # Cria o lote ou soma a quantidade em uma única instrução (upsert)
+        aplicadas = repositorio.somar_contagens([{
+            'produto_id': produto.id,
+            'lote': lote,
+            'validade_mes': validade_mes,
+            'validade_ano': validade_ano,
+            'quantidade': quantidade
+        }])
+        _, criou_novo = aplicadas[(produto.id, lote)]
         
         return jsonify({
             'success': True,
@@ -223,30 +162,22 @@ def listar_contagens_produto(codigo):
     try:
         codigo_formatado = format_codigo(codigo)
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT c.*, p.codigo, p.nome 
-            FROM contagens c 
-            JOIN produtos p ON c.produto_id = p.id 
-            WHERE p.codigo = ? 
-            ORDER BY c.lote
-        ''', (codigo_formatado,))
-        contagens = cursor.fetchall()
-        conn.close()
+        repositorio = obter_repositorio()
+        produto = repositorio.buscar_produto(codigo_formatado)
+        contagens, _ = repositorio.contagens_do_produto(produto) if produto else ([], 0)
         
         return jsonify({
             'success': True,
             'contagens': [
                 {
-                    'id': c[0],
-                    'lote': c[2],
-                    'validade_mes': c[3],
-                    'validade_ano': c[4],
-                    'quantidade': c[5],
-                    'validade_formatada': f"{c[3]:02d}/{c[4]}",
-                    'produto_codigo': c[7],
-                    'produto_nome': c[8]
+                    'id': c['id'],
+                    'lote': c['lote'],
+                    'validade_mes': c['validade_mes'],
+                    'validade_ano': c['validade_ano'],
+                    'quantidade': c['quantidade'],
+                    'validade_formatada': c['validade_formatada'],
+                    'produto_codigo': produto.codigo,
+                    'produto_nome': produto.nome
                 } for c in contagens
             ]
         })
@@ -257,53 +188,30 @@ def listar_contagens_produto(codigo):
             'message': str(e)
         }), 400
 
-@app.route('/api/relatorio/resumo', methods=['GET'])
-def resumo_estoque():
+@app.route('/api/contagens/export', methods=['GET'])
+def exportar_contagens():
+    """Todas as contagens em NDJSON ou CSV (format), enviadas em partes"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        # Buscar todos os produtos com suas contagens
-        cursor.execute('''
-            SELECT p.id, p.codigo, p.nome,
-                   c.id as contagem_id, c.lote, c.validade_mes, c.validade_ano, c.quantidade
-            FROM produtos p
-            LEFT JOIN contagens c ON p.id = c.produto_id
-            ORDER BY p.codigo, c.lote
-        ''')
+        formato, partes = obter_repositorio().exportar(request.args)
         
-        dados = cursor.fetchall()
-        conn.close()
-        
-        # Organizar dados
-        produtos_dict = {}
-        total_geral = 0
-        
-        for row in dados:
-            produto_id, codigo, nome = row[0], row[1], row[2]
-            contagem_id, lote, val_mes, val_ano, quantidade = row[3], row[4], row[5], row[6], row[7]
-            
-            if produto_id not in produtos_dict:
-                produtos_dict[produto_id] = {
-                    'produto': {'id': produto_id, 'codigo': codigo, 'nome': nome},
-                    'contagens': [],
-                    'total_quantidade': 0
-                }
-            
-            if contagem_id:  # Se tem contagem
-                contagem = {
-                    'id': contagem_id,
-                    'lote': lote,
-                    'validade_mes': val_mes,
-                    'validade_ano': val_ano,
-                    'quantidade': quantidade,
-                    'validade_formatada': f"{val_mes:02d}/{val_ano}"
-                }
-                produtos_dict[produto_id]['contagens'].append(contagem)
-                produtos_dict[produto_id]['total_quantidade'] += quantidade
-                total_geral += quantidade
+        filename = f"contagens_{datetime.now().strftime('%Y-%m-%d')}.{formato}"
+        return Response(
+            stream_with_context(partes),
+            mimetype=FORMATOS[formato],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
         
-        resumo = list(produtos_dict.values())
+    except ParametroInvalido as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+@app.route('/api/relatorio/resumo', methods=['GET'])
+def resumo_estoque():
+    try:
+        # Produtos com suas contagens em uma única consulta
+        resumo, total_geral = obter_repositorio().resumo()
         
         return jsonify({
             'success': True,
@@ -331,8 +239,6 @@ def serve_static(path):
         return send_from_directory('static', 'index.html')
 
 if __name__ == '__main__':
-    init_db()
     print("🚀 Sistema de Estoque iniciado!")
     print("📍 Acesse: http://localhost:5005")
     app.run(host='0.0.0.0', port=5005, debug=False)
-
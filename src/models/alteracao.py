@@ -0,0 +1,44 @@
+from src.database import db
+from datetime import datetime
+
+# Nome da sequência das alterações de contagens e do limite das exclusões já podadas
+SEQUENCIA_ALTERACOES = 'alteracoes'
+SEQUENCIA_PODADAS = 'alteracoes_podadas'
+# Versão do estoque (ETag das listagens e chave dos caches de respostas e relatórios):
+# linha de sequencias no SQLite, SEQUENCE de mesmo nome no PostgreSQL
+SEQUENCIA_ESTOQUE = 'versao_estoque'
+# Versão do catálogo (chave do cache de produtos de cada worker), do mesmo jeito
+SEQUENCIA_PRODUTOS = 'versao_produtos'
+
+class Sequencia(db.Model):
+    """
+    Contadores monotônicos. No SQLite, 'alteracoes' é incrementado no fim
+    de cada transação que altera contagens (ver services/alteracoes.py),
+    'versao_estoque' a cada transação que altera produtos ou contagens e
+    'versao_produtos' a cada uma que altera produtos (services/versao.py);
+    com um único escritor por vez, a ordem dos valores é a ordem dos
+    commits. No PostgreSQL essas linhas não são usadas (id da transação e
+    SEQUENCEs, sem travar uma linha por escrita).
+    'alteracoes_podadas' guarda o limite das exclusões já removidas.
+    """
+    __tablename__ = 'sequencias'
+
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ContagemExcluida(db.Model):
+    """Registro de uma contagem excluída, enviado no feed de alterações"""
+    __tablename__ = 'contagens_excluidas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Sem chave estrangeira: a contagem (e talvez o produto) não existe mais
+    contagem_id = db.Column(db.Integer, nullable=False)
+    produto_id = db.Column(db.Integer, nullable=False)
+    lote = db.Column(db.String(50), nullable=False)
+    # Nula até o commit da exclusão
+    sequencia = db.Column(db.BigInteger)
+    excluida_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_contagens_excluidas_sequencia', 'sequencia', 'id'),
+    )
@@ -0,0 +1,55 @@
+from src.database import db
+from datetime import datetime
+
+# Tamanho máximo da chave enviada pelo cliente (UUID: 36 caracteres)
+TAMANHO_CHAVE = 64
+
+# Instrução de inserção por dialeto (ChaveIdempotencia.instrucao_insert)
+instrucoes_insert = {}
+
+class ChaveIdempotencia(db.Model):
+    """
+    Chave de idempotência de uma contagem enviada pelo cliente (fila
+    offline do frontend). Registrada na mesma transação em que a contagem
+    é somada: um reenvio com a mesma chave não soma a quantidade de novo.
+    """
+    __tablename__ = 'chaves_idempotencia'
+
+    chave = db.Column(db.String(TAMANHO_CHAVE), primary_key=True)
+    registrada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    @staticmethod
+    def instrucao_insert(dialeto):
+        """INSERT ... ON CONFLICT DO NOTHING RETURNING do dialeto, montado uma única vez"""
+        stmt = instrucoes_insert.get(dialeto)
+        if stmt is None:
+            if dialeto == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            elif dialeto == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                raise NotImplementedError(f'Upsert não suportado para o banco {dialeto}')
+
+            tabela = ChaveIdempotencia.__table__
+            stmt = insert(tabela).on_conflict_do_nothing(index_elements=['chave']).returning(tabela.c.chave)
+            instrucoes_insert[dialeto] = stmt
+        return stmt
+
+    @staticmethod
+    def registrar(chaves):
+        """
+        Insere as chaves na transação em andamento (INSERT ... ON CONFLICT
+        DO NOTHING, em executemany) e retorna o conjunto das que já existiam.
+        No PostgreSQL, uma chave inserida por outra transação ainda aberta
+        espera o commit dela e então conta como existente.
+        """
+        if not chaves:
+            return set()
+
+        stmt = ChaveIdempotencia.instrucao_insert(db.session.get_bind().dialect.name)
+        agora = datetime.utcnow()
+        inseridas = set(db.session.scalars(
+            stmt, [{'chave': chave, 'registrada_em': agora} for chave in chaves],
+            execution_options={'dml_strategy': 'raw'}
+        ))
+        return set(chaves) - inseridas
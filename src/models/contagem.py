@@ -1,6 +1,26 @@
 from src.database import db
+from src.models.estoque_total import EstoqueTotal, ATUALIZA_TOTAIS
+from sqlalchemy import null
+from sqlalchemy.orm import validates
 from datetime import datetime
 
+def calcular_validade_chave(mes, ano):
+    """Chave inteira ordenável da validade (meses desde o ano 0)"""
+    return int(ano) * 12 + int(mes)
+
+def validade_chave_padrao(context):
+    # Preenche a chave nas inserções diretas na tabela (cargas em massa com executemany)
+    parametros = context.get_current_parameters()
+    return calcular_validade_chave(parametros['validade_mes'], parametros['validade_ano'])
+
+# Colunas retornadas pelo upsert de somar_em_lote (as do to_dict)
+COLUNAS_RETORNO = (
+    'id', 'produto_id', 'lote', 'validade_mes', 'validade_ano', 'quantidade', 'created_at', 'updated_at'
+)
+
+# Instrução de upsert por dialeto (Contagem.instrucao_upsert)
+instrucoes_upsert = {}
+
 class Contagem(db.Model):
     __tablename__ = 'contagens'
     
@@ -9,12 +29,30 @@ class Contagem(db.Model):
     lote = db.Column(db.String(50), nullable=False)
     validade_mes = db.Column(db.Integer, nullable=False)  # 1-12
     validade_ano = db.Column(db.Integer, nullable=False)  # YYYY
+    validade_chave = db.Column(db.Integer, nullable=False, default=validade_chave_padrao)  # ano * 12 + mês
     quantidade = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Posição da última alteração no feed: nula a cada inclusão/alteração e
+    # preenchida no commit (ver services/alteracoes.py)
+    sequencia = db.Column(db.BigInteger, onupdate=null())
     
-    # Índice único para evitar duplicação de lotes por produto
-    __table_args__ = (db.UniqueConstraint('produto_id', 'lote', name='unique_produto_lote'),)
+    __table_args__ = (
+        # Índice único para evitar duplicação de lotes por produto
+        db.UniqueConstraint('produto_id', 'lote', name='unique_produto_lote'),
+        # Relatórios e listagens percorrem os lotes de cada produto em ordem de lote:
+        # no PostgreSQL o índice também cobre as colunas lidas (index-only scan)
+        db.Index(
+            'ix_contagens_produto_lote_cobertura', 'produto_id', 'lote',
+            postgresql_include=['quantidade', 'validade_mes', 'validade_ano']
+        ).ddl_if(dialect='postgresql'),
+        # Filtros por validade
+        db.Index('ix_contagens_validade', 'validade_ano', 'validade_mes'),
+        # Consulta de vencimentos: faixa de validade_chave em ordem
+        db.Index('ix_contagens_validade_chave', 'validade_chave'),
+        # Feed de alterações (sequencia > cursor) e linhas pendentes (sequencia IS NULL)
+        db.Index('ix_contagens_sequencia', 'sequencia', 'id'),
+    )
     
     def __init__(self, produto_id, lote, validade_mes, validade_ano, quantidade):
         self.produto_id = produto_id
@@ -23,6 +61,15 @@ class Contagem(db.Model):
         self.validade_ano = int(validade_ano)
         self.quantidade = int(quantidade)
     
+    @validates('validade_mes', 'validade_ano')
+    def atualizar_validade_chave(self, campo, valor):
+        """Mantém validade_chave em sincronia sempre que mês ou ano mudam"""
+        mes = valor if campo == 'validade_mes' else self.validade_mes
+        ano = valor if campo == 'validade_ano' else self.validade_ano
+        if mes is not None and ano is not None:
+            self.validade_chave = calcular_validade_chave(mes, ano)
+        return valor
+    
     @staticmethod
     def validar_validade(mes, ano):
         """Valida se mês e ano são válidos"""
@@ -43,40 +90,121 @@ class Contagem(db.Model):
     @staticmethod
     def adicionar_ou_somar(produto_id, lote, validade_mes, validade_ano, quantidade):
         """
-        Adiciona uma nova contagem ou soma à quantidade existente se o lote já existir
+        Adiciona uma nova contagem ou soma à quantidade existente se o lote já existir.
+        A soma é feita pelo banco em uma única instrução atômica (upsert), sem
+        leitura prévia: contagens simultâneas do mesmo lote não se perdem.
+        """
+        lote = lote.strip().upper()
+        resultado = Contagem.somar_em_lote([{
+            'produto_id': produto_id,
+            'lote': lote,
+            'validade_mes': validade_mes,
+            'validade_ano': validade_ano,
+            'quantidade': quantidade
+        }])
+        return resultado[(produto_id, lote)]  # (linha, criou_novo)
+    
+    @staticmethod
+    def instrucao_upsert(dialeto):
+        """
+        INSERT ... ON CONFLICT (produto_id, lote) DO UPDATE ... RETURNING do
+        dialeto, montado uma única vez: os lotes vão como parâmetros
+        (executemany), então a instrução compilada é reaproveitada
+        """
+        stmt = instrucoes_upsert.get(dialeto)
+        if stmt is None:
+            if dialeto == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            elif dialeto == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                raise NotImplementedError(f'Upsert não suportado para o banco {dialeto}')
+            
+            tabela = Contagem.__table__
+            stmt = insert(tabela)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['produto_id', 'lote'],
+                set_={
+                    'quantidade': tabela.c.quantidade + stmt.excluded.quantidade,
+                    'updated_at': stmt.excluded.updated_at,
+                    'sequencia': None
+                }
+            ).returning(*(tabela.c[nome] for nome in COLUNAS_RETORNO))
+            instrucoes_upsert[dialeto] = stmt
+        return stmt
+    
+    @staticmethod
+    def somar_em_lote(itens):
         """
-        # Buscar se já existe uma contagem para este produto e lote
-        contagem_existente = Contagem.query.filter_by(
-            produto_id=produto_id,
-            lote=lote.strip().upper()
-        ).first()
+        Soma as quantidades de vários lotes em uma única instrução
+        (INSERT ... ON CONFLICT (produto_id, lote) DO UPDATE), criando os
+        lotes que ainda não existem. Os itens são dicts com produto_id, lote,
+        validade_mes, validade_ano e quantidade, sem pares (produto_id, lote)
+        repetidos. Retorna {(produto_id, lote): (linha, criou_novo)}, com as
+        colunas de COLUNAS_RETORNO na linha (ver dict_da_linha).
+        """
+        if not itens:
+            return {}
+        
+        stmt = Contagem.instrucao_upsert(db.session.get_bind().dialect.name)
+        
+        # created_at == updated_at == agora identifica as linhas recém-criadas
+        agora = datetime.utcnow()
+        valores = [
+            {
+                'produto_id': item['produto_id'],
+                'lote': item['lote'].strip().upper(),
+                'validade_mes': int(item['validade_mes']),
+                'validade_ano': int(item['validade_ano']),
+                'validade_chave': calcular_validade_chave(item['validade_mes'], item['validade_ano']),
+                'quantidade': int(item['quantidade']),
+                'created_at': agora,
+                'updated_at': agora
+            }
+            for item in itens
+        ]
+        
+        # Core direto (dml_strategy raw), sem o processamento de objetos do ORM;
+        # os totais são somados abaixo, sem recálculo no commit
+        linhas = db.session.execute(
+            stmt, valores, execution_options={'dml_strategy': 'raw', ATUALIZA_TOTAIS: True}
+        )
+        resultado = {
+            (linha.produto_id, linha.lote): (linha, linha.created_at == agora)
+            for linha in linhas
+        }
+        
+        # Totais por produto atualizados na mesma transação
+        deltas = {}
+        for valor in valores:
+            _, criou_novo = resultado[(valor['produto_id'], valor['lote'])]
+            quantidade, lotes = deltas.get(valor['produto_id'], (0, 0))
+            deltas[valor['produto_id']] = (quantidade + valor['quantidade'], lotes + int(criou_novo))
+        EstoqueTotal.somar(db.session.connection(), deltas)
         
-        if contagem_existente:
-            # Se existe, somar a quantidade
-            contagem_existente.quantidade += int(quantidade)
-            contagem_existente.updated_at = datetime.utcnow()
-            return contagem_existente, False  # False = não criou novo
-        else:
-            # Se não existe, criar novo
-            nova_contagem = Contagem(produto_id, lote, validade_mes, validade_ano, quantidade)
-            return nova_contagem, True  # True = criou novo
+        return resultado
+    
+    @staticmethod
+    def dict_da_linha(linha):
+        """Mesmo formato do to_dict() a partir de um objeto com as colunas de COLUNAS_RETORNO"""
+        return {
+            'id': linha.id,
+            'produto_id': linha.produto_id,
+            'lote': linha.lote,
+            'validade_mes': linha.validade_mes,
+            'validade_ano': linha.validade_ano,
+            'validade_formatada': f"{linha.validade_mes:02d}/{linha.validade_ano}",
+            'quantidade': linha.quantidade,
+            'created_at': linha.created_at.isoformat() if linha.created_at else None,
+            'updated_at': linha.updated_at.isoformat() if linha.updated_at else None
+        }
     
     def get_validade_formatada(self):
         """Retorna a validade no formato MM/YYYY"""
         return f"{self.validade_mes:02d}/{self.validade_ano}"
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'produto_id': self.produto_id,
-            'lote': self.lote,
-            'validade_mes': self.validade_mes,
-            'validade_ano': self.validade_ano,
-            'validade_formatada': self.get_validade_formatada(),
-            'quantidade': self.quantidade,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+        return Contagem.dict_da_linha(self)
     
     def __repr__(self):
         return f'<Contagem Produto:{self.produto_id} Lote:{self.lote} Qtd:{self.quantidade}>'
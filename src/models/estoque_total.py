@@ -0,0 +1,72 @@
+from src.database import db
+
+# Opção de execução das instruções em massa sobre contagens que já atualizam
+# os totais (as demais fazem os totais serem recalculados no commit)
+ATUALIZA_TOTAIS = 'atualiza_totais'
+
+# Instrução de upsert por dialeto (EstoqueTotal.instrucao_upsert)
+instrucoes_upsert = {}
+
+class EstoqueTotal(db.Model):
+    """
+    Total em estoque e quantidade de lotes de cada produto, mantidos na
+    mesma transação de cada alteração em contagens (ver services/totais.py).
+    Produtos sem linha nesta tabela não têm contagens.
+    """
+    __tablename__ = 'estoque_totais'
+
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id', ondelete='CASCADE'), primary_key=True)
+    quantidade_total = db.Column(db.Integer, nullable=False, default=0, index=True)
+    total_lotes = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def instrucao_upsert(dialeto):
+        """INSERT ... ON CONFLICT (produto_id) DO UPDATE do dialeto, montado uma única vez"""
+        stmt = instrucoes_upsert.get(dialeto)
+        if stmt is None:
+            if dialeto == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            elif dialeto == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                raise NotImplementedError(f'Upsert não suportado para o banco {dialeto}')
+
+            tabela = EstoqueTotal.__table__
+            stmt = insert(tabela)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['produto_id'],
+                set_={
+                    'quantidade_total': tabela.c.quantidade_total + stmt.excluded.quantidade_total,
+                    'total_lotes': tabela.c.total_lotes + stmt.excluded.total_lotes
+                }
+            )
+            instrucoes_upsert[dialeto] = stmt
+        return stmt
+
+    @staticmethod
+    def somar(conexao, deltas):
+        """
+        Soma {produto_id: (delta_quantidade, delta_lotes)} aos totais com um
+        upsert atômico (INSERT ... ON CONFLICT (produto_id) DO UPDATE) em
+        executemany, na conexão da transação em andamento
+        """
+        valores = [
+            {'produto_id': produto_id, 'quantidade_total': quantidade, 'total_lotes': lotes}
+            for produto_id, (quantidade, lotes) in sorted(deltas.items())
+            if quantidade or lotes
+        ]
+        if not valores:
+            return
+
+        # Ordenado por produto: transações simultâneas travam as linhas na mesma ordem
+        conexao.execute(EstoqueTotal.instrucao_upsert(conexao.dialect.name), valores)
+
+    def to_dict(self):
+        return {
+            'produto_id': self.produto_id,
+            'quantidade_total': self.quantidade_total,
+            'total_lotes': self.total_lotes
+        }
+
+    def __repr__(self):
+        return f'<EstoqueTotal Produto:{self.produto_id} Qtd:{self.quantidade_total} Lotes:{self.total_lotes}>'
@@ -1,30 +1,56 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from src.database import db
 from src.models.produto import Produto
 from src.models.contagem import Contagem
-from sqlalchemy import func
+from src.services.listagem import (
+    listar_contagens_pagina, listar_contagens_normalizadas, ler_limite, ler_normalizado, ParametroInvalido
+)
+from src.services.repositorio import obter_repositorio, ChavesRepetidas
+from src.models.chave_idempotencia import TAMANHO_CHAVE
+from src.services.serializacao import resposta_json
+from src.services.versao import resposta_condicional
+from src.services.resumo import normalizar_resumo
+from src.services.totais import resumo_totais
+from src.services.vencimento import consulta_vencimento, gerar_json_vencimento
+from src.services.exportacao import FORMATOS
+from src.services.alteracoes import listar_alteracoes, CursorExpirado
+from datetime import datetime
 
 contagem_bp = Blueprint('contagem', __name__)
 
 @contagem_bp.route('/contagens', methods=['GET'])
+@resposta_condicional
 def listar_contagens():
-    """Lista todas as contagens ordenadas por código do produto"""
+    """
+    Lista as contagens ordenadas por código do produto e lote.
+    Parâmetros opcionais: fields (ex.: id,lote,quantidade,produto.codigo),
+    limite e cursor (paginação por chave, retorna proximo_cursor) e
+    normalizado=true (produtos listados uma vez, contagens com produto_id).
+    """
     try:
-        contagens = db.session.query(Contagem, Produto).join(
-            Produto, Contagem.produto_id == Produto.id
-        ).order_by(Produto.codigo, Contagem.lote).all()
+        if ler_normalizado(request.args):
+            produtos, contagens, proximo_cursor = listar_contagens_normalizadas(request.args)
+            resposta = {
+                'success': True,
+                'produtos': produtos,
+                'contagens': contagens
+            }
+        else:
+            contagens, proximo_cursor = listar_contagens_pagina(request.args)
+            resposta = {
+                'success': True,
+                'contagens': contagens
+            }
+        if ler_limite(request.args) is not None:
+            resposta['proximo_cursor'] = proximo_cursor
         
-        resultado = []
-        for contagem, produto in contagens:
-            item = contagem.to_dict()
-            item['produto'] = produto.to_dict()
-            resultado.append(item)
+        return resposta_json(resposta)
         
+    except ParametroInvalido as e:
         return jsonify({
-            'success': True,
-            'contagens': resultado
-        })
-        
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -48,7 +74,8 @@ def registrar_contagem():
         
         # Buscar produto por código
         codigo_formatado = str(data['codigo_produto']).zfill(4)
-        produto = Produto.query.filter_by(codigo=codigo_formatado).first()
+        repositorio = obter_repositorio()
+        produto = repositorio.buscar_produto(codigo_formatado)
         
         if not produto:
             return jsonify({
@@ -80,30 +107,29 @@ def registrar_contagem():
                 'message': 'Quantidade deve ser um número inteiro'
             }), 400
         
-        # Adicionar ou somar contagem
-        contagem, criou_novo = Contagem.adicionar_ou_somar(
-            produto.id, 
-            data['lote'], 
-            mes, 
-            ano, 
-            quantidade
-        )
-        
-        db.session.add(contagem)
-        db.session.commit()
+        # Adicionar ou somar contagem (upsert atômico, com commit)
+        lote = data['lote'].strip().upper()
+        aplicadas = repositorio.somar_contagens([{
+            'produto_id': produto.id,
+            'lote': lote,
+            'validade_mes': mes,
+            'validade_ano': ano,
+            'quantidade': quantidade
+        }])
+        contagem, criou_novo = aplicadas[(produto.id, lote)]
         
         if criou_novo:
             acao = 'criada'
-            message = f'✅ Produto "{produto.nome}" (Código: {produto.codigo})\nLote: {contagem.lote}\nQuantidade adicionada: {quantidade}\nTotal no lote: {contagem.quantidade}'
+            message = f'✅ Produto "{produto.nome}" (Código: {produto.codigo})\nLote: {contagem["lote"]}\nQuantidade adicionada: {quantidade}\nTotal no lote: {contagem["quantidade"]}'
         else:
-            quantidade_anterior = contagem.quantidade - quantidade
+            quantidade_anterior = contagem['quantidade'] - quantidade
             acao = 'atualizada (quantidade somada)'
-            message = f'✅ Produto "{produto.nome}" (Código: {produto.codigo})\nLote: {contagem.lote}\nQuantidade adicionada: {quantidade}\nQuantidade anterior: {quantidade_anterior}\nNova quantidade total: {contagem.quantidade}'
+            message = f'✅ Produto "{produto.nome}" (Código: {produto.codigo})\nLote: {contagem["lote"]}\nQuantidade adicionada: {quantidade}\nQuantidade anterior: {quantidade_anterior}\nNova quantidade total: {contagem["quantidade"]}'
         
         return jsonify({
             'success': True,
             'message': message,
-            'contagem': contagem.to_dict(),
+            'contagem': contagem,
             'produto': produto.to_dict(),
             'criou_novo': criou_novo,
             'quantidade_adicionada': quantidade
@@ -116,12 +142,162 @@ def registrar_contagem():
             'message': f'Erro ao registrar contagem: {str(e)}'
         }), 500
 
+@contagem_bp.route('/contagens/lote', methods=['POST'])
+def registrar_contagens_lote():
+    """
+    Registra várias contagens de uma vez (coletores de código de barras).
+    Aceita uma lista de contagens ou {"contagens": [...]}, aplica tudo em
+    uma única transação e retorna o resultado de cada item. Cada item pode
+    trazer chave_idempotencia (fila offline do frontend): itens com chave já
+    registrada não são somados de novo e retornam duplicada=true.
+    """
+    try:
+        data = request.get_json()
+        itens = data.get('contagens') if isinstance(data, dict) else data
+        
+        if not isinstance(itens, list) or not itens:
+            return jsonify({
+                'success': False,
+                'message': 'Envie uma lista de contagens'
+            }), 400
+        
+        campos_obrigatorios = ['codigo_produto', 'lote', 'validade_mes', 'validade_ano', 'quantidade']
+        repositorio = obter_repositorio()
+        resultados = [None] * len(itens)
+        validos = []
+        chaves_lote = set()
+        
+        for indice, item in enumerate(itens):
+            if not isinstance(item, dict):
+                resultados[indice] = {'indice': indice, 'success': False, 'message': 'Item inválido'}
+                continue
+            
+            faltando = next((campo for campo in campos_obrigatorios if campo not in item), None)
+            if faltando:
+                resultados[indice] = {'indice': indice, 'success': False, 'message': f'Campo {faltando} é obrigatório'}
+                continue
+            
+            chave = item.get('chave_idempotencia')
+            if chave is not None and (not isinstance(chave, str) or not 0 < len(chave) <= TAMANHO_CHAVE):
+                resultados[indice] = {'indice': indice, 'success': False, 'message': 'Chave de idempotência inválida'}
+                continue
+            
+            # Produto resolvido pelo cache do catálogo (a versão é lida uma vez por requisição)
+            codigo_formatado = str(item['codigo_produto']).zfill(4)
+            produto = repositorio.buscar_produto(codigo_formatado)
+            if not produto:
+                resultados[indice] = {'indice': indice, 'success': False, 'message': f'Produto com código {codigo_formatado} não encontrado'}
+                continue
+            
+            valido, resultado = Contagem.validar_validade(item['validade_mes'], item['validade_ano'])
+            if not valido:
+                resultados[indice] = {'indice': indice, 'success': False, 'message': resultado}
+                continue
+            
+            mes, ano = resultado
+            
+            try:
+                quantidade = int(item['quantidade'])
+            except (TypeError, ValueError):
+                resultados[indice] = {'indice': indice, 'success': False, 'message': 'Quantidade deve ser um número inteiro'}
+                continue
+            
+            if quantidade < 0:
+                resultados[indice] = {'indice': indice, 'success': False, 'message': 'Quantidade não pode ser negativa'}
+                continue
+            
+            # Mesma chave repetida no próprio envio: só a primeira ocorrência é somada
+            if chave is not None and chave in chaves_lote:
+                resultados[indice] = {'indice': indice, 'success': True, 'duplicada': True,
+                                      'message': 'Contagem já registrada (chave de idempotência repetida)'}
+                continue
+            if chave is not None:
+                chaves_lote.add(chave)
+            
+            validos.append((indice, produto, str(item['lote']).strip().upper(), mes, ano, quantidade, chave))
+        
+        # Chaves já registradas (reenvio de um lote que chegou ao servidor) saem do
+        # upsert; a lista só cresce, então as tentativas terminam
+        repetidas = set()
+        while True:
+            aplicar = [valido for valido in validos if valido[6] not in repetidas]
+            
+            # Juntar pares (produto, lote) repetidos: soma as quantidades, validade da primeira ocorrência
+            agrupados = {}
+            for indice, produto, lote, mes, ano, quantidade, _ in aplicar:
+                chave = (produto.id, lote)
+                if chave in agrupados:
+                    agrupados[chave]['quantidade'] += quantidade
+                else:
+                    agrupados[chave] = {
+                        'produto_id': produto.id,
+                        'lote': lote,
+                        'validade_mes': mes,
+                        'validade_ano': ano,
+                        'quantidade': quantidade
+                    }
+            
+            # Upsert de todos os lotes e registro das chaves em uma única transação
+            try:
+                aplicadas = repositorio.somar_contagens(
+                    list(agrupados.values()),
+                    [chave for *_, chave in aplicar if chave is not None]
+                )
+                break
+            except ChavesRepetidas as e:
+                repetidas |= e.chaves
+        
+        primeira_ocorrencia = set()
+        for indice, produto, lote, mes, ano, quantidade, chave_idempotencia in validos:
+            if chave_idempotencia in repetidas:
+                resultados[indice] = {'indice': indice, 'success': True, 'duplicada': True,
+                                      'message': 'Contagem já registrada (chave de idempotência repetida)'}
+                continue
+            
+            chave = (produto.id, lote)
+            contagem, criou_novo = aplicadas[chave]
+            resultados[indice] = {
+                'indice': indice,
+                'success': True,
+                'contagem': contagem,
+                'produto': produto.to_dict(),
+                'criou_novo': criou_novo and chave not in primeira_ocorrencia,
+                'quantidade_adicionada': quantidade
+            }
+            primeira_ocorrencia.add(chave)
+        
+        total_erros = sum(1 for r in resultados if not r['success'])
+        total_duplicadas = sum(1 for r in resultados if r.get('duplicada'))
+        total_registradas = len(resultados) - total_erros - total_duplicadas
+        
+        message = f'{total_registradas} contagens registradas, {total_erros} com erro'
+        if total_duplicadas:
+            message += f', {total_duplicadas} já registradas'
+        
+        return jsonify({
+            'success': True,
+            'message': message,
+            'total_registradas': total_registradas,
+            'total_erros': total_erros,
+            'total_duplicadas': total_duplicadas,
+            'resultados': resultados
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao registrar contagens: {str(e)}'
+        }), 500
+
 @contagem_bp.route('/contagens/produto/<codigo>', methods=['GET'])
+@resposta_condicional
 def listar_contagens_produto(codigo):
     """Lista todas as contagens de um produto específico"""
     try:
         codigo_formatado = str(codigo).zfill(4)
-        produto = Produto.query.filter_by(codigo=codigo_formatado).first()
+        repositorio = obter_repositorio()
+        produto = repositorio.buscar_produto(codigo_formatado)
         
         if not produto:
             return jsonify({
@@ -129,13 +305,13 @@ def listar_contagens_produto(codigo):
                 'message': f'Produto com código {codigo_formatado} não encontrado'
             }), 404
         
-        contagens = Contagem.query.filter_by(produto_id=produto.id).order_by(Contagem.lote).all()
+        contagens, total_quantidade = repositorio.contagens_do_produto(produto)
         
-        return jsonify({
+        return resposta_json({
             'success': True,
             'produto': produto.to_dict(),
-            'contagens': [contagem.to_dict() for contagem in contagens],
-            'total_quantidade': sum(c.quantidade for c in contagens)
+            'contagens': contagens,
+            'total_quantidade': total_quantidade
         })
         
     except Exception as e:
@@ -222,38 +398,28 @@ def contagem_detail(contagem_id):
 
 
 @contagem_bp.route('/contagens/resumo', methods=['GET'])
+@resposta_condicional
 def resumo_estoque():
-    """Retorna um resumo do estoque com totais por produto"""
+    """Retorna um resumo do estoque com totais por produto (normalizado=true: produtos e contagens em listas separadas)"""
     try:
-        # Buscar todos os produtos ordenados por código
-        produtos = Produto.query.order_by(Produto.codigo).all()
+        # Produtos, lotes e totais em uma única consulta
+        resumo, total_geral = obter_repositorio().resumo()
         
-        resumo = []
-        total_geral = 0
+        if ler_normalizado(request.args):
+            produtos, contagens = normalizar_resumo(resumo)
+            return resposta_json({
+                'success': True,
+                'produtos': produtos,
+                'contagens': contagens,
+                'total_geral': total_geral,
+                'total_produtos': len(produtos)
+            })
         
-        for produto in produtos:
-            # Somar todas as quantidades deste produto
-            total_produto = db.session.query(func.sum(Contagem.quantidade)).filter_by(
-                produto_id=produto.id
-            ).scalar() or 0
-            
-            # Buscar todas as contagens deste produto
-            contagens = Contagem.query.filter_by(produto_id=produto.id).order_by(Contagem.lote).all()
-            
-            item_resumo = {
-                'produto': produto.to_dict(),
-                'contagens': [contagem.to_dict() for contagem in contagens],
-                'total_quantidade': total_produto
-            }
-            
-            resumo.append(item_resumo)
-            total_geral += total_produto
-        
-        return jsonify({
+        return resposta_json({
             'success': True,
             'resumo': resumo,
             'total_geral': total_geral,
-            'total_produtos': len(produtos)
+            'total_produtos': len(resumo)
         })
         
     except Exception as e:
@@ -262,6 +428,100 @@ def resumo_estoque():
             'message': f'Erro ao gerar resumo: {str(e)}'
         }), 500
 
+@contagem_bp.route('/contagens/totais', methods=['GET'])
+@resposta_condicional
+def totais_estoque():
+    """Totais do painel (unidades, lotes e produtos com estoque) sem percorrer as contagens"""
+    try:
+        totais = resumo_totais()
+        
+        return resposta_json({
+            'success': True,
+            **totais
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao obter totais: {str(e)}'
+        }), 500
+
+@contagem_bp.route('/contagens/vencimento', methods=['GET'])
+@resposta_condicional
+def listar_vencimentos():
+    """Lista os lotes que vencem até ate=MM/YYYY, em ordem de validade, com totais por produto"""
+    try:
+        query, projecao, posicoes = consulta_vencimento(request.args)
+        
+        # Resposta enviada em partes enquanto o cursor é lido
+        return Response(
+            stream_with_context(gerar_json_vencimento(query, projecao, posicoes)),
+            mimetype='application/json'
+        )
+        
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao listar vencimentos: {str(e)}'
+        }), 500
+
+@contagem_bp.route('/contagens/export', methods=['GET'])
+@resposta_condicional
+def exportar_contagens():
+    """
+    Exporta todas as contagens em ordem de código e lote, enviadas em partes
+    enquanto o cursor é lido (memória constante). Parâmetros opcionais:
+    format=ndjson (padrão) ou csv e fields (mesmos campos da listagem).
+    """
+    try:
+        formato, partes = obter_repositorio().exportar(request.args)
+        
+        filename = f"contagens_{datetime.now().strftime('%Y-%m-%d')}.{formato}"
+        return Response(
+            stream_with_context(partes),
+            mimetype=FORMATOS[formato],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao exportar contagens: {str(e)}'
+        }), 500
+
+@contagem_bp.route('/contagens/changes', methods=['GET'])
+@resposta_condicional
+def alteracoes_contagens():
+    """
+    Feed de alterações para sincronização incremental: contagens incluídas,
+    alteradas ou excluídas depois do cursor since, em ordem de commit.
+    Parâmetros opcionais: since (proximo_cursor da resposta anterior; sem
+    ele, todas as contagens atuais), limite e fields.
+    """
+    try:
+        alteracoes, proximo_cursor, fim = listar_alteracoes(request.args)
+        
+        return resposta_json({
+            'success': True,
+            'alteracoes': alteracoes,
+            'proximo_cursor': proximo_cursor,
+            'fim': fim
+        })
+        
+    except CursorExpirado as e:
+        return jsonify({'success': False, 'message': str(e)}), 410
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao listar alterações: {str(e)}'
+        }), 500
+
 @contagem_bp.route('/contagens/zerar', methods=['POST'])
 def zerar_estoque():
     """Zera todas as contagens do estoque (usar com cuidado!)"""
@@ -277,7 +537,7 @@ def zerar_estoque():
         # Contar quantas contagens serão excluídas
         total_contagens = Contagem.query.count()
         
-        # Excluir todas as contagens
+        # Excluir todas as contagens (os totais são recalculados no commit)
         Contagem.query.delete()
         db.session.commit()
         
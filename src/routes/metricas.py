@@ -0,0 +1,36 @@
+from flask import Blueprint, Response, jsonify
+from src.database import db
+from src.services.pool import estatisticas_pool
+from src.services.instrumentacao import gerar_prometheus
+
+metricas_bp = Blueprint('metricas', __name__)
+
+@metricas_bp.route('/metrics', methods=['GET'])
+def metricas_prometheus():
+    """Métricas por endpoint e do pool de conexões deste worker (formato Prometheus)"""
+    try:
+        return Response(
+            gerar_prometheus(estatisticas_pool(db.engine)),
+            mimetype='text/plain; version=0.0.4'
+        )
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao gerar métricas: {str(e)}'
+        }), 500
+
+@metricas_bp.route('/metrics/pool', methods=['GET'])
+def metricas_pool():
+    """Situação do pool de conexões deste worker (em uso, livres, overflow, checkouts)"""
+    try:
+        return jsonify({
+            'success': True,
+            'pool': estatisticas_pool(db.engine)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao obter métricas do pool: {str(e)}'
+        }), 500
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from src.database import db
 from src.models.produto import Produto
 from src.models.contagem import Contagem
+from src.services.importacao import executar_importacao, verificar_planilha
+from src.services.tarefas import enviar_tarefa, obter_tarefa
+from src.services.repositorio import obter_repositorio, ProdutoExistente
+from src.services.listagem import listar_produtos_pagina, ler_limite, ParametroInvalido
+from src.services.versao import resposta_condicional
+from src.services.serializacao import resposta_json
 import pandas as pd
 from werkzeug.utils import secure_filename
 import os
@@ -10,14 +16,29 @@ import tempfile
 produto_bp = Blueprint('produto', __name__)
 
 @produto_bp.route('/produtos', methods=['GET'])
+@resposta_condicional
 def listar_produtos():
-    """Lista todos os produtos ordenados por código"""
+    """
+    Lista os produtos ordenados por código.
+    Parâmetros opcionais: fields (ex.: codigo,nome), limite e cursor
+    (paginação por chave, retorna proximo_cursor).
+    """
     try:
-        produtos = Produto.query.order_by(Produto.codigo).all()
-        return jsonify({
+        produtos, proximo_cursor = listar_produtos_pagina(request.args)
+        
+        resposta = {
             'success': True,
-            'produtos': [produto.to_dict() for produto in produtos]
-        })
+            'produtos': produtos
+        }
+        if ler_limite(request.args) is not None:
+            resposta['proximo_cursor'] = proximo_cursor
+        
+        return resposta_json(resposta)
+    except ParametroInvalido as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -46,18 +67,8 @@ def criar_produto():
         
         codigo_formatado = resultado
         
-        # Verificar se já existe
-        produto_existente = Produto.query.filter_by(codigo=codigo_formatado).first()
-        if produto_existente:
-            return jsonify({
-                'success': False,
-                'message': f'Produto com código {codigo_formatado} já existe'
-            }), 400
-        
-        # Criar produto
-        produto = Produto(codigo_formatado, data['nome'])
-        db.session.add(produto)
-        db.session.commit()
+        # Criar produto (código repetido recusado pelo índice único)
+        produto = obter_repositorio().criar_produto(codigo_formatado, data['nome'])
         
         return jsonify({
             'success': True,
@@ -65,6 +76,11 @@ def criar_produto():
             'produto': produto.to_dict()
         }), 201
         
+    except ProdutoExistente as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -79,7 +95,7 @@ def buscar_produto(codigo):
         # Formatar código com zeros à esquerda
         codigo_formatado = str(codigo).zfill(4)
         
-        produto = Produto.query.filter_by(codigo=codigo_formatado).first()
+        produto = obter_repositorio().buscar_produto(codigo_formatado)
         if not produto:
             return jsonify({
                 'success': False,
@@ -188,7 +204,7 @@ def excluir_produto(produto_id):
 
 @produto_bp.route('/produtos/importar', methods=['POST'])
 def importar_produtos():
-    """Importa produtos de um arquivo XLSX"""
+    """Inicia a importação de produtos de um arquivo XLSX em segundo plano"""
     try:
         if 'arquivo' not in request.files:
             return jsonify({
@@ -209,111 +225,69 @@ def importar_produtos():
                 'message': 'Arquivo deve ser .xlsx ou .xls'
             }), 400
         
-        # Salvar arquivo temporariamente
+        # Salvar arquivo temporariamente; a leitura e a gravação ocorrem em segundo plano
         with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
             arquivo.save(temp_file.name)
-            
-            # Ler arquivo Excel
-            df = pd.read_excel(temp_file.name)
-            
-            # Remover arquivo temporário
-            os.unlink(temp_file.name)
         
-        if df.empty:
+        # Arquivo vazio ou sem as colunas esperadas é recusado já na requisição
+        try:
+            erro = verificar_planilha(temp_file.name)
+        except Exception:
+            os.unlink(temp_file.name)
+            raise
+        if erro:
+            os.unlink(temp_file.name)
             return jsonify({
                 'success': False,
-                'message': 'Arquivo está vazio'
+                'message': erro
             }), 400
         
-        # Detectar colunas automaticamente
-        colunas = df.columns.tolist()
-        col_codigo = None
-        col_nome = None
-        
-        # Procurar por nomes de colunas conhecidos
-        for col in colunas:
-            col_lower = str(col).lower()
-            if 'codigo' in col_lower or 'código' in col_lower:
-                col_codigo = col
-            elif 'nome' in col_lower or 'produto' in col_lower or 'descricao' in col_lower or 'descrição' in col_lower:
-                col_nome = col
-        
-        # Se não encontrou, usar as duas primeiras colunas
-        if col_codigo is None or col_nome is None:
-            if len(colunas) >= 2:
-                col_codigo = colunas[0]
-                col_nome = colunas[1]
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': 'Arquivo deve ter pelo menos 2 colunas (código e nome)'
-                }), 400
-        
-        # Processar dados
-        produtos_criados = 0
-        produtos_atualizados = 0
-        erros = []
-        
-        for index, row in df.iterrows():
-            try:
-                codigo_raw = row[col_codigo]
-                nome_raw = row[col_nome]
-                
-                # Pular linhas vazias
-                if pd.isna(codigo_raw) or pd.isna(nome_raw):
-                    continue
-                
-                # Validar código
-                valido, resultado = Produto.validar_codigo(codigo_raw)
-                if not valido:
-                    erros.append(f'Linha {index + 2}: {resultado}')
-                    continue
-                
-                codigo_formatado = resultado
-                nome = str(nome_raw).strip().upper()
-                
-                if not nome:
-                    erros.append(f'Linha {index + 2}: Nome não pode estar vazio')
-                    continue
-                
-                # Verificar se produto já existe
-                produto_existente = Produto.query.filter_by(codigo=codigo_formatado).first()
-                
-                if produto_existente:
-                    # Atualizar nome se diferente
-                    if produto_existente.nome != nome:
-                        produto_existente.nome = nome
-                        produtos_atualizados += 1
-                else:
-                    # Criar novo produto
-                    produto = Produto(codigo_formatado, nome)
-                    db.session.add(produto)
-                    produtos_criados += 1
-                    
-            except Exception as e:
-                erros.append(f'Linha {index + 2}: {str(e)}')
-        
-        # Salvar alterações
-        db.session.commit()
+        tarefa_id = enviar_tarefa(
+            current_app._get_current_object(),
+            'importacao_produtos',
+            executar_importacao,
+            temp_file.name
+        )
         
         return jsonify({
             'success': True,
-            'message': f'Importação concluída: {produtos_criados} criados, {produtos_atualizados} atualizados',
-            'detalhes': {
-                'produtos_criados': produtos_criados,
-                'produtos_atualizados': produtos_atualizados,
-                'erros': erros,
-                'total_erros': len(erros)
-            }
-        })
+            'message': 'Importação iniciada',
+            'tarefa_id': tarefa_id,
+            'status_url': f'/api/produtos/importar/{tarefa_id}'
+        }), 202
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Erro ao importar produtos: {str(e)}'
         }), 500
 
+@produto_bp.route('/produtos/importar/<tarefa_id>', methods=['GET'])
+def status_importacao(tarefa_id):
+    """Consulta o progresso de uma importação em segundo plano"""
+    tarefa = obter_tarefa(tarefa_id)
+    if not tarefa:
+        return jsonify({
+            'success': False,
+            'message': 'Importação não encontrada'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'status': tarefa['status'],
+        'message': tarefa['message'],
+        'progresso': {
+            'total_linhas': tarefa['total_linhas'],
+            'linhas_processadas': tarefa['linhas_processadas']
+        },
+        'detalhes': {
+            'produtos_criados': tarefa['produtos_criados'],
+            'produtos_atualizados': tarefa['produtos_atualizados'],
+            'erros': tarefa['erros'],
+            'total_erros': len(tarefa['erros'])
+        }
+    })
+
 @produto_bp.route('/produtos/template', methods=['GET'])
 def baixar_template():
     """Retorna um template Excel para importação de produtos"""
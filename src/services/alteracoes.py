@@ -0,0 +1,263 @@
+import click
+from datetime import datetime, timedelta
+from heapq import merge
+from flask.cli import AppGroup
+from sqlalchemy import event, func, delete, insert, select, update, text, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem
+from src.models.alteracao import Sequencia, ContagemExcluida, SEQUENCIA_ALTERACOES, SEQUENCIA_PODADAS
+from src.services.listagem import (
+    CAMPOS_CONTAGEM, CAMPOS_PRODUTO, ParametroInvalido, Projecao,
+    codificar_cursor, decodificar_cursor, ler_campos, ler_limite, PAGINA_PADRAO
+)
+from src.services.totais import valor_gravado
+
+# Posição no feed: (sequencia, origem, id). Na mesma sequência (mesma
+# transação) as exclusões vêm antes das contagens incluídas ou alteradas
+ORIGEM_EXCLUSAO = 0
+ORIGEM_CONTAGEM = 1
+INICIO = (-1, ORIGEM_CONTAGEM, 0)
+
+
+class CursorExpirado(Exception):
+    """O cursor é anterior às exclusões já podadas: o cliente precisa sincronizar tudo de novo"""
+
+
+def registrar_alteracoes():
+    """
+    Registra os eventos de sessão do feed de alterações: inclusões e
+    alterações deixam contagens.sequencia nula, exclusões (pelo ORM, em
+    cascata do produto ou em massa, como zerar estoque) gravam um registro
+    em contagens_excluidas e, antes do commit, as linhas pendentes recebem
+    a sequência da transação (id da transação no PostgreSQL, próximo valor
+    de 'alteracoes' no SQLite)
+    """
+    if event.contains(Session, 'before_commit', antes_commit):
+        return
+
+    event.listen(Session, 'after_flush', ao_flush)
+    event.listen(Session, 'do_orm_execute', ao_executar)
+    event.listen(Session, 'before_commit', antes_commit)
+    event.listen(Session, 'after_rollback', ao_rollback)
+
+
+def ao_flush(session, flush_context):
+    excluidas = [
+        {
+            'contagem_id': contagem.id,
+            'produto_id': valor_gravado(contagem, 'produto_id'),
+            'lote': valor_gravado(contagem, 'lote')
+        }
+        for contagem in session.deleted if isinstance(contagem, Contagem)
+    ]
+    if excluidas:
+        session.connection().execute(insert(ContagemExcluida), excluidas)
+
+    if excluidas or any(isinstance(instancia, Contagem) for instancia in (*session.new, *session.dirty)):
+        session.info['alteracoes_pendentes'] = True
+
+
+def ao_executar(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    tabela = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(tabela, 'name', None) != 'contagens':
+        return
+
+    session = orm_execute_state.session
+    session.info['alteracoes_pendentes'] = True
+    if orm_execute_state.is_delete:
+        # Exclusão em massa: registra as linhas que a instrução vai excluir
+        excluidas = select(Contagem.id, Contagem.produto_id, Contagem.lote)
+        if orm_execute_state.statement.whereclause is not None:
+            excluidas = excluidas.where(orm_execute_state.statement.whereclause)
+        session.connection().execute(
+            insert(ContagemExcluida).from_select(['contagem_id', 'produto_id', 'lote'], excluidas)
+        )
+
+
+def antes_commit(session):
+    # O commit só envia ao banco as alterações pendentes depois deste evento
+    session.flush()
+    if not session.info.pop('alteracoes_pendentes', False):
+        return
+
+    conexao = session.connection()
+    if conexao.dialect.name == 'postgresql':
+        # Id da transação (64 bits, crescente), sem travar nenhuma linha
+        # compartilhada: a leitura do feed só entrega transações já encerradas
+        # (limite_feed), então uma transação que termina depois de outra com
+        # id maior não fica para trás do cursor do cliente
+        sequencia = conexao.execute(text('SELECT pg_current_xact_id()::text::bigint')).scalar_one()
+    else:
+        # SQLite: um escritor por vez; a linha da sequência não acrescenta
+        # espera e os valores seguem a ordem dos commits
+        sequencia = conexao.execute(
+            update(Sequencia)
+            .where(Sequencia.nome == SEQUENCIA_ALTERACOES)
+            .values(valor=Sequencia.valor + 1)
+            .returning(Sequencia.valor)
+        ).scalar_one()
+
+    # Instruções em texto: um UPDATE do SQLAlchemy também atualizaria updated_at
+    conexao.execute(
+        text('UPDATE contagens SET sequencia = :sequencia WHERE sequencia IS NULL'),
+        {'sequencia': sequencia}
+    )
+    conexao.execute(
+        text('UPDATE contagens_excluidas SET sequencia = :sequencia WHERE sequencia IS NULL'),
+        {'sequencia': sequencia}
+    )
+
+
+def ao_rollback(session):
+    session.info.pop('alteracoes_pendentes', None)
+
+
+def inicializar_alteracoes():
+    """Cria as sequências do feed em bancos novos ou anteriores a ele"""
+    for nome in (SEQUENCIA_ALTERACOES, SEQUENCIA_PODADAS):
+        if db.session.get(Sequencia, nome) is None:
+            db.session.add(Sequencia(nome=nome, valor=0))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro worker criou as sequências ao mesmo tempo
+        db.session.rollback()
+
+
+def ler_posicao(since):
+    if not since:
+        return INICIO
+    posicao = decodificar_cursor(since, 3)
+    if not all(isinstance(valor, int) for valor in posicao):
+        raise ParametroInvalido('Cursor inválido')
+    return tuple(posicao)
+
+
+def limite_feed():
+    """
+    Sequência a partir da qual ainda pode haver transações em andamento
+    (PostgreSQL: o xmin do snapshot atual), ou None se não há limite.
+    Toda transação com id menor já terminou, com commit ou rollback.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return None
+    return db.session.execute(text('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')).scalar_one()
+
+
+def listar_alteracoes(args):
+    """
+    Alterações de contagens depois do cursor since, em ordem de sequência:
+    contagens incluídas ou alteradas (estado atual, mesmos campos da
+    listagem) e contagens excluídas. Sem since, retorna todas as contagens
+    atuais (um cliente sem dados não precisa das exclusões).
+    Retorna (alteracoes, proximo_cursor, fim).
+    """
+    limite = ler_limite(args) or PAGINA_PADRAO
+    campos, aninhados = ler_campos(args.get('fields'), CAMPOS_CONTAGEM, {'produto': CAMPOS_PRODUTO})
+    posicao = ler_posicao(args.get('since'))
+    sequencia, origem, ultimo_id = posicao
+
+    if args.get('since'):
+        podadas = db.session.query(Sequencia.valor).filter(Sequencia.nome == SEQUENCIA_PODADAS).scalar() or 0
+        if podadas and posicao < (podadas, ORIGEM_CONTAGEM, 0):
+            raise CursorExpirado('Cursor anterior às exclusões já removidas do histórico; '
+                                 'sincronize todas as contagens novamente (sem since)')
+
+    projecao = Projecao()
+    projecao.campos(campos, CAMPOS_CONTAGEM)
+    projecao.campos(aninhados.get('produto', []), CAMPOS_PRODUTO, destino='produto')
+    pos_sequencia = projecao.coluna(Contagem.sequencia)
+    pos_id = projecao.coluna(Contagem.id)
+    montar = projecao.montador()
+
+    # Lido antes das consultas: nelas toda transação abaixo do limite já é visível
+    limite_sequencia = limite_feed()
+
+    query = db.session.query(*projecao.colunas).select_from(Contagem).join(
+        Produto, Contagem.produto_id == Produto.id
+    )
+    if limite_sequencia is not None:
+        query = query.filter(Contagem.sequencia < limite_sequencia)
+    if origem == ORIGEM_EXCLUSAO:
+        query = query.filter(Contagem.sequencia >= sequencia)
+    else:
+        query = query.filter(tuple_(Contagem.sequencia, Contagem.id) > tuple_(sequencia, ultimo_id))
+    contagens = [
+        ((linha[pos_sequencia], ORIGEM_CONTAGEM, linha[pos_id]),
+         {'operacao': 'alterada', 'sequencia': linha[pos_sequencia], 'contagem': montar(linha)})
+        for linha in query.order_by(Contagem.sequencia, Contagem.id).limit(limite + 1)
+    ]
+
+    excluidas = []
+    if args.get('since'):
+        query = db.session.query(
+            ContagemExcluida.sequencia, ContagemExcluida.id, ContagemExcluida.contagem_id,
+            ContagemExcluida.produto_id, ContagemExcluida.lote
+        )
+        if limite_sequencia is not None:
+            query = query.filter(ContagemExcluida.sequencia < limite_sequencia)
+        if origem == ORIGEM_EXCLUSAO:
+            query = query.filter(
+                tuple_(ContagemExcluida.sequencia, ContagemExcluida.id) > tuple_(sequencia, ultimo_id)
+            )
+        else:
+            query = query.filter(ContagemExcluida.sequencia > sequencia)
+        excluidas = [
+            ((seq, ORIGEM_EXCLUSAO, registro_id),
+             {'operacao': 'excluida', 'sequencia': seq,
+              'contagem': {'id': contagem_id, 'produto_id': produto_id, 'lote': lote}})
+            for seq, registro_id, contagem_id, produto_id, lote in query.order_by(
+                ContagemExcluida.sequencia, ContagemExcluida.id
+            ).limit(limite + 1)
+        ]
+
+    itens = list(merge(excluidas, contagens, key=lambda item: item[0]))
+    fim = len(itens) <= limite
+    itens = itens[:limite]
+    if itens:
+        posicao = itens[-1][0]
+    return [item for _, item in itens], codificar_cursor(list(posicao)), fim
+
+
+def podar_exclusoes(dias):
+    """
+    Remove os registros de exclusão com mais de `dias` dias. Cursores
+    anteriores a eles passam a ser recusados (CursorExpirado).
+    Retorna (registros removidos, sequência podada ou None).
+    """
+    corte = datetime.utcnow() - timedelta(days=dias)
+    limite = db.session.query(func.max(ContagemExcluida.sequencia)).filter(
+        ContagemExcluida.excluida_em < corte
+    ).scalar()
+    if limite is None:
+        return 0, None
+
+    removidos = db.session.execute(
+        delete(ContagemExcluida).where(ContagemExcluida.sequencia <= limite)
+    ).rowcount
+    db.session.execute(
+        update(Sequencia)
+        .where(Sequencia.nome == SEQUENCIA_PODADAS, Sequencia.valor < limite)
+        .values(valor=limite)
+    )
+    db.session.commit()
+    return removidos, limite
+
+
+alteracoes_cli = AppGroup('alteracoes', help='Manutenção do feed de alterações de contagens')
+
+
+@alteracoes_cli.command('podar')
+@click.option('--dias', default=30, show_default=True, help='Mantém as exclusões destes últimos dias')
+def comando_podar(dias):
+    """Remove registros antigos de contagens excluídas"""
+    removidos, limite = podar_exclusoes(dias)
+    if limite is None:
+        click.echo('Nenhum registro de exclusão a remover.')
+    else:
+        click.echo(f'{removidos} registros removidos (até a sequência {limite}).')
@@ -0,0 +1,63 @@
+from collections import namedtuple
+from flask import g
+from src.database import db
+from src.models.alteracao import SEQUENCIA_PRODUTOS
+from src.models.produto import Produto
+from src.services.versao import versao_atual
+
+# Códigos de produto vão de 0000 a 9999: um slot por código
+TOTAL_CODIGOS = 10000
+
+# O cache de cada worker é guardado com a versão do catálogo lida do banco
+# (versao_produtos, ver services/versao.py), incrementada a cada commit que
+# altera produtos: workers de todas as máquinas recarregam o catálogo na
+# primeira leitura depois da alteração. A versão é lida uma vez por requisição.
+
+# (versão, slots) do cache deste worker; substituído de uma vez ao recarregar
+estado = (None, None)
+
+
+class ProdutoCache(namedtuple('ProdutoCache', ['id', 'codigo', 'nome', 'created_at'])):
+    """Dados de um produto guardados no cache, com o mesmo to_dict do modelo"""
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'codigo': self.codigo,
+            'nome': self.nome,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+def carregar_slots():
+    """Lê o catálogo inteiro em uma consulta e monta o array indexado pelo código"""
+    slots = [None] * TOTAL_CODIGOS
+    for produto_id, codigo, nome, created_at in db.session.query(
+        Produto.id, Produto.codigo, Produto.nome, Produto.created_at
+    ):
+        if codigo.isascii() and codigo.isdigit():
+            slots[int(codigo)] = ProdutoCache(produto_id, codigo, nome, created_at)
+    return slots
+
+
+def obter_slots():
+    """Retorna os slots do cache, recarregando-os se o catálogo mudou"""
+    global estado
+
+    versao = g.get('versao_produtos')
+    if versao is None:
+        versao = g.versao_produtos = versao_atual(SEQUENCIA_PRODUTOS)
+    versao_local, slots = estado
+    if versao_local != versao:
+        # A versão é lida antes da consulta: uma escrita concorrente força nova recarga
+        slots = carregar_slots()
+        estado = (versao, slots)
+    return slots
+
+
+def buscar_produto_cache(codigo_formatado):
+    """Busca um produto pelo código (4 dígitos) no cache do catálogo"""
+    if len(codigo_formatado) != 4 or not (codigo_formatado.isascii() and codigo_formatado.isdigit()):
+        return None
+    return obter_slots()[int(codigo_formatado)]
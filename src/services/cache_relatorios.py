@@ -0,0 +1,187 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from src.services.estado import diretorio_estado
+from src.services.download import Download, gerar_download, download_do_arquivo, LIMITE_MEMORIA
+from src.services.versao import versao_atual
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Onde guardar os relatórios gerados: 'disco' (diretório compartilhado pelos
+# workers da máquina), 'memoria' (cada worker guarda os seus) ou 'desligado'
+MODO = os.environ.get('RELATORIOS_CACHE', 'disco')
+MAX_BYTES = int(os.environ.get('RELATORIOS_CACHE_MB', '256')) * 1024 * 1024
+
+
+def nome_entrada(tipo, incluir_zerados, versao):
+    # versao vem do banco (services/versao.py): não volta a valores antigos após
+    # reinícios nem em um banco recriado, então uma entrada que sobreviveu no
+    # diretório de estado nunca é confundida com outro conteúdo
+    filtro = 'todos' if incluir_zerados else 'com_estoque'
+    return f'{tipo}-{filtro}-{versao}'
+
+
+def versao_da_entrada(nome):
+    return nome.rsplit('-', 1)[-1]
+
+
+class CacheMemoria:
+    """LRU dos relatórios gerados neste worker, limitado a MAX_BYTES"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entradas = OrderedDict()
+        self.total_bytes = 0
+        self.trava = threading.Lock()
+
+    def remover(self, nome):
+        self.total_bytes -= len(self.entradas.pop(nome))
+
+    def obter(self, nome, escrever, *args):
+        versao = versao_da_entrada(nome)
+        with self.trava:
+            # Entradas de versões anteriores nunca mais serão pedidas
+            for antigo in [n for n in self.entradas if versao_da_entrada(n) != versao]:
+                self.remover(antigo)
+            conteudo = self.entradas.get(nome)
+            if conteudo is not None:
+                self.entradas.move_to_end(nome)
+                return Download(iter([conteudo]), len(conteudo))
+
+        arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA)
+        try:
+            escrever(arquivo, *args)
+        except Exception:
+            arquivo.close()
+            raise
+        tamanho = arquivo.tell()
+        if tamanho > self.max_bytes:
+            return download_do_arquivo(arquivo)
+        arquivo.seek(0)
+
+        with arquivo:
+            conteudo = arquivo.read()
+        with self.trava:
+            if nome in self.entradas:
+                self.remover(nome)
+            self.entradas[nome] = conteudo
+            self.total_bytes += tamanho
+            while self.total_bytes > self.max_bytes:
+                self.remover(next(iter(self.entradas)))
+        return Download(iter([conteudo]), tamanho)
+
+
+class CacheDisco:
+    """
+    Relatórios gravados em um diretório compartilhado pelos workers.
+    O uso mais recente é registrado no mtime do arquivo e os menos usados
+    são apagados quando o total passa de MAX_BYTES.
+    """
+
+    def __init__(self, diretorio, max_bytes):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+
+    def abrir(self, caminho):
+        try:
+            arquivo = open(caminho, 'rb')
+        except FileNotFoundError:
+            return None
+        os.utime(caminho)
+        return arquivo
+
+    def obter(self, nome, escrever, *args):
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = os.path.join(self.diretorio, nome)
+
+        arquivo = self.abrir(caminho)
+        if arquivo is None:
+            # Apenas um worker gera cada relatório; os demais esperam e reaproveitam
+            with open(caminho + '.lock', 'a+b') as trava:
+                if fcntl:
+                    fcntl.flock(trava.fileno(), fcntl.LOCK_EX)
+                arquivo = self.abrir(caminho)
+                if arquivo is None:
+                    self.gravar(caminho, escrever, *args)
+                    arquivo = open(caminho, 'rb')
+            # O arquivo aberto continua legível mesmo se for apagado na limpeza
+            self.limpar(versao_da_entrada(nome))
+
+        return download_do_arquivo(arquivo)
+
+    def gravar(self, caminho, escrever, *args):
+        temporario = tempfile.NamedTemporaryFile(dir=self.diretorio, prefix='.gerando-', delete=False)
+        try:
+            with temporario:
+                escrever(temporario, *args)
+            os.replace(temporario.name, caminho)
+        except Exception:
+            os.unlink(temporario.name)
+            raise
+
+    def limpar(self, versao):
+        """Apaga entradas de outras versões e as menos usadas acima do limite"""
+        entradas = []
+        for item in os.scandir(self.diretorio):
+            if item.name.startswith('.') or not item.is_file():
+                continue
+            nome = item.name[:-len('.lock')] if item.name.endswith('.lock') else item.name
+            try:
+                if versao_da_entrada(nome) != versao:
+                    os.unlink(item.path)
+                elif not item.name.endswith('.lock'):
+                    estado = item.stat()
+                    entradas.append((estado.st_mtime, estado.st_size, item.path))
+            except FileNotFoundError:
+                continue
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+
+
+cache = None
+trava_cache = threading.Lock()
+
+
+def obter_cache():
+    global cache
+    with trava_cache:
+        if cache is None:
+            if MODO == 'memoria':
+                cache = CacheMemoria(MAX_BYTES)
+            elif MODO == 'disco':
+                cache = CacheDisco(os.path.join(diretorio_estado(), 'relatorios'), MAX_BYTES)
+    return cache
+
+
+def relatorio_download(tipo, incluir_zerados, escrever):
+    """
+    Retorna o Download (services/download.py) do arquivo gravado por
+    escrever(arquivo, incluir_zerados), reaproveitando o relatório já gerado
+    para (tipo, incluir_zerados, versão do estoque gravada no banco). Uma
+    alteração no estoque muda a versão e descarta as entradas.
+    """
+    cache_relatorios = obter_cache()
+    if cache_relatorios is None:
+        return gerar_download(escrever, incluir_zerados)
+
+    # A versão é lida antes de gerar: uma escrita concorrente muda a versão
+    # e a próxima requisição gera o relatório de novo
+    nome = nome_entrada(tipo, incluir_zerados, versao_atual())
+    return cache_relatorios.obter(nome, escrever, incluir_zerados)
+
+
+def relatorio_em_bytes(tipo, incluir_zerados, escrever):
+    """Como relatorio_download, mas retorna o conteúdo inteiro"""
+    return b''.join(relatorio_download(tipo, incluir_zerados, escrever).partes)
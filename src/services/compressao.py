@@ -0,0 +1,150 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # opcional: sem brotli as respostas são comprimidas só com gzip
+    brotli = None
+
+# Respostas menores que isso são enviadas sem compressão (as enviadas em
+# partes não têm tamanho conhecido e são sempre comprimidas)
+TAMANHO_MINIMO = int(os.environ.get('COMPRESSAO_MINIMO_BYTES', '1024'))
+# Níveis: gzip de 1 a 9, brotli de 0 a 11 (os mais altos custam muito CPU por requisição)
+NIVEL_GZIP = int(os.environ.get('COMPRESSAO_NIVEL_GZIP', '6'))
+NIVEL_BROTLI = int(os.environ.get('COMPRESSAO_NIVEL_BROTLI', '4'))
+# Corpos comprimidos guardados por URL, ETag e codificação
+MAX_BYTES_CACHE = int(os.environ.get('COMPRESSAO_CACHE_MB', '32')) * 1024 * 1024
+
+TIPOS_COMPRIMIVEIS = ('application/json', 'application/x-ndjson', 'text/')
+CODIFICACOES = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class CompressorGzip:
+    def __init__(self):
+        # wbits=31: formato gzip (cabeçalho sem data, bytes iguais em todos os workers)
+        self.compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+
+    def comprimir(self, dados):
+        # Z_SYNC_FLUSH: cada parte sai inteira, sem esperar as próximas
+        return self.compressor.compress(dados) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finalizar(self):
+        return self.compressor.flush()
+
+
+class CompressorBrotli:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=NIVEL_BROTLI)
+
+    def comprimir(self, dados):
+        return self.compressor.process(dados) + self.compressor.flush()
+
+    def finalizar(self):
+        return self.compressor.finish()
+
+
+COMPRESSORES = {'gzip': CompressorGzip, 'br': CompressorBrotli}
+
+
+def comprimir(corpo, codificacao):
+    compressor = COMPRESSORES[codificacao]()
+    return compressor.comprimir(corpo) + compressor.finalizar()
+
+
+def comprimir_partes(partes, codificacao):
+    """Comprime as partes de uma resposta em streaming à medida que são geradas"""
+    compressor = COMPRESSORES[codificacao]()
+    try:
+        for parte in partes:
+            if isinstance(parte, str):
+                parte = parte.encode()
+            if parte:
+                yield compressor.comprimir(parte)
+        yield compressor.finalizar()
+    finally:
+        if hasattr(partes, 'close'):
+            partes.close()
+
+
+comprimidas = OrderedDict()
+trava_comprimidas = threading.Lock()
+bytes_comprimidas = 0
+
+
+def guardar_comprimida(chave, corpo):
+    """Guarda o corpo comprimido, descartando os menos usados acima do limite"""
+    global bytes_comprimidas
+
+    with trava_comprimidas:
+        anterior = comprimidas.pop(chave, None)
+        if anterior is not None:
+            bytes_comprimidas -= len(anterior)
+        if len(corpo) > MAX_BYTES_CACHE:
+            return
+        comprimidas[chave] = corpo
+        bytes_comprimidas += len(corpo)
+        while bytes_comprimidas > MAX_BYTES_CACHE:
+            _, descartado = comprimidas.popitem(last=False)
+            bytes_comprimidas -= len(descartado)
+
+
+def comprimir_corpo(corpo, codificacao, etag):
+    """
+    Corpo comprimido. Com ETag (versão do estoque ou hash do conteúdo), o
+    mesmo corpo é reaproveitado enquanto a URL responder com esse ETag.
+    """
+    if etag is None:
+        return comprimir(corpo, codificacao)
+
+    chave = (request.full_path, etag, codificacao)
+    with trava_comprimidas:
+        guardado = comprimidas.get(chave)
+        if guardado is not None:
+            comprimidas.move_to_end(chave)
+    if guardado is None:
+        guardado = comprimir(corpo, codificacao)
+        guardar_comprimida(chave, guardado)
+    return guardado
+
+
+def comprimir_resposta(response):
+    """
+    Comprime com brotli ou gzip (conforme Accept-Encoding) as respostas de
+    texto e JSON a partir de TAMANHO_MINIMO bytes, inclusive as enviadas
+    em partes. O ETag passa a ser fraco: a mesma versão do estoque em
+    qualquer codificação continua respondendo 304 ao If-None-Match.
+    """
+    if (response.status_code != 200 or request.method == 'HEAD' or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(TIPOS_COMPRIMIVEIS)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacao = request.accept_encodings.best_match(CODIFICACOES)
+    if codificacao is None:
+        return response
+
+    etag, fraco = response.get_etag()
+    if response.is_streamed:
+        response.response = comprimir_partes(response.response, codificacao)
+        response.headers.pop('Content-Length', None)
+    else:
+        corpo = response.get_data()
+        if len(corpo) < TAMANHO_MINIMO:
+            return response
+        comprimido = comprimir_corpo(corpo, codificacao, etag)
+        if len(comprimido) >= len(corpo):
+            return response
+        response.set_data(comprimido)
+
+    response.headers['Content-Encoding'] = codificacao
+    if etag and not fraco:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def registrar_compressao(app):
+    app.after_request(comprimir_resposta)
@@ -0,0 +1,46 @@
+import os
+import tempfile
+from collections import namedtuple
+
+# Acima deste tamanho o arquivo em construção vai para disco em vez da memória
+LIMITE_MEMORIA = 4 * 1024 * 1024
+TAMANHO_PEDACO = 64 * 1024
+
+
+class Download(namedtuple('Download', ['partes', 'tamanho'])):
+    """Arquivo já gerado: gerador com o conteúdo em pedaços e o tamanho total (Content-Length)"""
+    __slots__ = ()
+
+
+def gerar_download(escrever, *args, **kwargs):
+    """
+    Executa escrever(arquivo, *args, **kwargs) até o fim sobre um arquivo
+    temporário (em disco acima de LIMITE_MEMORIA) e retorna o Download.
+    Nada é enviado enquanto o arquivo é gerado (o reportlab e o openpyxl
+    só gravam o documento ao final): a memória fica limitada, mas o
+    primeiro byte sai só depois da geração completa.
+    """
+    arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA)
+    try:
+        escrever(arquivo, *args, **kwargs)
+    except Exception:
+        arquivo.close()
+        raise
+    return download_do_arquivo(arquivo)
+
+
+def download_do_arquivo(arquivo):
+    """Download de um arquivo aberto e completo, enviado desde o início"""
+    tamanho = arquivo.seek(0, os.SEEK_END)
+    arquivo.seek(0)
+    return Download(enviar_arquivo(arquivo), tamanho)
+
+
+def enviar_arquivo(arquivo):
+    """Gerador que envia o arquivo aberto em pedaços e o fecha ao final"""
+    with arquivo:
+        while True:
+            pedaco = arquivo.read(TAMANHO_PEDACO)
+            if not pedaco:
+                break
+            yield pedaco
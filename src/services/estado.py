@@ -0,0 +1,18 @@
+import hashlib
+import os
+import tempfile
+
+
+def diretorio_estado():
+    """
+    Diretório com o estado compartilhado entre os workers do gunicorn na
+    mesma máquina. Usa ESTOQUE_ESTADO_DIR ou um diretório temporário
+    próprio de cada banco (DATABASE_URL).
+    """
+    diretorio = os.environ.get('ESTOQUE_ESTADO_DIR')
+    if not diretorio:
+        banco = os.environ.get('DATABASE_URL', '')
+        sufixo = hashlib.sha1(banco.encode()).hexdigest()[:12]
+        diretorio = os.path.join(tempfile.gettempdir(), f'estoque_{sufixo}')
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+from flask import make_response
+
+try:
+    import brotli
+except ImportError:  # opcional: sem brotli os arquivos são enviados só com gzip
+    brotli = None
+
+# Arquivos com hash no nome nunca mudam: o navegador não precisa revalidar
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+# index.html e os nomes originais: sempre revalidados (304 pelo ETag)
+CACHE_REVALIDAR = 'no-cache'
+
+# Menores que isso não compensam a compressão
+TAMANHO_MINIMO_COMPRESSAO = 512
+TIPOS_COMPRIMIVEIS = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/x-icon',
+                      'image/vnd.microsoft.icon')
+
+# Referências a arquivos locais no index.html (href="styles.css", src="script.js")
+REFERENCIA = re.compile(r'''(?P<atributo>\b(?:href|src)=)(?P<aspas>["'])(?P<caminho>[^"'#?:]+)(?P=aspas)''')
+
+# Conteúdo em memória de um arquivo: original, variantes comprimidas (ou None) e cabeçalhos
+Estatico = namedtuple('Estatico', ['corpo', 'gzip', 'br', 'mimetype', 'etag', 'cache_control'])
+
+
+def comprimivel(mimetype):
+    return mimetype.startswith(TIPOS_COMPRIMIVEIS)
+
+
+def criar_estatico(corpo, mimetype, cache_control):
+    """Calcula hash e variantes gzip/brotli (só quando ficam menores que o original)"""
+    resumo = hashlib.sha256(corpo).hexdigest()[:16]
+    variante_gzip = variante_br = None
+    if comprimivel(mimetype) and len(corpo) >= TAMANHO_MINIMO_COMPRESSAO:
+        # mtime=0: o mesmo arquivo gera sempre os mesmos bytes (e o mesmo ETag em todos os workers)
+        variante_gzip = gzip.compress(corpo, compresslevel=9, mtime=0)
+        if len(variante_gzip) >= len(corpo):
+            variante_gzip = None
+        if brotli is not None:
+            variante_br = brotli.compress(corpo, quality=11)
+            if len(variante_br) >= len(corpo):
+                variante_br = None
+    return Estatico(corpo, variante_gzip, variante_br, mimetype, resumo, cache_control)
+
+
+def nome_com_hash(caminho, resumo):
+    """js/script.js -> js/script.3f2a9c1b.js"""
+    raiz, extensao = os.path.splitext(caminho)
+    return f'{raiz}.{resumo[:8]}{extensao}'
+
+
+class CatalogoEstaticos:
+    """
+    Índice em memória dos arquivos da pasta static, montado uma vez na
+    inicialização: cada arquivo fica disponível pelo nome original e por um
+    nome com o hash do conteúdo (cache imutável no navegador), com as
+    variantes gzip e brotli já comprimidas. O index.html é reescrito para
+    apontar para os nomes com hash. No modo debug, o índice é refeito
+    quando algum arquivo muda.
+    """
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.trava = threading.Lock()
+        self.arquivos = {}
+        self.assinatura = None
+        self.carregar()
+
+    def assinatura_pasta(self):
+        """Caminho, tamanho e data de alteração de cada arquivo"""
+        assinatura = []
+        for diretorio, _, nomes in os.walk(self.pasta):
+            for nome in nomes:
+                estado = os.stat(os.path.join(diretorio, nome))
+                assinatura.append((diretorio, nome, estado.st_size, estado.st_mtime_ns))
+        return sorted(assinatura)
+
+    def carregar(self):
+        arquivos = {}
+        assinatura = self.assinatura_pasta() if os.path.isdir(self.pasta) else []
+        for diretorio, nome, _, _ in assinatura:
+            caminho = os.path.relpath(os.path.join(diretorio, nome), self.pasta).replace(os.sep, '/')
+            if caminho == 'index.html':
+                continue
+            with open(os.path.join(diretorio, nome), 'rb') as arquivo:
+                corpo = arquivo.read()
+            mimetype = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+            estatico = criar_estatico(corpo, mimetype, CACHE_REVALIDAR)
+            arquivos[caminho] = estatico
+            arquivos[nome_com_hash(caminho, estatico.etag)] = estatico._replace(cache_control=CACHE_IMUTAVEL)
+
+        indice = os.path.join(self.pasta, 'index.html')
+        if os.path.isfile(indice):
+            with open(indice, encoding='utf-8') as arquivo:
+                html = arquivo.read()
+
+            def trocar(referencia):
+                estatico = arquivos.get(referencia.group('caminho'))
+                if estatico is None:
+                    return referencia.group(0)
+                novo = nome_com_hash(referencia.group('caminho'), estatico.etag)
+                return f'{referencia.group("atributo")}{referencia.group("aspas")}{novo}{referencia.group("aspas")}'
+
+            arquivos['index.html'] = criar_estatico(
+                REFERENCIA.sub(trocar, html).encode('utf-8'), 'text/html', CACHE_REVALIDAR
+            )
+
+        with self.trava:
+            self.arquivos = arquivos
+            self.assinatura = assinatura
+
+    def recarregar_se_alterado(self):
+        if self.assinatura_pasta() != self.assinatura:
+            self.carregar()
+
+    def buscar(self, caminho):
+        """Arquivo pelo caminho pedido ou None"""
+        return self.arquivos.get(caminho)
+
+    def responder(self, estatico, request):
+        """Resposta com a melhor codificação aceita pelo cliente, ETag e Cache-Control"""
+        aceitas = request.accept_encodings
+        if estatico.br is not None and aceitas['br']:
+            corpo, codificacao = estatico.br, 'br'
+        elif estatico.gzip is not None and aceitas['gzip']:
+            corpo, codificacao = estatico.gzip, 'gzip'
+        else:
+            corpo, codificacao = estatico.corpo, None
+
+        # Cada codificação é uma representação diferente: ETag próprio
+        etag = f'{estatico.etag}-{codificacao}' if codificacao else estatico.etag
+        if etag in request.if_none_match:
+            resposta = make_response('', 304)
+        else:
+            resposta = make_response(corpo)
+            resposta.mimetype = estatico.mimetype
+            if codificacao:
+                resposta.headers['Content-Encoding'] = codificacao
+
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = estatico.cache_control
+        if estatico.gzip is not None or estatico.br is not None:
+            resposta.vary.add('Accept-Encoding')
+        return resposta
@@ -0,0 +1,78 @@
+import csv
+import io
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem
+from src.services.listagem import CAMPOS_CONTAGEM, CAMPOS_PRODUTO, ParametroInvalido, Projecao, ler_campos
+from src.services.serializacao import linha_json
+
+# Linhas lidas do cursor do servidor por vez (e enviadas em cada parte da resposta)
+LOTE_LEITURA = 1000
+
+FORMATOS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def consulta_exportacao(args):
+    """
+    Interpreta format (ndjson ou csv) e fields e monta a consulta de todas
+    as contagens em ordem de código e lote. Retorna (formato, query, projeção).
+    """
+    formato = args.get('format', 'ndjson').lower()
+    if formato not in FORMATOS:
+        raise ParametroInvalido('Parâmetro format deve ser ndjson ou csv')
+    campos, aninhados = ler_campos(args.get('fields'), CAMPOS_CONTAGEM, {'produto': CAMPOS_PRODUTO})
+
+    projecao = Projecao()
+    projecao.campos(campos, CAMPOS_CONTAGEM)
+    projecao.campos(aninhados.get('produto', []), CAMPOS_PRODUTO, destino='produto')
+
+    query = db.session.query(*projecao.colunas).select_from(Contagem).join(
+        Produto, Contagem.produto_id == Produto.id
+    ).order_by(Produto.codigo, Contagem.lote)
+    return formato, query, projecao
+
+
+def ler_partes(query):
+    """
+    Lê o resultado em listas de LOTE_LEITURA linhas (cursor do servidor no
+    PostgreSQL): só uma parte fica em memória por vez
+    """
+    resultado = db.session.execute(query.statement, execution_options={'yield_per': LOTE_LEITURA})
+    try:
+        yield from resultado.partitions()
+    finally:
+        # Cliente desconectado no meio do envio: libera o cursor
+        resultado.close()
+
+
+def gerar_ndjson(query, projecao):
+    """Um objeto JSON por linha, no formato dos itens de GET /api/contagens"""
+    montar = projecao.montador()
+    for parte in ler_partes(query):
+        yield b''.join([linha_json(montar(linha)) for linha in parte])
+
+
+def gerar_csv(query, projecao):
+    """Cabeçalho com os nomes dos campos ('produto.codigo' nos do produto) e uma linha por contagem"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    # O cabeçalho sai antes da consulta ser executada
+    escritor.writerow(projecao.nomes_campos())
+    yield buffer.getvalue()
+
+    montar = projecao.montador_tupla()
+    for parte in ler_partes(query):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(map(montar, parte))
+        yield buffer.getvalue()
+
+
+GERADORES = {
+    'ndjson': gerar_ndjson,
+    'csv': gerar_csv,
+}
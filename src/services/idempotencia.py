@@ -0,0 +1,31 @@
+import click
+from datetime import datetime, timedelta
+from flask.cli import AppGroup
+from sqlalchemy import delete
+from src.database import db
+from src.models.chave_idempotencia import ChaveIdempotencia
+
+
+def podar_chaves(dias):
+    """
+    Remove as chaves de idempotência registradas há mais de `dias` dias.
+    Um reenvio com uma chave removida volta a ser somado: o prazo deve
+    cobrir o maior tempo que um coletor pode ficar sem sincronizar.
+    Retorna a quantidade removida.
+    """
+    corte = datetime.utcnow() - timedelta(days=dias)
+    removidas = db.session.execute(
+        delete(ChaveIdempotencia).where(ChaveIdempotencia.registrada_em < corte)
+    ).rowcount
+    db.session.commit()
+    return removidas
+
+
+idempotencia_cli = AppGroup('idempotencia', help='Manutenção das chaves de idempotência das contagens')
+
+
+@idempotencia_cli.command('podar')
+@click.option('--dias', default=30, show_default=True, help='Mantém as chaves destes últimos dias')
+def comando_podar(dias):
+    """Remove chaves de idempotência antigas"""
+    click.echo(f'{podar_chaves(dias)} chaves removidas.')
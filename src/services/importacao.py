@@ -0,0 +1,238 @@
+from src.database import db
+from src.models.produto import Produto
+from src.services.tarefas import atualizar_tarefa
+from sqlalchemy import bindparam
+import numpy as np
+import pandas as pd
+import os
+
+# Quantidade de linhas enviadas por instrução (executemany)
+TAMANHO_LOTE = 1000
+
+
+def detectar_colunas(df):
+    """
+    Detecta as colunas de código e nome pelo cabeçalho.
+    Se não encontrar, usa as duas primeiras colunas (ou None se não houver).
+    """
+    colunas = df.columns.tolist()
+    col_codigo = None
+    col_nome = None
+
+    # Procurar por nomes de colunas conhecidos
+    for col in colunas:
+        col_lower = str(col).lower()
+        if 'codigo' in col_lower or 'código' in col_lower:
+            col_codigo = col
+        elif 'nome' in col_lower or 'produto' in col_lower or 'descricao' in col_lower or 'descrição' in col_lower:
+            col_nome = col
+
+    # Se não encontrou, usar as duas primeiras colunas
+    if col_codigo is None or col_nome is None:
+        if len(colunas) >= 2:
+            return colunas[0], colunas[1]
+        return None, None
+
+    return col_codigo, col_nome
+
+
+def verificar_planilha(caminho):
+    """
+    Lê só o cabeçalho e a primeira linha da planilha, antes de agendar a
+    importação. Retorna a mensagem de erro (arquivo vazio ou sem as colunas
+    de código e nome) ou None se a planilha pode ser importada.
+    """
+    previa = pd.read_excel(caminho, nrows=1)
+    if previa.empty:
+        return 'Arquivo está vazio'
+    if detectar_colunas(previa)[0] is None:
+        return 'Arquivo deve ter pelo menos 2 colunas (código e nome)'
+    return None
+
+
+def validar_valor(valor):
+    """Valida um único código, convertendo exceções em mensagem de erro"""
+    try:
+        return Produto.validar_codigo(valor)
+    except Exception as e:
+        return False, str(e)
+
+
+def validar_codigos(codigos):
+    """
+    Valida e formata uma série de códigos de uma vez.
+    Retorna dois arrays alinhados à série: códigos formatados (4 dígitos)
+    e mensagens de erro, com None onde não se aplica.
+    """
+    formatados = np.full(len(codigos), None, dtype=object)
+    erros = np.full(len(codigos), None, dtype=object)
+
+    if pd.api.types.is_numeric_dtype(codigos) and not pd.api.types.is_bool_dtype(codigos):
+        # Coluna numérica: validação vetorizada (int() trunca em direção ao zero)
+        valores = codigos.to_numpy(dtype=float)
+        finitos = np.isfinite(valores)
+        inteiros = np.trunc(np.where(finitos, valores, 0))
+        no_intervalo = finitos & (inteiros >= 0) & (inteiros <= 9999)
+
+        formatados[no_intervalo] = np.char.zfill(inteiros[no_intervalo].astype(np.int64).astype(str), 4)
+        erros[finitos & ~no_intervalo] = "Código deve estar entre 0000 e 9999"
+        restantes = np.flatnonzero(~finitos)
+    else:
+        restantes = np.arange(len(codigos))
+
+    if len(restantes):
+        # Demais valores (texto, misto): valida cada valor distinto uma única vez
+        valores = codigos.to_numpy(dtype=object)
+        resultados = {}
+        for posicao in restantes:
+            valor = valores[posicao]
+            if valor not in resultados:
+                resultados[valor] = validar_valor(valor)
+            valido, resultado = resultados[valor]
+            if valido:
+                formatados[posicao] = resultado
+            else:
+                erros[posicao] = resultado
+
+    return formatados, erros
+
+
+def preparar_linhas(df, col_codigo, col_nome):
+    """
+    Valida a planilha inteira e retorna (linhas, erros): a lista de
+    (codigo, nome) válidos na ordem do arquivo e a lista de erros por linha
+    """
+    # Pular linhas vazias
+    preenchidas = df[df[col_codigo].notna() & df[col_nome].notna()]
+
+    codigos, erros_codigo = validar_codigos(preenchidas[col_codigo])
+    nomes = preenchidas[col_nome].astype(str).str.strip().str.upper()
+
+    linhas = []
+    erros = []
+
+    for index, codigo, erro, nome in zip(preenchidas.index, codigos, erros_codigo, nomes):
+        if erro is not None:
+            erros.append(f'Linha {index + 2}: {erro}')
+        elif not nome:
+            erros.append(f'Linha {index + 2}: Nome não pode estar vazio')
+        else:
+            linhas.append((codigo, nome))
+
+    return linhas, erros
+
+
+def planejar_importacao(linhas, existentes):
+    """
+    Compara as linhas com os produtos existentes ({codigo: nome}).
+    Retorna (novos, alterados, criados, atualizados): os dicionários
+    {codigo: nome} a gravar e as contagens como a importação linha a linha
+    contava (códigos repetidos no arquivo valem pela última ocorrência).
+    """
+    atuais = dict(existentes)
+    novos = {}
+    alterados = {}
+    criados = 0
+    atualizados = 0
+
+    for codigo, nome in linhas:
+        if codigo not in atuais:
+            novos[codigo] = nome
+            criados += 1
+        elif atuais[codigo] != nome:
+            if codigo in novos:
+                novos[codigo] = nome
+            else:
+                alterados[codigo] = nome
+            atualizados += 1
+        else:
+            continue
+        atuais[codigo] = nome
+
+    return novos, alterados, criados, atualizados
+
+
+def em_lotes(itens, tamanho=TAMANHO_LOTE):
+    """Divide uma lista em fatias de no máximo `tamanho` itens"""
+    for inicio in range(0, len(itens), tamanho):
+        yield itens[inicio:inicio + tamanho]
+
+
+def aplicar_importacao(linhas, tamanho_lote=TAMANHO_LOTE, existentes=None):
+    """
+    Grava as linhas (codigo, nome) no banco: carrega os códigos existentes
+    em uma consulta (ou usa `existentes`, atualizando-o) e aplica inserções
+    e atualizações em executemany por lote.
+    Não faz commit. Retorna (produtos_criados, produtos_atualizados).
+    """
+    if existentes is None:
+        existentes = dict(db.session.query(Produto.codigo, Produto.nome))
+    novos, alterados, criados, atualizados = planejar_importacao(linhas, existentes)
+
+    tabela = Produto.__table__
+    inserir = tabela.insert()
+    atualizar = tabela.update().where(
+        tabela.c.codigo == bindparam('b_codigo')
+    ).values(nome=bindparam('b_nome'))
+
+    for lote in em_lotes(list(novos.items()), tamanho_lote):
+        db.session.execute(inserir, [{'codigo': c, 'nome': n} for c, n in lote])
+
+    for lote in em_lotes(list(alterados.items()), tamanho_lote):
+        db.session.execute(atualizar, [{'b_codigo': c, 'b_nome': n} for c, n in lote])
+
+    existentes.update(novos)
+    existentes.update(alterados)
+    return criados, atualizados
+
+
+def executar_importacao(tarefa_id, caminho):
+    """
+    Tarefa em segundo plano: lê a planilha salva em `caminho`, valida tudo
+    e grava os produtos com commit a cada TAMANHO_LOTE linhas, informando
+    o progresso na tarefa
+    """
+    try:
+        df = pd.read_excel(caminho)
+    finally:
+        os.unlink(caminho)
+
+    if df.empty:
+        raise ValueError('Arquivo está vazio')
+
+    col_codigo, col_nome = detectar_colunas(df)
+    if col_codigo is None:
+        raise ValueError('Arquivo deve ter pelo menos 2 colunas (código e nome)')
+
+    linhas, erros = preparar_linhas(df, col_codigo, col_nome)
+
+    # Linhas vazias ou inválidas já estão resolvidas após a validação
+    processadas = len(df) - len(linhas)
+    atualizar_tarefa(tarefa_id, total_linhas=len(df), linhas_processadas=processadas, erros=erros)
+
+    existentes = dict(db.session.query(Produto.codigo, Produto.nome))
+    produtos_criados = 0
+    produtos_atualizados = 0
+
+    try:
+        for lote in em_lotes(linhas):
+            criados, atualizados = aplicar_importacao(lote, existentes=existentes)
+            db.session.commit()
+
+            processadas += len(lote)
+            produtos_criados += criados
+            produtos_atualizados += atualizados
+            atualizar_tarefa(
+                tarefa_id,
+                linhas_processadas=processadas,
+                produtos_criados=produtos_criados,
+                produtos_atualizados=produtos_atualizados
+            )
+    except Exception:
+        db.session.rollback()
+        raise
+
+    atualizar_tarefa(
+        tarefa_id,
+        message=f'Importação concluída: {produtos_criados} criados, {produtos_atualizados} atualizados'
+    )
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# Acima deste número de instruções SQL por requisição é registrado um aviso no log
+ORCAMENTO_CONSULTAS = int(os.environ.get('METRICAS_ORCAMENTO_CONSULTAS', '25'))
+
+# Limites (segundos) dos buckets do histograma de duração
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricasEndpoint:
+    """Totais acumulados de um endpoint (método, rota e status) neste worker"""
+
+    __slots__ = ('requisicoes', 'duracao', 'buckets', 'consultas', 'tempo_sql', 'bytes')
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.duracao = 0.0
+        self.buckets = [0] * len(BUCKETS_DURACAO)
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.bytes = 0
+
+
+class Medicao:
+    """Medição da requisição em andamento (guardada em g.medicao)"""
+
+    __slots__ = ('inicio', 'consultas', 'tempo_sql')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_sql = 0.0
+
+
+metricas = {}
+trava_metricas = threading.Lock()
+
+
+def registrar_requisicao(chave, duracao, consultas, tempo_sql, tamanho):
+    with trava_metricas:
+        item = metricas.get(chave)
+        if item is None:
+            item = metricas[chave] = MetricasEndpoint()
+        item.requisicoes += 1
+        item.duracao += duracao
+        for posicao, limite in enumerate(BUCKETS_DURACAO):
+            if duracao <= limite:
+                item.buckets[posicao] += 1
+        item.consultas += consultas
+        item.tempo_sql += tempo_sql
+        item.bytes += tamanho
+
+
+def copiar_metricas():
+    with trava_metricas:
+        return {
+            chave: (item.requisicoes, item.duracao, list(item.buckets), item.consultas,
+                    item.tempo_sql, item.bytes)
+            for chave, item in metricas.items()
+        }
+
+
+def registrar_instrumentacao(app, engine):
+    """
+    Mede cada requisição (duração, instruções SQL, tempo no banco e tamanho
+    da resposta), envia o cabeçalho Server-Timing e acumula os totais por
+    endpoint para GET /api/metrics
+    """
+    if event.contains(engine, 'before_cursor_execute', antes_sql):
+        return
+
+    event.listen(engine, 'before_cursor_execute', antes_sql)
+    event.listen(engine, 'after_cursor_execute', depois_sql)
+    app.before_request(iniciar_medicao)
+    app.after_request(concluir_medicao)
+
+
+def medicao_atual():
+    return g.get('medicao') if has_request_context() else None
+
+
+def antes_sql(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and medicao_atual() is not None:
+        context.medicao_inicio_sql = time.perf_counter()
+
+
+def depois_sql(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, 'medicao_inicio_sql', None)
+    medicao = medicao_atual()
+    if inicio is not None and medicao is not None:
+        medicao.tempo_sql += time.perf_counter() - inicio
+        medicao.consultas += 1
+
+
+def iniciar_medicao():
+    g.medicao = Medicao()
+
+
+def concluir_medicao(response):
+    medicao = g.get('medicao')
+    if medicao is None:
+        return response
+
+    rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+    chave = (request.method, rota, response.status_code)
+    duracao = time.perf_counter() - medicao.inicio
+
+    response.headers['Server-Timing'] = (
+        f'app;dur={duracao * 1000:.1f}, '
+        f'db;dur={medicao.tempo_sql * 1000:.1f};desc="{medicao.consultas} consultas"'
+    )
+
+    if medicao.consultas > ORCAMENTO_CONSULTAS:
+        current_app.logger.warning(
+            '%s %s executou %d instruções SQL (orçamento: %d)',
+            request.method, request.full_path.rstrip('?'), medicao.consultas, ORCAMENTO_CONSULTAS
+        )
+
+    if response.is_streamed:
+        # Respostas em partes: os totais são registrados quando o envio termina,
+        # incluindo as consultas feitas durante o envio (stream_with_context)
+        response.response = contar_envio(response.response, chave, medicao)
+    else:
+        registrar_requisicao(chave, duracao, medicao.consultas, medicao.tempo_sql,
+                             response.calculate_content_length() or 0)
+    return response
+
+
+def contar_envio(partes, chave, medicao):
+    """Repassa as partes da resposta somando os bytes enviados"""
+    tamanho = 0
+    try:
+        for parte in partes:
+            tamanho += len(parte)
+            yield parte
+    finally:
+        if hasattr(partes, 'close'):
+            partes.close()
+        registrar_requisicao(chave, time.perf_counter() - medicao.inicio, medicao.consultas,
+                             medicao.tempo_sql, tamanho)
+
+
+def formatar_rotulos(rotulos):
+    return ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"'))
+        for nome, valor in rotulos
+    )
+
+
+def gerar_prometheus(pool=None):
+    """Métricas deste worker no formato texto do Prometheus"""
+    worker = os.getpid()
+    linhas = []
+
+    def metrica(nome, tipo, ajuda, valores):
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for rotulos, valor in valores:
+            linhas.append(f'{nome}{{{formatar_rotulos(rotulos)}}} {valor}')
+
+    dados = sorted(copiar_metricas().items())
+
+    def rotulos_de(chave):
+        metodo, rota, status = chave
+        return [('worker', worker), ('metodo', metodo), ('rota', rota), ('status', status)]
+
+    metrica('estoque_http_requisicoes_total', 'counter', 'Requisições atendidas',
+            [(rotulos_de(chave), valores[0]) for chave, valores in dados])
+
+    histograma = []
+    for chave, (requisicoes, duracao, buckets, *_resto) in dados:
+        rotulos = rotulos_de(chave)
+        for limite, quantidade in zip(BUCKETS_DURACAO, buckets):
+            histograma.append(('estoque_http_duracao_segundos_bucket', rotulos + [('le', limite)], quantidade))
+        histograma.append(('estoque_http_duracao_segundos_bucket', rotulos + [('le', '+Inf')], requisicoes))
+        histograma.append(('estoque_http_duracao_segundos_sum', rotulos, round(duracao, 6)))
+        histograma.append(('estoque_http_duracao_segundos_count', rotulos, requisicoes))
+    linhas.append('# HELP estoque_http_duracao_segundos Duração das requisições')
+    linhas.append('# TYPE estoque_http_duracao_segundos histogram')
+    for nome, rotulos, valor in histograma:
+        linhas.append(f'{nome}{{{formatar_rotulos(rotulos)}}} {valor}')
+
+    metrica('estoque_http_consultas_sql_total', 'counter', 'Instruções SQL executadas',
+            [(rotulos_de(chave), valores[3]) for chave, valores in dados])
+    metrica('estoque_http_tempo_sql_segundos_total', 'counter', 'Tempo gasto no banco',
+            [(rotulos_de(chave), round(valores[4], 6)) for chave, valores in dados])
+    metrica('estoque_http_resposta_bytes_total', 'counter', 'Bytes enviados nas respostas',
+            [(rotulos_de(chave), valores[5]) for chave, valores in dados])
+
+    if pool:
+        for nome in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if nome in pool:
+                metrica(f'estoque_pool_{nome}', 'gauge', f'Pool de conexões: {nome}',
+                        [([('worker', worker)], pool[nome])])
+        for nome in ('conexoes_abertas', 'checkouts', 'checkins', 'invalidadas'):
+            metrica(f'estoque_pool_{nome}_total', 'counter', f'Pool de conexões: {nome}',
+                    [([('worker', worker)], pool[nome])])
+
+    return '\n'.join(linhas) + '\n'
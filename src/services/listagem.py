@@ -0,0 +1,338 @@
+import base64
+import json
+from operator import itemgetter
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem
+from sqlalchemy import tuple_
+
+# Tamanho de página usado quando só o cursor é informado, e o máximo aceito
+PAGINA_PADRAO = 500
+PAGINA_MAXIMA = 5000
+
+
+def formatar_data(valor):
+    return valor.isoformat() if valor else None
+
+
+def formatar_validade(mes, ano):
+    return f"{mes:02d}/{ano}"
+
+
+def valor_direto(valor):
+    return valor
+
+
+# Campo -> (colunas selecionadas, função que monta o valor a partir delas).
+# Mesmos campos e formatos do to_dict() dos modelos.
+CAMPOS_PRODUTO = {
+    'id': ((Produto.id,), valor_direto),
+    'codigo': ((Produto.codigo,), valor_direto),
+    'nome': ((Produto.nome,), valor_direto),
+    'created_at': ((Produto.created_at,), formatar_data),
+}
+
+CAMPOS_CONTAGEM = {
+    'id': ((Contagem.id,), valor_direto),
+    'produto_id': ((Contagem.produto_id,), valor_direto),
+    'lote': ((Contagem.lote,), valor_direto),
+    'validade_mes': ((Contagem.validade_mes,), valor_direto),
+    'validade_ano': ((Contagem.validade_ano,), valor_direto),
+    'validade_formatada': ((Contagem.validade_mes, Contagem.validade_ano), formatar_validade),
+    'quantidade': ((Contagem.quantidade,), valor_direto),
+    'created_at': ((Contagem.created_at,), formatar_data),
+    'updated_at': ((Contagem.updated_at,), formatar_data),
+}
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro de listagem (fields, limite ou cursor) inválido"""
+
+
+def codificar_cursor(valores):
+    """Cursor opaco com os valores da chave de ordenação da última linha"""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def decodificar_cursor(cursor, tamanho):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ParametroInvalido('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        raise ParametroInvalido('Cursor inválido')
+    # Só valores de colunas: listas, objetos ou booleanos não chegam à consulta
+    if not all(valor is None or (isinstance(valor, (str, int, float)) and not isinstance(valor, bool))
+               for valor in valores):
+        raise ParametroInvalido('Cursor inválido')
+    return valores
+
+
+def ler_limite(args):
+    """
+    Lê o tamanho de página dos parâmetros. Retorna None quando a listagem
+    não é paginada (nem limite nem cursor informados).
+    """
+    limite = args.get('limite')
+    if limite is None:
+        return PAGINA_PADRAO if args.get('cursor') else None
+    try:
+        limite = int(limite)
+    except ValueError:
+        raise ParametroInvalido('Limite deve ser um número inteiro')
+    if limite < 1 or limite > PAGINA_MAXIMA:
+        raise ParametroInvalido(f'Limite deve estar entre 1 e {PAGINA_MAXIMA}')
+    return limite
+
+
+def ler_campos(texto, permitidos, aninhados=None):
+    """
+    Interpreta o parâmetro fields ("id,lote,produto.codigo"). Retorna a
+    lista de campos do nível principal e um dict {prefixo: [campos]} dos
+    objetos aninhados. Sem fields, retorna todos os campos.
+    """
+    aninhados = aninhados or {}
+    if not texto:
+        return list(permitidos), {prefixo: list(campos) for prefixo, campos in aninhados.items()}
+
+    principais = []
+    internos = {}
+    for campo in (c.strip() for c in texto.split(',')):
+        if not campo:
+            continue
+        prefixo, _, subcampo = campo.partition('.')
+        if prefixo in aninhados:
+            destino = internos.setdefault(prefixo, [])
+            subcampos = [subcampo] if subcampo else list(aninhados[prefixo])
+            for item in subcampos:
+                if item not in aninhados[prefixo]:
+                    raise ParametroInvalido(f'Campo inválido: {campo}')
+                if item not in destino:
+                    destino.append(item)
+        elif campo in permitidos:
+            if campo not in principais:
+                principais.append(campo)
+        else:
+            raise ParametroInvalido(f'Campo inválido: {campo}')
+
+    if not principais and not internos:
+        raise ParametroInvalido('Nenhum campo informado em fields')
+    return principais, internos
+
+
+def extrator_campo(posicoes, formatar):
+    """Função linha -> valor do campo"""
+    if formatar is valor_direto:
+        return itemgetter(posicoes[0])
+    if len(posicoes) == 1:
+        posicao = posicoes[0]
+        return lambda linha: formatar(linha[posicao])
+    obter = itemgetter(*posicoes)
+    return lambda linha: formatar(*obter(linha))
+
+
+def extrator_valores(campos):
+    """
+    Função linha -> tupla com os valores dos campos, cada um (posicoes,
+    formatar) ou uma função linha -> valor. Se todos são colunas sem
+    formatação, um único itemgetter lê a tupla inteira.
+    """
+    if not campos:
+        return lambda linha: ()
+    if all(isinstance(campo, tuple) and campo[1] is valor_direto for campo in campos):
+        posicoes = [campo[0][0] for campo in campos]
+        if len(posicoes) == 1:
+            posicao = posicoes[0]
+            return lambda linha: (linha[posicao],)
+        return itemgetter(*posicoes)
+    extratores = [extrator_campo(*campo) if isinstance(campo, tuple) else campo for campo in campos]
+    return lambda linha: tuple([extrair(linha) for extrair in extratores])
+
+
+class Projecao:
+    """
+    Seleciona apenas as colunas necessárias para os campos pedidos e
+    monta os dicts de saída a partir das tuplas retornadas pelo banco
+    """
+
+    def __init__(self):
+        self.colunas = []
+        self.posicoes = {}
+        self.montadores = []
+        self.compilados = {}
+
+    def coluna(self, coluna):
+        """Registra uma coluna (sem repetir) e retorna sua posição na linha"""
+        chave = coluna.key, coluna.table.name
+        if chave not in self.posicoes:
+            self.posicoes[chave] = len(self.colunas)
+            self.colunas.append(coluna)
+        return self.posicoes[chave]
+
+    def campos(self, nomes, especificacao, destino=None):
+        for nome in nomes:
+            colunas, formatar = especificacao[nome]
+            posicoes = [self.coluna(c) for c in colunas]
+            self.montadores.append((destino, nome, posicoes, formatar))
+        self.compilados.clear()
+
+    def montador(self, destino=None, aninhados=True):
+        """
+        Função linha -> dict com os campos de destino (None = nível principal,
+        com os objetos aninhados se aninhados=True). É montada uma única vez:
+        a cada linha só lê os valores (extrator_valores) e faz dict(zip(nomes, valores)).
+        """
+        chave = destino, aninhados
+        if chave not in self.compilados:
+            # Objetos aninhados entram na posição do primeiro campo, como em um dict montado campo a campo
+            nomes = []
+            campos = []
+            grupos = set()
+            for grupo, nome, posicoes, formatar in self.montadores:
+                if grupo == destino:
+                    nomes.append(nome)
+                    campos.append((posicoes, formatar))
+                elif destino is None and aninhados and grupo not in grupos:
+                    grupos.add(grupo)
+                    nomes.append(grupo)
+                    campos.append(self.montador(grupo))
+
+            nomes = tuple(nomes)
+            valores = extrator_valores(campos)
+            self.compilados[chave] = lambda linha: dict(zip(nomes, valores(linha)))
+        return self.compilados[chave]
+
+    def montar(self, linha):
+        return self.montador()(linha)
+
+    def nomes_campos(self):
+        """Nomes dos campos na ordem de registro ('produto.codigo' nos aninhados)"""
+        return [nome if destino is None else f'{destino}.{nome}' for destino, nome, _, _ in self.montadores]
+
+    def montador_tupla(self):
+        """Função linha -> tupla com os valores na ordem de nomes_campos() (saídas tabulares)"""
+        if 'tupla' not in self.compilados:
+            self.compilados['tupla'] = extrator_valores(
+                [(posicoes, formatar) for _, _, posicoes, formatar in self.montadores]
+            )
+        return self.compilados['tupla']
+
+
+def ler_pagina(query, chave, limite, cursor, posicoes_chave):
+    """Aplica o cursor (keyset) e o limite; retorna (linhas, proximo_cursor)"""
+    if cursor:
+        valores = decodificar_cursor(cursor, len(chave))
+        query = query.filter(tuple_(*chave) > tuple_(*valores))
+
+    if limite is not None:
+        query = query.limit(limite + 1)
+
+    linhas = query.all()
+
+    proximo_cursor = None
+    if limite is not None and len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo_cursor = codificar_cursor([linhas[-1][p] for p in posicoes_chave])
+
+    return linhas, proximo_cursor
+
+
+def paginar(query, chave, limite, cursor, projecao, posicoes_chave):
+    """Como ler_pagina, mas retorna os dicts montados pela projeção"""
+    linhas, proximo_cursor = ler_pagina(query, chave, limite, cursor, posicoes_chave)
+    montar = projecao.montador()
+    return [montar(linha) for linha in linhas], proximo_cursor
+
+
+def listar_produtos_pagina(args):
+    """Lista produtos por código com projeção de campos e paginação por cursor"""
+    campos, _ = ler_campos(args.get('fields'), CAMPOS_PRODUTO)
+    limite = ler_limite(args)
+
+    projecao = Projecao()
+    projecao.campos(campos, CAMPOS_PRODUTO)
+    posicoes_chave = [projecao.coluna(Produto.codigo)]
+
+    query = db.session.query(*projecao.colunas).order_by(Produto.codigo)
+    return paginar(query, [Produto.codigo], limite, args.get('cursor'), projecao, posicoes_chave)
+
+
+def ler_normalizado(args):
+    """Parâmetro normalizado=true: produtos listados uma vez e contagens com produto_id"""
+    return args.get('normalizado', 'false').lower() == 'true'
+
+
+def consulta_contagens(campos, campos_produto):
+    """Contagens com os campos pedidos (e os do produto em 'produto'), em ordem de código e lote"""
+    projecao = Projecao()
+    projecao.campos(campos, CAMPOS_CONTAGEM)
+    projecao.campos(campos_produto, CAMPOS_PRODUTO, destino='produto')
+    posicoes_chave = [projecao.coluna(Produto.codigo), projecao.coluna(Contagem.lote)]
+
+    query = db.session.query(*projecao.colunas).select_from(Contagem).join(
+        Produto, Contagem.produto_id == Produto.id
+    ).order_by(Produto.codigo, Contagem.lote)
+    return query, projecao, posicoes_chave
+
+
+def listar_contagens_pagina(args):
+    """Lista contagens por (código, lote) com projeção de campos e paginação por cursor"""
+    campos, aninhados = ler_campos(args.get('fields'), CAMPOS_CONTAGEM, {'produto': CAMPOS_PRODUTO})
+    limite = ler_limite(args)
+
+    query, projecao, posicoes_chave = consulta_contagens(campos, aninhados.get('produto', []))
+    return paginar(
+        query, [Produto.codigo, Contagem.lote], limite, args.get('cursor'), projecao, posicoes_chave
+    )
+
+
+def listar_contagens_normalizadas(args):
+    """
+    Como listar_contagens_pagina, mas cada produto da página aparece uma vez
+    em produtos e as contagens o referenciam por produto_id (sem repetir o
+    objeto produto em cada lote). Retorna (produtos, contagens, proximo_cursor).
+    """
+    campos, aninhados = ler_campos(args.get('fields'), CAMPOS_CONTAGEM, {'produto': CAMPOS_PRODUTO})
+    campos_produto = aninhados.get('produto', [])
+    limite = ler_limite(args)
+
+    # Os ids ligam as contagens aos produtos mesmo quando fields não os inclui
+    if campos_produto:
+        if 'produto_id' not in campos:
+            campos = campos + ['produto_id']
+        if 'id' not in campos_produto:
+            campos_produto = ['id'] + campos_produto
+
+    query, projecao, posicoes_chave = consulta_contagens(campos, campos_produto)
+    linhas, proximo_cursor = ler_pagina(
+        query, [Produto.codigo, Contagem.lote], limite, args.get('cursor'), posicoes_chave
+    )
+
+    montar_contagem = projecao.montador(aninhados=False)
+    contagens = [montar_contagem(linha) for linha in linhas]
+
+    produtos = []
+    if campos_produto:
+        montar_produto = projecao.montador('produto')
+        pos_produto = projecao.coluna(Produto.id)
+        # Linhas em ordem de código: os lotes de cada produto são consecutivos
+        ultimo = None
+        for linha in linhas:
+            if linha[pos_produto] != ultimo:
+                ultimo = linha[pos_produto]
+                produtos.append(montar_produto(linha))
+    return produtos, contagens, proximo_cursor
+
+
+def contagens_do_produto(produto_id):
+    """Contagens de um produto em ordem de lote (campos do to_dict()) e o total em estoque"""
+    projecao = Projecao()
+    projecao.campos(CAMPOS_CONTAGEM, CAMPOS_CONTAGEM)
+    pos_quantidade = projecao.coluna(Contagem.quantidade)
+
+    linhas = db.session.query(*projecao.colunas).filter(
+        Contagem.produto_id == produto_id
+    ).order_by(Contagem.lote).all()
+
+    montar = projecao.montador()
+    return [montar(linha) for linha in linhas], sum(linha[pos_quantidade] for linha in linhas)
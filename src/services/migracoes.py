@@ -0,0 +1,59 @@
+from sqlalchemy import inspect, text
+from src.database import db
+
+
+def adicionar_validade_chave():
+    """Cria e preenche contagens.validade_chave (ano * 12 + mês) em bancos antigos"""
+    colunas = {coluna['name'] for coluna in inspect(db.engine).get_columns('contagens')}
+    if 'validade_chave' in colunas:
+        return
+
+    with db.engine.begin() as conexao:
+        conexao.execute(text(
+            'ALTER TABLE contagens ADD COLUMN validade_chave INTEGER NOT NULL DEFAULT 0'
+        ))
+        conexao.execute(text(
+            'UPDATE contagens SET validade_chave = validade_ano * 12 + validade_mes'
+        ))
+
+
+def adicionar_sequencia():
+    """
+    Cria contagens.sequencia (feed de alterações) em bancos antigos. As
+    contagens existentes ficam na posição 0, antes de qualquer alteração.
+    """
+    colunas = {coluna['name'] for coluna in inspect(db.engine).get_columns('contagens')}
+    if 'sequencia' in colunas:
+        return
+
+    with db.engine.begin() as conexao:
+        conexao.execute(text('ALTER TABLE contagens ADD COLUMN sequencia BIGINT'))
+        conexao.execute(text('UPDATE contagens SET sequencia = 0'))
+
+
+def criar_indices_faltantes():
+    """
+    Cria os índices declarados nos modelos que ainda não existem no banco
+    (db.create_all só cria índices junto com tabelas novas)
+    """
+    existentes = {}
+    inspetor = inspect(db.engine)
+    for tabela in db.metadata.sorted_tables:
+        if tabela.name not in existentes:
+            existentes[tabela.name] = {indice['name'] for indice in inspetor.get_indexes(tabela.name)}
+        for indice in tabela.indexes:
+            if indice.name not in existentes[tabela.name]:
+                indice.create(db.engine, checkfirst=True)
+
+
+# Migrações idempotentes, aplicadas em ordem a cada inicialização
+MIGRACOES = [
+    adicionar_validade_chave,
+    adicionar_sequencia,
+    criar_indices_faltantes,
+]
+
+
+def aplicar_migracoes():
+    for migracao in MIGRACOES:
+        migracao()
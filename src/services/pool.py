@@ -0,0 +1,152 @@
+import os
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Configuração do pool de conexões, lida das variáveis de ambiente:
+#   DB_POOL_SIZE            conexões mantidas abertas por worker (padrão 5)
+#   DB_MAX_OVERFLOW         conexões extras em picos (padrão 10)
+#   DB_POOL_TIMEOUT         segundos esperando uma conexão livre (padrão 30)
+#   DB_POOL_RECYCLE         segundos até reabrir uma conexão (padrão 280, abaixo do
+#                           tempo em que o Render derruba conexões ociosas)
+#   DB_POOL_PRE_PING        testa a conexão antes de usar (padrão true)
+#   DB_STATEMENT_TIMEOUT_MS tempo máximo de cada instrução no PostgreSQL (0 = sem limite)
+#   DB_PGBOUNCER            modo compatível com PgBouncer em transaction pooling
+
+
+def ler_int(nome, padrao):
+    valor = os.environ.get(nome)
+    return int(valor) if valor not in (None, '') else padrao
+
+
+def ler_bool(nome, padrao):
+    valor = os.environ.get(nome)
+    if valor in (None, ''):
+        return padrao
+    return valor.strip().lower() in ('1', 'true', 'sim', 'yes', 'on')
+
+
+def normalizar_url(database_url):
+    """O Render fornece postgres://, que o SQLAlchemy 2 não aceita"""
+    if database_url and database_url.startswith('postgres://'):
+        return 'postgresql://' + database_url[len('postgres://'):]
+    return database_url
+
+
+def opcoes_engine(database_url):
+    """Monta SQLALCHEMY_ENGINE_OPTIONS a partir das variáveis de ambiente"""
+    opcoes = {
+        'pool_pre_ping': ler_bool('DB_POOL_PRE_PING', True),
+        'pool_recycle': ler_int('DB_POOL_RECYCLE', 280),
+    }
+    if not database_url:
+        return opcoes
+
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite':
+        # Arquivo local: o pool padrão do SQLite já atende
+        return opcoes
+
+    opcoes.update({
+        'pool_size': ler_int('DB_POOL_SIZE', 5),
+        'max_overflow': ler_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': ler_int('DB_POOL_TIMEOUT', 30),
+    })
+
+    connect_args = {}
+    pgbouncer = ler_bool('DB_PGBOUNCER', False)
+    timeout = ler_int('DB_STATEMENT_TIMEOUT_MS', 0)
+
+    if url.get_backend_name() == 'postgresql':
+        driver = url.get_driver_name()
+        if pgbouncer:
+            # Sem prepared statements no servidor: a conexão física muda a cada transação
+            if driver == 'psycopg':
+                connect_args['prepare_threshold'] = None
+            elif driver == 'asyncpg':
+                connect_args['statement_cache_size'] = 0
+                connect_args['prepared_statement_cache_size'] = 0
+        elif timeout:
+            # O PgBouncer recusa parâmetros de inicialização; nesse modo o limite
+            # é aplicado por transação (ver registrar_eventos_pool)
+            connect_args['options'] = f'-c statement_timeout={timeout}'
+
+    if connect_args:
+        opcoes['connect_args'] = connect_args
+    return opcoes
+
+
+class EstatisticasPool:
+    """Contadores de eventos do pool deste worker"""
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.contadores = {
+            'conexoes_abertas': 0,
+            'checkouts': 0,
+            'checkins': 0,
+            'invalidadas': 0,
+        }
+
+    def somar(self, nome):
+        with self.trava:
+            self.contadores[nome] += 1
+
+    def copiar(self):
+        with self.trava:
+            return dict(self.contadores)
+
+
+estatisticas = EstatisticasPool()
+
+
+def registrar_eventos_pool(engine):
+    """Conta aberturas, checkouts e invalidações e aplica o timeout no modo PgBouncer"""
+    if event.contains(engine.pool, 'checkout', ao_checkout):
+        return
+
+    event.listen(engine.pool, 'connect', ao_conectar)
+    event.listen(engine.pool, 'checkout', ao_checkout)
+    event.listen(engine.pool, 'checkin', ao_checkin)
+    event.listen(engine.pool, 'invalidate', ao_invalidar)
+
+    timeout = ler_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if engine.dialect.name == 'postgresql' and ler_bool('DB_PGBOUNCER', False) and timeout:
+        @event.listens_for(engine, 'begin')
+        def aplicar_timeout(conexao):
+            conexao.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout}')
+
+
+def ao_conectar(dbapi_connection, connection_record):
+    estatisticas.somar('conexoes_abertas')
+
+
+def ao_checkout(dbapi_connection, connection_record, connection_proxy):
+    estatisticas.somar('checkouts')
+
+
+def ao_checkin(dbapi_connection, connection_record):
+    estatisticas.somar('checkins')
+
+
+def ao_invalidar(dbapi_connection, connection_record, exception):
+    estatisticas.somar('invalidadas')
+
+
+def estatisticas_pool(engine):
+    """Situação atual do pool e contadores acumulados deste worker"""
+    pool = engine.pool
+    situacao = {
+        'pid': os.getpid(),
+        'classe': type(pool).__name__,
+    }
+    # QueuePool informa tamanho, conexões livres, em uso e além do tamanho (overflow)
+    for nome in ('size', 'checkedin', 'checkedout', 'overflow'):
+        metodo = getattr(pool, nome, None)
+        if callable(metodo):
+            situacao[nome] = metodo()
+    if 'overflow' in situacao:
+        # O QueuePool conta o overflow a partir de -size
+        situacao['overflow'] = max(0, situacao['overflow'])
+    situacao.update(estatisticas.copiar())
+    return situacao
@@ -0,0 +1,93 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from src.services.resumo import iterar_linhas_relatorio
+from datetime import datetime
+
+CABECALHO = ['Código', 'Nome do Produto', 'Lote', 'Validade', 'Quantidade']
+LARGURAS_COLUNAS = {'A': 10, 'B': 40, 'C': 15, 'D': 12, 'E': 12}
+
+# Mesmos estilos usados antes via pandas + openpyxl
+borda_fina = Side(style='thin')
+header_border = Border(left=borda_fina, right=borda_fina, top=borda_fina, bottom=borda_fina)
+header_font = Font(bold=True, color="FFFFFF")
+header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+subtotal_fill = PatternFill(start_color="D9E2F3", end_color="D9E2F3", fill_type="solid")
+total_fill = PatternFill(start_color="B4C6E7", end_color="B4C6E7", fill_type="solid")
+bold_font = Font(bold=True)
+title_font = Font(bold=True, size=14)
+
+PREENCHIMENTO_LINHA = {
+    'Subtotal': subtotal_fill,
+    'Total': total_fill,
+}
+
+
+def celula(worksheet, valor, font=None, fill=None, alignment=None, border=None):
+    """Cria uma célula de planilha write-only com o estilo informado"""
+    cell = WriteOnlyCell(worksheet, value=valor)
+    if font is not None:
+        cell.font = font
+    if fill is not None:
+        cell.fill = fill
+    if alignment is not None:
+        cell.alignment = alignment
+    if border is not None:
+        cell.border = border
+    return cell
+
+
+def gerar_excel(arquivo, incluir_zerados=True):
+    """
+    Escreve o relatório de estoque em XLSX no arquivo informado, em modo
+    write-only: cada linha é estilizada e gravada assim que sai do cursor
+    """
+    workbook = Workbook(write_only=True)
+
+    # Aba principal
+    worksheet = workbook.create_sheet('Relatório de Estoque')
+    for coluna, largura in LARGURAS_COLUNAS.items():
+        worksheet.column_dimensions[coluna].width = largura
+
+    worksheet.append([
+        celula(worksheet, titulo, font=header_font, fill=header_fill,
+               alignment=Alignment(horizontal="center"), border=header_border)
+        for titulo in CABECALHO
+    ])
+
+    total_geral = 0
+    total_itens = 0
+
+    for codigo, nome, lote, validade, quantidade, tipo in iterar_linhas_relatorio(incluir_zerados):
+        valores = [codigo, nome, lote, validade, quantidade]
+
+        if tipo == 'Item':
+            total_itens += 1
+            worksheet.append(valores)
+        else:
+            if tipo == 'Total':
+                total_geral = quantidade
+            fill = PREENCHIMENTO_LINHA[tipo]
+            worksheet.append([celula(worksheet, v, font=bold_font, fill=fill) for v in valores])
+
+    # Aba de informações do relatório
+    info_worksheet = workbook.create_sheet('Informações')
+    info_worksheet.column_dimensions['A'].width = 50
+
+    filtro_texto = "Todos os itens" if incluir_zerados else "Apenas itens com estoque"
+    info_worksheet.append([
+        celula(info_worksheet, 'Informações', font=title_font,
+               alignment=Alignment(horizontal="center", vertical="top"), border=header_border)
+    ])
+    for linha in [
+        'Relatório de Estoque',
+        f'Gerado em: {datetime.now().strftime("%d/%m/%Y %H:%M")}',
+        f'Filtro: {filtro_texto}',
+        f'Total de Produtos: {total_itens}',
+        f'Total Geral: {total_geral} unidades',
+        ''
+    ]:
+        info_worksheet.append([linha])
+
+    workbook.save(arquivo)
+
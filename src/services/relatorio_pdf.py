@@ -0,0 +1,157 @@
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER
+from src.services.resumo import iterar_linhas_relatorio
+from datetime import datetime
+
+CABECALHO = ['Código', 'Nome do Produto', 'Lote', 'Validade', 'Qtd']
+LARGURAS_COLUNAS = [1*inch, 3*inch, 1.5*inch, 1*inch, 0.8*inch]
+
+# Altura fixa das linhas: permite calcular quantas cabem em cada página
+ALTURA_LINHA = 18
+
+ESTILO_BASE = [
+    # Cabeçalho
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (4, 0), (4, -1), 'RIGHT'),  # Quantidade alinhada à direita
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+
+    # Corpo da tabela
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+]
+
+ESTILO_LINHA = {
+    'Subtotal': (colors.lightblue, 'Helvetica-Bold'),
+    'Total': (colors.lightgrey, 'Helvetica-Bold'),
+}
+
+
+class FluxoSobDemanda(list):
+    """
+    Lista de flowables preenchida aos poucos a partir de um gerador.
+    O reportlab consome a lista pela frente; mantendo só alguns itens
+    carregados, a memória não depende do tamanho do relatório.
+    """
+
+    def __init__(self, gerador, minimo=2):
+        super().__init__()
+        self.gerador = gerador
+        self.minimo = minimo
+
+    def __len__(self):
+        while super().__len__() < self.minimo:
+            try:
+                self.append(next(self.gerador))
+            except StopIteration:
+                break
+        return super().__len__()
+
+
+def montar_tabela(linhas, estilos):
+    """Cria uma tabela de uma página com cabeçalho e destaque de subtotais"""
+    tabela = Table(
+        [CABECALHO] + linhas,
+        colWidths=LARGURAS_COLUNAS,
+        rowHeights=ALTURA_LINHA,
+        repeatRows=1
+    )
+    tabela.setStyle(TableStyle(ESTILO_BASE + estilos))
+    return tabela
+
+
+def blocos_tabela(linhas, capacidade_primeira, capacidade):
+    """
+    Agrupa as linhas do relatório em tabelas do tamanho de uma página,
+    aplicando o estilo de subtotal/total na mesma passada
+    """
+    bloco = []
+    estilos = []
+    limite = capacidade_primeira
+
+    for codigo, nome, lote, validade, quantidade, tipo in linhas:
+        bloco.append([codigo, nome, lote, validade, str(quantidade)])
+
+        if tipo in ESTILO_LINHA:
+            fundo, fonte = ESTILO_LINHA[tipo]
+            row = len(bloco)
+            estilos.append(('BACKGROUND', (0, row), (-1, row), fundo))
+            estilos.append(('FONTNAME', (0, row), (-1, row), fonte))
+
+        if len(bloco) >= limite:
+            yield montar_tabela(bloco, estilos)
+            bloco = []
+            estilos = []
+            limite = capacidade
+
+    if bloco:
+        yield montar_tabela(bloco, estilos)
+
+
+def gerar_pdf(arquivo, incluir_zerados=True):
+    """Escreve o relatório de estoque em PDF no arquivo informado"""
+    doc = SimpleDocTemplate(
+        arquivo,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=18
+    )
+
+    # Estilos
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=20,
+        alignment=TA_CENTER,
+        fontName='Helvetica'
+    )
+
+    # Título, data de geração e informação do filtro
+    data_atual = datetime.now().strftime("%d/%m/%Y %H:%M")
+    filtro_texto = "Todos os itens" if incluir_zerados else "Apenas itens com estoque"
+    cabecalho = [
+        Paragraph("Relatório de Estoque", title_style),
+        Paragraph(f"Gerado em: {data_atual}", subtitle_style),
+        Paragraph(f"Relatório de Estoque - Detalhado por Lote ({filtro_texto})", subtitle_style),
+    ]
+
+    # Linhas por página (descontando o cabeçalho da tabela e o padding do frame)
+    altura_util = doc.height - 12
+    altura_cabecalho = sum(
+        p.wrap(doc.width, altura_util)[1] + p.getSpaceBefore() + p.getSpaceAfter()
+        for p in cabecalho
+    )
+    capacidade = int(altura_util // ALTURA_LINHA) - 1
+    capacidade_primeira = int((altura_util - altura_cabecalho) // ALTURA_LINHA) - 1
+
+    def flowables():
+        yield from cabecalho
+        yield from blocos_tabela(
+            iterar_linhas_relatorio(incluir_zerados),
+            capacidade_primeira,
+            capacidade
+        )
+
+    doc.build(FluxoSobDemanda(flowables()))
+
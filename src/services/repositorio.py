@@ -0,0 +1,83 @@
+from abc import ABC, abstractmethod
+from flask import current_app
+
+# Backends disponíveis (app.config['ESTOQUE_BACKEND'], escolhido em init_database;
+# variável ESTOQUE_BACKEND na variante src/main_final.py)
+BACKENDS = ('sqlite', 'sqlalchemy')
+
+
+class ProdutoExistente(ValueError):
+    """Já existe um produto com o código informado"""
+
+
+class ChavesRepetidas(Exception):
+    """Chaves de idempotência já registradas: nada foi aplicado (rollback)"""
+
+    def __init__(self, chaves):
+        super().__init__(f'{len(chaves)} chaves de idempotência já registradas')
+        self.chaves = chaves
+
+
+class Repositorio(ABC):
+    """
+    Operações de estoque comuns às duas aplicações (src/main.py e
+    src/main_final.py), cada uma em uma única instrução SQL por conjunto:
+
+    - RepositorioSQLAlchemy: modelos do SQLAlchemy (PostgreSQL em produção,
+      SQLite local), com totais por produto, feed de alterações e cache do
+      catálogo mantidos a cada escrita
+    - RepositorioSQLite: sqlite3 direto sobre o esquema simplificado da
+      variante de filiais, com conexões persistentes em modo WAL
+
+    Os dois backends retornam dicts com as mesmas chaves e datas em ISO 8601
+    (os de Produto.to_dict() e Contagem.to_dict()), conferidos por
+    bench/bench_repositorios.py.
+    """
+
+    @abstractmethod
+    def buscar_produto(self, codigo_formatado):
+        """Produto pelo código de 4 dígitos (id, codigo, nome e to_dict()) ou None"""
+
+    @abstractmethod
+    def listar_produtos(self):
+        """Todos os produtos (dicts) em ordem de código"""
+
+    @abstractmethod
+    def criar_produto(self, codigo_formatado, nome):
+        """Cria e retorna o produto; ProdutoExistente se o código já existe"""
+
+    @abstractmethod
+    def somar_contagens(self, itens, chaves=()):
+        """
+        Soma as quantidades aos lotes (upsert de todos os itens em uma
+        transação, criando os lotes novos) e faz o commit. Os itens são dicts
+        com produto_id, lote, validade_mes, validade_ano e quantidade, sem
+        pares (produto_id, lote) repetidos. As chaves de idempotência são
+        registradas na mesma transação, antes do upsert; se alguma já existia,
+        nada é aplicado e ChavesRepetidas informa quais.
+        Retorna {(produto_id, lote): (contagem, criou_novo)}.
+        """
+
+    @abstractmethod
+    def contagens_do_produto(self, produto):
+        """Contagens (dicts) do produto em ordem de lote e a soma das quantidades"""
+
+    @abstractmethod
+    def resumo(self, incluir_zerados=True):
+        """
+        Lista por produto ({'produto', 'contagens', 'total_quantidade'}) em
+        ordem de código e o total geral, a partir de uma única consulta
+        """
+
+    @abstractmethod
+    def exportar(self, args):
+        """
+        Interpreta format (ndjson ou csv) e fields e retorna (formato,
+        gerador das partes da resposta) com todas as contagens. Erros nos
+        parâmetros (ParametroInvalido) são levantados antes do envio.
+        """
+
+
+def obter_repositorio():
+    """Repositório configurado na aplicação atual"""
+    return current_app.extensions['repositorio']
@@ -0,0 +1,61 @@
+from sqlalchemy.exc import IntegrityError
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem
+from src.models.chave_idempotencia import ChaveIdempotencia
+from src.services.cache_produtos import buscar_produto_cache
+from src.services.exportacao import GERADORES, consulta_exportacao
+from src.services.listagem import listar_produtos_pagina, contagens_do_produto
+from src.services.repositorio import Repositorio, ProdutoExistente, ChavesRepetidas
+from src.services.resumo import montar_resumo
+
+
+class RepositorioSQLAlchemy(Repositorio):
+    """
+    Backend dos modelos do SQLAlchemy. No PostgreSQL: upsert com
+    INSERT ... ON CONFLICT ... RETURNING, resumo em uma consulta com os
+    totais de estoque_totais e exportação por cursor do servidor.
+    """
+
+    def buscar_produto(self, codigo_formatado):
+        # Catálogo em memória, recarregado quando algum produto muda
+        return buscar_produto_cache(codigo_formatado)
+
+    def listar_produtos(self):
+        produtos, _ = listar_produtos_pagina({})
+        return produtos
+
+    def criar_produto(self, codigo_formatado, nome):
+        produto = Produto(codigo_formatado, nome)
+        db.session.add(produto)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Índice único do código: sem consulta prévia de existência
+            db.session.rollback()
+            raise ProdutoExistente(f'Produto com código {codigo_formatado} já existe')
+        return produto
+
+    def somar_contagens(self, itens, chaves=()):
+        repetidas = ChaveIdempotencia.registrar(chaves)
+        if repetidas:
+            db.session.rollback()
+            raise ChavesRepetidas(repetidas)
+
+        aplicadas = Contagem.somar_em_lote(itens)
+        resultado = {
+            chave: (Contagem.dict_da_linha(linha), criou_novo)
+            for chave, (linha, criou_novo) in aplicadas.items()
+        }
+        db.session.commit()
+        return resultado
+
+    def contagens_do_produto(self, produto):
+        return contagens_do_produto(produto.id)
+
+    def resumo(self, incluir_zerados=True):
+        return montar_resumo(incluir_zerados)
+
+    def exportar(self, args):
+        formato, query, projecao = consulta_exportacao(args)
+        return formato, GERADORES[formato](query, projecao)
@@ -0,0 +1,332 @@
+import csv
+import io
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+from src.services.listagem import ParametroInvalido, ler_campos
+from src.services.repositorio import Repositorio, ProdutoExistente, ChavesRepetidas
+from src.services.serializacao import linha_json
+
+# Ajustes de cada conexão: synchronous=NORMAL só sincroniza o disco nos
+# checkpoints (seguro com WAL), busy_timeout espera o bloqueio de escrita
+# em vez de falhar com "database is locked" e mmap_size lê o arquivo
+# mapeado em memória
+PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    # WAL fica gravado no arquivo do banco; nas conexões seguintes é só uma
+    # verificação. Roda em toda conexão: a primeira pode ser a de criar_tabelas
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA mmap_size=268435456',
+)
+
+# Instruções preparadas mantidas por conexão (reaproveitadas pelo texto do SQL)
+CACHE_INSTRUCOES = 64
+
+# Linhas por instrução de upsert (5 parâmetros por linha) e por leitura na exportação
+TAMANHO_LOTE_UPSERT = 500
+LOTE_LEITURA = 1000
+
+ESQUEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS produtos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codigo TEXT UNIQUE NOT NULL,
+        nome TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS contagens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produto_id INTEGER NOT NULL,
+        lote TEXT NOT NULL,
+        validade_mes INTEGER NOT NULL,
+        validade_ano INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (produto_id) REFERENCES produtos (id),
+        UNIQUE(produto_id, lote)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS chaves_idempotencia (
+        chave TEXT PRIMARY KEY,
+        registrada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+)
+
+
+
+def iso(coluna):
+    """
+    Data gravada por CURRENT_TIMESTAMP ('AAAA-MM-DD HH:MM:SS') em ISO 8601,
+    o formato do isoformat() usado pelo backend SQLAlchemy
+    """
+    return f"replace({coluna}, ' ', 'T')"
+
+
+COLUNAS_PRODUTO = f"p.id, p.codigo, p.nome, {iso('p.created_at')}"
+COLUNAS_CONTAGEM = (
+    'c.id, c.produto_id, c.lote, c.validade_mes, c.validade_ano, c.quantidade, '
+    f"{iso('c.created_at')}, {iso('c.updated_at')}"
+)
+
+# Campos da exportação (parâmetro fields) e a expressão SQL de cada um
+CAMPOS_CONTAGEM = {
+    'id': 'c.id',
+    'produto_id': 'c.produto_id',
+    'lote': 'c.lote',
+    'validade_mes': 'c.validade_mes',
+    'validade_ano': 'c.validade_ano',
+    'validade_formatada': "printf('%02d/%d', c.validade_mes, c.validade_ano)",
+    'quantidade': 'c.quantidade',
+    'created_at': iso('c.created_at'),
+    'updated_at': iso('c.updated_at'),
+}
+CAMPOS_PRODUTO = {
+    'id': 'p.id',
+    'codigo': 'p.codigo',
+    'nome': 'p.nome',
+    'created_at': iso('p.created_at'),
+}
+
+
+class ProdutoSQLite(namedtuple('ProdutoSQLite', ['id', 'codigo', 'nome', 'created_at'])):
+    __slots__ = ()
+
+    def to_dict(self):
+        return self._asdict()
+
+
+def contagem_dict(linha):
+    """Linha com as colunas de COLUNAS_CONTAGEM, no formato do Contagem.to_dict()"""
+    contagem_id, produto_id, lote, mes, ano, quantidade, created_at, updated_at = linha
+    return {
+        'id': contagem_id,
+        'produto_id': produto_id,
+        'lote': lote,
+        'validade_mes': mes,
+        'validade_ano': ano,
+        'validade_formatada': f"{mes:02d}/{ano}",
+        'quantidade': quantidade,
+        'created_at': created_at,
+        'updated_at': updated_at
+    }
+
+
+class RepositorioSQLite(Repositorio):
+    """Backend sqlite3 da variante de filiais (src/main_final.py)"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conexoes = threading.local()
+
+    def conectar(self):
+        """
+        Conexão persistente da thread atual, aberta e configurada no primeiro
+        uso. Sem transação implícita: cada leitura vê o último commit e, em
+        modo WAL, não espera as escritas de outras threads.
+        """
+        conn = getattr(self._conexoes, 'conn', None)
+        # Depois de um fork (workers do gunicorn) a conexão herdada não é reutilizada
+        if conn is None or self._conexoes.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, isolation_level=None, cached_statements=CACHE_INSTRUCOES)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._conexoes.conn = conn
+            self._conexoes.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transacao(self):
+        """
+        Transação de escrita. BEGIN IMMEDIATE reserva o bloqueio de escrita
+        antes da primeira leitura: escritas simultâneas esperam a vez (até o
+        busy_timeout) em vez de falhar ao passar de leitura para escrita.
+        """
+        conn = self.conectar()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def criar_tabelas(self):
+        """Cria as tabelas e acrescenta as colunas que faltam em bancos anteriores a elas"""
+        with self.transacao() as conn:
+            for instrucao in ESQUEMA:
+                conn.execute(instrucao)
+            colunas = {linha[1] for linha in conn.execute('PRAGMA table_info(contagens)')}
+            if 'updated_at' not in colunas:
+                # ADD COLUMN não aceita DEFAULT CURRENT_TIMESTAMP: o upsert informa o valor
+                conn.execute('ALTER TABLE contagens ADD COLUMN updated_at TIMESTAMP')
+
+    def buscar_produto(self, codigo_formatado):
+        linha = self.conectar().execute(
+            f'SELECT {COLUNAS_PRODUTO} FROM produtos p WHERE p.codigo = ?', (codigo_formatado,)
+        ).fetchone()
+        return ProdutoSQLite(*linha) if linha else None
+
+    def listar_produtos(self):
+        return [
+            ProdutoSQLite(*linha).to_dict()
+            for linha in self.conectar().execute(
+                f'SELECT {COLUNAS_PRODUTO} FROM produtos p ORDER BY p.codigo'
+            )
+        ]
+
+    def criar_produto(self, codigo_formatado, nome):
+        try:
+            with self.transacao() as conn:
+                linha = conn.execute(
+                    'INSERT INTO produtos (codigo, nome) VALUES (?, ?) '
+                    f"RETURNING id, codigo, nome, {iso('created_at')}",
+                    (codigo_formatado, nome)
+                ).fetchone()
+        except sqlite3.IntegrityError:
+            raise ProdutoExistente(f'Produto com código {codigo_formatado} já existe')
+        return ProdutoSQLite(*linha)
+
+    def somar_contagens(self, itens, chaves=()):
+        valores = [
+            (item['produto_id'], item['lote'].strip().upper(), int(item['validade_mes']),
+             int(item['validade_ano']), int(item['quantidade']))
+            for item in itens
+        ]
+
+        resultado = {}
+        chaves = list(chaves)
+        with self.transacao() as conn:
+            inseridas = set()
+            for inicio in range(0, len(chaves), TAMANHO_LOTE_UPSERT):
+                parte = chaves[inicio:inicio + TAMANHO_LOTE_UPSERT]
+                inseridas.update(chave for chave, in conn.execute(
+                    'INSERT INTO chaves_idempotencia (chave) VALUES ' + ', '.join(['(?)'] * len(parte)) + ' '
+                    'ON CONFLICT (chave) DO NOTHING RETURNING chave',
+                    parte
+                ))
+            repetidas = set(chaves) - inseridas
+            if repetidas:
+                # A exceção desfaz a transação (ROLLBACK em transacao())
+                raise ChavesRepetidas(repetidas)
+
+            # AUTOINCREMENT: ids acima do maior atual são das linhas criadas agora
+            ultimo_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM contagens').fetchone()[0]
+            for inicio in range(0, len(valores), TAMANHO_LOTE_UPSERT):
+                parte = valores[inicio:inicio + TAMANHO_LOTE_UPSERT]
+                linhas = conn.execute(
+                    'INSERT INTO contagens (produto_id, lote, validade_mes, validade_ano, quantidade, updated_at) '
+                    'VALUES ' + ', '.join(['(?, ?, ?, ?, ?, CURRENT_TIMESTAMP)'] * len(parte)) + ' '
+                    'ON CONFLICT (produto_id, lote) DO UPDATE SET quantidade = quantidade + excluded.quantidade, '
+                    'updated_at = excluded.updated_at '
+                    'RETURNING id, produto_id, lote, validade_mes, validade_ano, quantidade, '
+                    f"{iso('created_at')}, {iso('updated_at')}",
+                    [valor for linha in parte for valor in linha]
+                ).fetchall()
+                for linha in linhas:
+                    resultado[(linha[1], linha[2])] = (contagem_dict(linha), linha[0] > ultimo_id)
+        return resultado
+
+    def contagens_do_produto(self, produto):
+        contagens = [
+            contagem_dict(linha)
+            for linha in self.conectar().execute(
+                f'SELECT {COLUNAS_CONTAGEM} FROM contagens c WHERE c.produto_id = ? ORDER BY c.lote',
+                (produto.id,)
+            )
+        ]
+        return contagens, sum(c['quantidade'] for c in contagens)
+
+    def resumo(self, incluir_zerados=True):
+        filtro = '' if incluir_zerados else (
+            'WHERE p.id IN (SELECT produto_id FROM contagens GROUP BY produto_id HAVING SUM(quantidade) > 0) '
+        )
+        linhas = self.conectar().execute(
+            f'SELECT {COLUNAS_PRODUTO}, {COLUNAS_CONTAGEM} '
+            'FROM produtos p LEFT JOIN contagens c ON p.id = c.produto_id '
+            + filtro + 'ORDER BY p.codigo, c.lote'
+        )
+
+        resumo = []
+        total_geral = 0
+        for _, grupo in groupby(linhas, key=itemgetter(0)):
+            grupo = list(grupo)
+            # Produto sem contagens: uma linha com as colunas da contagem nulas
+            contagens = [contagem_dict(linha[4:]) for linha in grupo if linha[4] is not None]
+            total_produto = sum(c['quantidade'] for c in contagens)
+            resumo.append({
+                'produto': ProdutoSQLite(*grupo[0][:4]).to_dict(),
+                'contagens': contagens,
+                'total_quantidade': total_produto
+            })
+            total_geral += total_produto
+        return resumo, total_geral
+
+    def exportar(self, args):
+        formato = args.get('format', 'ndjson').lower()
+        if formato not in ('ndjson', 'csv'):
+            raise ParametroInvalido('Parâmetro format deve ser ndjson ou csv')
+        campos, aninhados = ler_campos(args.get('fields'), CAMPOS_CONTAGEM, {'produto': CAMPOS_PRODUTO})
+
+        nomes = [(campo, None) for campo in campos]
+        nomes += [(campo, 'produto') for campo in aninhados.get('produto', [])]
+        expressoes = [
+            CAMPOS_CONTAGEM[campo] if destino is None else CAMPOS_PRODUTO[campo]
+            for campo, destino in nomes
+        ]
+        sql = (
+            f'SELECT {", ".join(expressoes)} FROM contagens c JOIN produtos p ON p.id = c.produto_id '
+            'ORDER BY p.codigo, c.lote'
+        )
+        gerar = self.gerar_ndjson if formato == 'ndjson' else self.gerar_csv
+        return formato, gerar(sql, nomes)
+
+    def ler_partes(self, sql):
+        """Lê o resultado em listas de LOTE_LEITURA linhas"""
+        cursor = self.conectar().execute(sql)
+        try:
+            while True:
+                parte = cursor.fetchmany(LOTE_LEITURA)
+                if not parte:
+                    return
+                yield parte
+        finally:
+            # Cliente desconectado no meio do envio: encerra a leitura
+            cursor.close()
+
+    def gerar_ndjson(self, sql, nomes):
+        """Um objeto JSON por linha, com os campos do produto em 'produto'"""
+        principais = [(i, campo) for i, (campo, destino) in enumerate(nomes) if destino is None]
+        do_produto = [(i, campo) for i, (campo, destino) in enumerate(nomes) if destino == 'produto']
+        for parte in self.ler_partes(sql):
+            saida = []
+            for linha in parte:
+                item = {campo: linha[i] for i, campo in principais}
+                if do_produto:
+                    item['produto'] = {campo: linha[i] for i, campo in do_produto}
+                saida.append(linha_json(item))
+            yield b''.join(saida)
+
+    def gerar_csv(self, sql, nomes):
+        """Cabeçalho com os nomes dos campos ('produto.codigo' nos do produto) e uma linha por contagem"""
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+
+        # O cabeçalho sai antes da consulta ser executada
+        escritor.writerow([campo if destino is None else f'{destino}.{campo}' for campo, destino in nomes])
+        yield buffer.getvalue()
+
+        for parte in self.ler_partes(sql):
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows(parte)
+            yield buffer.getvalue()
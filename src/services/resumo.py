@@ -0,0 +1,135 @@
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import select
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem
+from src.models.estoque_total import EstoqueTotal
+from src.services.listagem import CAMPOS_CONTAGEM, CAMPOS_PRODUTO, Projecao
+
+# Colunas usadas para agrupar os lotes por produto e somar os totais
+# (lote é nulo no LEFT JOIN de produtos sem contagens)
+COLUNAS_AGRUPAMENTO = (Produto.id, Contagem.lote, Contagem.quantidade)
+
+
+def projecao_resumo():
+    """Mesmos campos do to_dict() de Produto (em 'produto') e de Contagem"""
+    projecao = Projecao()
+    projecao.campos(CAMPOS_PRODUTO, CAMPOS_PRODUTO, destino='produto')
+    projecao.campos(CAMPOS_CONTAGEM, CAMPOS_CONTAGEM)
+    return projecao
+
+
+def projecao_relatorio():
+    """Colunas lidas pelos relatórios PDF/Excel"""
+    projecao = Projecao()
+    for coluna in (Produto.codigo, Produto.nome, Contagem.lote,
+                   Contagem.validade_mes, Contagem.validade_ano, Contagem.quantidade):
+        projecao.coluna(coluna)
+    return projecao
+
+
+def consulta_estoque(projecao, incluir_zerados=True):
+    """
+    Monta a consulta única de produtos com seus lotes (LEFT JOIN),
+    ordenada por código do produto e lote, com as colunas da projeção
+    """
+    for coluna in COLUNAS_AGRUPAMENTO:
+        projecao.coluna(coluna)
+
+    query = select(*projecao.colunas).select_from(Produto).outerjoin(
+        Contagem, Contagem.produto_id == Produto.id
+    ).order_by(Produto.codigo, Contagem.lote)
+
+    if not incluir_zerados:
+        # Produtos com estoque lidos da tabela de totais (índice em quantidade_total)
+        com_estoque = select(EstoqueTotal.produto_id).where(EstoqueTotal.quantidade_total > 0)
+        query = query.where(Produto.id.in_(com_estoque))
+
+    return query
+
+
+def iterar_estoque(projecao, incluir_zerados=True, lote_leitura=1000):
+    """
+    Percorre o estoque agrupado por produto em uma única passada, lendo só
+    as colunas da projeção (tuplas, sem montar objetos do ORM). Gera tuplas
+    (linha do produto, linhas das contagens, total_produto) em ordem de código.
+    """
+    linhas = db.session.execute(
+        consulta_estoque(projecao, incluir_zerados),
+        execution_options={'yield_per': lote_leitura}
+    )
+    pos_produto, pos_lote, pos_quantidade = (projecao.coluna(c) for c in COLUNAS_AGRUPAMENTO)
+
+    for _, grupo in groupby(linhas, key=itemgetter(pos_produto)):
+        grupo = list(grupo)
+        contagens = grupo if grupo[0][pos_lote] is not None else []
+        yield grupo[0], contagens, sum(linha[pos_quantidade] for linha in contagens)
+
+
+def montar_resumo(incluir_zerados=True):
+    """Retorna a lista de resumo por produto e o total geral do estoque"""
+    resumo = []
+    total_geral = 0
+
+    projecao = projecao_resumo()
+    montar_produto = projecao.montador('produto')
+    montar_contagem = projecao.montador(aninhados=False)
+
+    for produto, contagens, total_produto in iterar_estoque(projecao, incluir_zerados):
+        resumo.append({
+            'produto': montar_produto(produto),
+            'contagens': [montar_contagem(c) for c in contagens],
+            'total_quantidade': total_produto
+        })
+        total_geral += total_produto
+
+    return resumo, total_geral
+
+
+def normalizar_resumo(resumo):
+    """
+    Formato normalizado do resumo: cada produto uma vez em produtos (com
+    total_quantidade) e as contagens de todos em uma única lista, ligadas
+    ao produto por produto_id. Retorna (produtos, contagens).
+    """
+    produtos = []
+    contagens = []
+    for item in resumo:
+        produto = item['produto']
+        produtos.append({**produto, 'total_quantidade': item['total_quantidade']})
+        for contagem in item['contagens']:
+            if 'produto_id' not in contagem:
+                contagem = {**contagem, 'produto_id': produto['id']}
+            contagens.append(contagem)
+    return produtos, contagens
+
+
+def iterar_linhas_relatorio(incluir_zerados=True):
+    """
+    Gera as linhas dos relatórios PDF/Excel já na ordem de saída.
+    Cada linha é (codigo, nome, lote, validade, quantidade, tipo), com
+    tipo 'Item', 'Subtotal' ou 'Total' (última linha, total geral).
+    """
+    total_geral = 0
+
+    projecao = projecao_relatorio()
+    # Posições das colunas de projecao_relatorio()
+    codigo, nome, lote, mes, ano, quantidade = range(6)
+
+    for produto, contagens, total_produto in iterar_estoque(projecao, incluir_zerados):
+        if contagens:
+            # Produto com contagens
+            for contagem in contagens:
+                validade = f"{contagem[mes]:02d}/{contagem[ano]}"
+                yield (produto[codigo], produto[nome], contagem[lote], validade,
+                       contagem[quantidade], 'Item')
+            yield (produto[codigo], 'Subtotal', '', '', total_produto, 'Subtotal')
+        elif incluir_zerados:
+            # Produto sem estoque (só incluir se incluir_zerados for True)
+            yield (produto[codigo], produto[nome], '-', '-', 0, 'Item')
+            yield (produto[codigo], 'Subtotal', '', '', 0, 'Subtotal')
+
+        total_geral += total_produto
+
+    yield ('', 'TOTAL GERAL', '', '', total_geral, 'Total')
@@ -0,0 +1,86 @@
+import json
+import re
+from flask import current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # opcional: sem orjson as respostas usam o jsonify do Flask
+    orjson = None
+
+# Caracteres que o json da biblioteca padrão escapa com ensure_ascii e o orjson não
+NAO_ASCII = re.compile('[^\x00-\x7e]')
+
+
+def escapar(caractere):
+    codigo = ord(caractere.group())
+    if codigo < 0x10000:
+        return '\\u%04x' % codigo
+    # Fora do plano básico: par substituto, como o json da biblioteca padrão
+    codigo -= 0x10000
+    return '\\u%04x\\u%04x' % (0xd800 | (codigo >> 10), 0xdc00 | (codigo & 0x3ff))
+
+
+def codificador_rapido_ativo():
+    """O orjson só é usado quando a saída fica idêntica à do jsonify (provedor e modo compacto padrão)"""
+    provedor = current_app.json
+    if orjson is None or type(provedor) is not DefaultJSONProvider:
+        return False
+    compacto = provedor.compact if provedor.compact is not None else not current_app.debug
+    return compacto and provedor.sort_keys and provedor.ensure_ascii
+
+
+def orjson_ascii(dados):
+    """
+    JSON compacto, com chaves ordenadas e ensure_ascii, codificado com
+    orjson; None se o orjson não estiver instalado ou recusar os dados
+    (chaves não texto, inteiros acima de 64 bits etc.)
+    """
+    if orjson is None:
+        return None
+    try:
+        corpo = orjson.dumps(dados, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return None
+    # Não basta isascii(): o DEL (\x7f) é ASCII, mas o ensure_ascii o escapa
+    if not corpo.isascii() or b'\x7f' in corpo:
+        corpo = NAO_ASCII.sub(escapar, corpo.decode()).encode()
+    return corpo
+
+
+def json_compacto(dados):
+    """
+    dados em JSON compacto (chaves ordenadas, ensure_ascii), para as
+    respostas montadas em partes: com orjson quando disponível, senão
+    com o provedor JSON da aplicação
+    """
+    corpo = orjson_ascii(dados)
+    if corpo is None:
+        corpo = current_app.json.dumps(dados, separators=(',', ':')).encode()
+    return corpo
+
+
+def resposta_json(dados, status=200):
+    """
+    Equivalente a jsonify(dados) com os mesmos bytes (chaves ordenadas,
+    ensure_ascii, separadores compactos), codificado com orjson quando
+    disponível. Para as respostas de leitura, montadas só com str, int,
+    bool e None (valores float seguem o formato do orjson).
+    """
+    if codificador_rapido_ativo():
+        corpo = orjson_ascii(dados)
+        if corpo is not None:
+            return current_app.response_class(
+                corpo + b'\n', status=status, mimetype=current_app.json.mimetype
+            )
+
+    resposta = jsonify(dados)
+    resposta.status_code = status
+    return resposta
+
+
+def linha_json(dados):
+    """Uma linha NDJSON: JSON compacto em UTF-8, chaves ordenadas, terminado em \\n"""
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(dados, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode() + b'\n'
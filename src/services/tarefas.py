@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from src.services.estado import diretorio_estado
+
+# Tarefas em segundo plano (importações) executadas em threads do próprio worker.
+# O worker que executa a tarefa grava o estado em um arquivo JSON no diretório de
+# estado compartilhado: qualquer worker do gunicorn responde à consulta de progresso.
+MAX_WORKERS = int(os.environ.get('TAREFAS_WORKERS', '2'))
+
+# Tempo (segundos) que uma tarefa finalizada continua disponível para consulta
+TEMPO_RETENCAO = 3600
+
+STATUS_FINAIS = ('concluida', 'erro')
+
+# Ids gerados por enviar_tarefa (uuid4().hex); também evita caminhos fora do diretório
+FORMATO_ID = re.compile('[0-9a-f]{32}')
+
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='tarefa')
+# Tarefas executadas por este worker (o arquivo de cada uma é reescrito a cada atualização)
+tarefas = {}
+trava = threading.Lock()
+
+
+def diretorio_tarefas():
+    diretorio = os.path.join(diretorio_estado(), 'tarefas')
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+def caminho_tarefa(tarefa_id):
+    return os.path.join(diretorio_tarefas(), f'{tarefa_id}.json')
+
+
+def gravar_tarefa(tarefa):
+    """Grava o estado da tarefa de uma vez (os.replace): leitores nunca veem um arquivo pela metade"""
+    temporario = tempfile.NamedTemporaryFile(
+        'w', dir=diretorio_tarefas(), prefix='.gravando-', suffix='.json', delete=False
+    )
+    try:
+        with temporario:
+            json.dump(tarefa, temporario)
+        os.replace(temporario.name, caminho_tarefa(tarefa['id']))
+    except Exception:
+        os.unlink(temporario.name)
+        raise
+
+
+def limpar_tarefas_antigas():
+    """Remove tarefas finalizadas (ou sem atualização) há mais de TEMPO_RETENCAO segundos"""
+    limite = time.time() - TEMPO_RETENCAO
+    with trava:
+        for tarefa_id in [
+            tarefa_id for tarefa_id, tarefa in tarefas.items()
+            if tarefa['status'] in STATUS_FINAIS and tarefa['concluida_em'] < limite
+        ]:
+            del tarefas[tarefa_id]
+
+    # Arquivos de todos os workers, inclusive de tarefas interrompidas por um reinício
+    for item in os.scandir(diretorio_tarefas()):
+        try:
+            if item.stat().st_mtime < limite:
+                os.unlink(item.path)
+        except FileNotFoundError:
+            continue
+
+
+def atualizar_tarefa(tarefa_id, **campos):
+    """Atualiza os campos de progresso de uma tarefa"""
+    with trava:
+        tarefa = tarefas[tarefa_id]
+        tarefa.update(campos)
+        gravar_tarefa(tarefa)
+
+
+def obter_tarefa(tarefa_id):
+    """Retorna o estado da tarefa (de qualquer worker), ou None se não existir"""
+    if not FORMATO_ID.fullmatch(tarefa_id):
+        return None
+    try:
+        with open(caminho_tarefa(tarefa_id)) as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def executar(app, tarefa_id, funcao, args):
+    """Executa a tarefa dentro de um contexto da aplicação e registra o resultado"""
+    atualizar_tarefa(tarefa_id, status='processando')
+    try:
+        with app.app_context():
+            funcao(tarefa_id, *args)
+        atualizar_tarefa(tarefa_id, status='concluida', concluida_em=time.time())
+    except Exception as e:
+        atualizar_tarefa(tarefa_id, status='erro', message=str(e), concluida_em=time.time())
+
+
+def enviar_tarefa(app, tipo, funcao, *args):
+    """
+    Agenda funcao(tarefa_id, *args) no pool de threads e retorna o id da
+    tarefa imediatamente. A função informa o progresso via atualizar_tarefa.
+    """
+    limpar_tarefas_antigas()
+
+    tarefa_id = uuid.uuid4().hex
+    with trava:
+        tarefas[tarefa_id] = {
+            'id': tarefa_id,
+            'tipo': tipo,
+            'status': 'pendente',
+            'message': '',
+            'total_linhas': 0,
+            'linhas_processadas': 0,
+            'produtos_criados': 0,
+            'produtos_atualizados': 0,
+            'erros': [],
+            'criada_em': time.time(),
+            'concluida_em': None,
+        }
+        gravar_tarefa(tarefas[tarefa_id])
+
+    executor.submit(executar, app, tarefa_id, funcao, args)
+    return tarefa_id
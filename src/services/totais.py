@@ -0,0 +1,243 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, delete, insert, select, or_
+from sqlalchemy.orm import Session, attributes
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem
+from src.models.estoque_total import EstoqueTotal, ATUALIZA_TOTAIS
+
+
+def registrar_manutencao():
+    """
+    Registra os eventos de sessão que mantêm estoque_totais em dia com as
+    alterações de contagens: as feitas pelo ORM (inclusão, alteração,
+    exclusão e exclusão em cascata do produto) somam a diferença aos totais;
+    instruções em massa (zerar estoque, inserções diretas) fazem os totais
+    serem recalculados antes do commit. Os upserts de Contagem.somar_em_lote
+    atualizam os totais diretamente e marcam a instrução com ATUALIZA_TOTAIS.
+    """
+    if event.contains(Session, 'after_flush', ao_flush):
+        return
+
+    event.listen(Session, 'before_flush', antes_flush)
+    event.listen(Session, 'after_flush', ao_flush)
+    event.listen(Session, 'do_orm_execute', ao_executar)
+    event.listen(Session, 'before_commit', antes_commit)
+    event.listen(Session, 'after_rollback', ao_rollback)
+
+
+def valor_gravado(instancia, atributo):
+    """Valor do atributo como está no banco (antes das alterações pendentes)"""
+    historico = attributes.get_history(instancia, atributo)
+    if historico.deleted:
+        return historico.deleted[0]
+    if historico.unchanged:
+        return historico.unchanged[0]
+    return None
+
+
+def altera_total(contagem):
+    """Contagem alterada no produto ou na quantidade (que muda os totais)"""
+    return any(
+        attributes.get_history(contagem, atributo).has_changes()
+        for atributo in ('produto_id', 'quantidade')
+    )
+
+
+def antes_flush(session, flush_context, instancias):
+    # Os totais de produtos excluídos saem antes do DELETE em produtos (chave estrangeira)
+    excluidos = [p.id for p in session.deleted if isinstance(p, Produto)]
+    if excluidos:
+        session.connection().execute(
+            delete(EstoqueTotal).where(EstoqueTotal.produto_id.in_(excluidos))
+        )
+
+    # Valores atuais das contagens alteradas ou excluídas, lidos com a linha
+    # bloqueada até o commit: a diferença somada aos totais vale mesmo que um
+    # upsert concorrente tenha mudado a quantidade depois que o objeto foi carregado
+    ids = [
+        contagem.id for contagem in session.dirty
+        if isinstance(contagem, Contagem) and altera_total(contagem)
+    ] + [contagem.id for contagem in session.deleted if isinstance(contagem, Contagem)]
+    if ids:
+        session.info['contagens_gravadas'] = {
+            contagem_id: (produto_id, quantidade)
+            for contagem_id, produto_id, quantidade in session.connection().execute(
+                select(Contagem.id, Contagem.produto_id, Contagem.quantidade)
+                .where(Contagem.id.in_(ids))
+                .with_for_update()
+            )
+        }
+
+
+def ao_flush(session, flush_context):
+    deltas = {}
+    gravadas = session.info.pop('contagens_gravadas', {})
+
+    def anterior(contagem):
+        """(produto_id, quantidade) da contagem no banco antes deste flush"""
+        if contagem.id in gravadas:
+            return gravadas[contagem.id]
+        return valor_gravado(contagem, 'produto_id'), valor_gravado(contagem, 'quantidade')
+
+    def somar(produto_id, quantidade, lotes):
+        atual_quantidade, atual_lotes = deltas.get(produto_id, (0, 0))
+        deltas[produto_id] = (atual_quantidade + quantidade, atual_lotes + lotes)
+
+    for contagem in session.new:
+        if isinstance(contagem, Contagem):
+            somar(contagem.produto_id, contagem.quantidade, 1)
+
+    for contagem in session.deleted:
+        if isinstance(contagem, Contagem):
+            produto_id, quantidade = anterior(contagem)
+            somar(produto_id, -quantidade, -1)
+
+    for contagem in session.dirty:
+        if isinstance(contagem, Contagem) and session.is_modified(contagem):
+            produto_id, quantidade = anterior(contagem)
+            somar(produto_id, -quantidade, -1)
+            somar(contagem.produto_id, contagem.quantidade, 1)
+
+    for produto in session.deleted:
+        if isinstance(produto, Produto):
+            deltas.pop(produto.id, None)
+
+    EstoqueTotal.somar(session.connection(), deltas)
+
+
+def ao_executar(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get(ATUALIZA_TOTAIS):
+        return
+    tabela = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(tabela, 'name', None) == 'contagens':
+        orm_execute_state.session.info['reconstruir_totais'] = True
+
+
+def antes_commit(session):
+    if session.info.pop('reconstruir_totais', False):
+        reconstruir_totais(session)
+
+
+def ao_rollback(session):
+    session.info.pop('reconstruir_totais', None)
+    session.info.pop('contagens_gravadas', None)
+
+
+def reconstruir_totais(session=None):
+    """
+    Recalcula estoque_totais a partir das contagens na transação atual
+    (o commit fica com quem chama). Retorna o número de produtos com contagens.
+    """
+    session = session or db.session
+    if session.get_bind().dialect.name == 'postgresql':
+        # Bloqueia escritas em contagens até o commit, sem bloquear leituras
+        session.execute(db.text('LOCK TABLE contagens IN SHARE MODE'))
+
+    session.execute(delete(EstoqueTotal))
+    resultado = session.execute(
+        insert(EstoqueTotal).from_select(
+            ['produto_id', 'quantidade_total', 'total_lotes'],
+            select(
+                Contagem.produto_id,
+                func.sum(Contagem.quantidade),
+                func.count(Contagem.id)
+            ).group_by(Contagem.produto_id)
+        )
+    )
+    return resultado.rowcount
+
+
+def verificar_totais():
+    """
+    Compara estoque_totais com as somas calculadas a partir das contagens.
+    Retorna a lista de divergências (produto_id, codigo, esperado, gravado),
+    com esperado e gravado no formato (quantidade_total, total_lotes).
+    """
+    calculado = select(
+        Contagem.produto_id,
+        func.sum(Contagem.quantidade).label('quantidade_total'),
+        func.count(Contagem.id).label('total_lotes')
+    ).group_by(Contagem.produto_id).subquery()
+
+    esperado_quantidade = func.coalesce(calculado.c.quantidade_total, 0)
+    esperado_lotes = func.coalesce(calculado.c.total_lotes, 0)
+    gravado_quantidade = func.coalesce(EstoqueTotal.quantidade_total, 0)
+    gravado_lotes = func.coalesce(EstoqueTotal.total_lotes, 0)
+
+    linhas = db.session.execute(
+        select(Produto.id, Produto.codigo, esperado_quantidade, esperado_lotes,
+               gravado_quantidade, gravado_lotes)
+        .outerjoin(calculado, calculado.c.produto_id == Produto.id)
+        .outerjoin(EstoqueTotal, EstoqueTotal.produto_id == Produto.id)
+        .where(or_(esperado_quantidade != gravado_quantidade, esperado_lotes != gravado_lotes))
+        .order_by(Produto.codigo)
+    )
+    divergencias = [
+        (produto_id, codigo, (eq, el), (gq, gl))
+        for produto_id, codigo, eq, el, gq, gl in linhas
+    ]
+
+    # Totais de produtos que não existem mais
+    orfaos = db.session.execute(
+        select(EstoqueTotal.produto_id, EstoqueTotal.quantidade_total, EstoqueTotal.total_lotes)
+        .where(EstoqueTotal.produto_id.not_in(select(Produto.id)))
+    )
+    divergencias.extend(
+        (produto_id, None, (0, 0), (quantidade, lotes))
+        for produto_id, quantidade, lotes in orfaos
+    )
+    return divergencias
+
+
+def resumo_totais():
+    """Totais do painel lidos de estoque_totais, sem agregar as contagens"""
+    total_geral, total_lotes, produtos_com_estoque = db.session.execute(
+        select(
+            func.coalesce(func.sum(EstoqueTotal.quantidade_total), 0),
+            func.coalesce(func.sum(EstoqueTotal.total_lotes), 0),
+            func.count(EstoqueTotal.produto_id).filter(EstoqueTotal.quantidade_total > 0)
+        )
+    ).one()
+    return {
+        'total_geral': total_geral,
+        'total_lotes': total_lotes,
+        'total_produtos': db.session.query(func.count(Produto.id)).scalar(),
+        'produtos_com_estoque': produtos_com_estoque
+    }
+
+
+def inicializar_totais():
+    """Preenche estoque_totais em bancos que já tinham contagens antes da tabela existir"""
+    if db.session.query(EstoqueTotal.produto_id).first() is None and \
+            db.session.query(Contagem.id).first() is not None:
+        reconstruir_totais()
+        db.session.commit()
+
+
+totais_cli = AppGroup('totais', help='Manutenção da tabela estoque_totais')
+
+
+@totais_cli.command('verificar')
+def comando_verificar():
+    """Lista produtos cujo total gravado difere das contagens"""
+    divergencias = verificar_totais()
+    for produto_id, codigo, esperado, gravado in divergencias:
+        click.echo(f'Produto {codigo or "(excluído)"} (id {produto_id}): '
+                   f'esperado {esperado[0]} em {esperado[1]} lotes, '
+                   f'gravado {gravado[0]} em {gravado[1]} lotes')
+    if divergencias:
+        raise SystemExit(f'{len(divergencias)} divergências encontradas. '
+                         'Use "flask --app src.main totais reconstruir" para corrigir.')
+    click.echo('Totais consistentes com as contagens.')
+
+
+@totais_cli.command('reconstruir')
+def comando_reconstruir():
+    """Recalcula todos os totais a partir das contagens"""
+    produtos = reconstruir_totais()
+    db.session.commit()
+    click.echo(f'Totais reconstruídos para {produtos} produtos.')
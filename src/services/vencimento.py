@@ -0,0 +1,91 @@
+from src.database import db
+from src.models.produto import Produto
+from src.models.contagem import Contagem, calcular_validade_chave
+from src.services.listagem import CAMPOS_CONTAGEM, CAMPOS_PRODUTO, ParametroInvalido, Projecao, ler_campos
+from src.services.serializacao import json_compacto
+
+LOTE_LEITURA = 1000
+
+
+def ler_mes_ano(texto, parametro):
+    """Interpreta 'MM/YYYY' e retorna a validade_chave correspondente"""
+    mes, separador, ano = (texto or '').strip().partition('/')
+    if not separador:
+        raise ParametroInvalido(f'Parâmetro {parametro} deve estar no formato MM/YYYY')
+    valido, resultado = Contagem.validar_validade(mes, ano)
+    if not valido:
+        raise ParametroInvalido(f'Parâmetro {parametro} inválido: {resultado}')
+    return calcular_validade_chave(*resultado)
+
+
+def consulta_vencimento(args):
+    """
+    Monta a consulta dos lotes com validade até 'ate' (e a partir de 'de',
+    se informado), em ordem de validade, código e lote. Retorna (query,
+    projeção, posições de produto_id, código, nome e quantidade na linha).
+    """
+    ate = ler_mes_ano(args.get('ate'), 'ate')
+    de = ler_mes_ano(args['de'], 'de') if args.get('de') else None
+    incluir_zerados = args.get('incluir_zerados', 'false').lower() == 'true'
+    campos, aninhados = ler_campos(args.get('fields'), CAMPOS_CONTAGEM, {'produto': CAMPOS_PRODUTO})
+
+    projecao = Projecao()
+    projecao.campos(campos, CAMPOS_CONTAGEM)
+    projecao.campos(aninhados.get('produto', []), CAMPOS_PRODUTO, destino='produto')
+    # Colunas usadas nos totais por produto, mesmo fora de fields
+    posicoes = [projecao.coluna(c) for c in (Produto.id, Produto.codigo, Produto.nome, Contagem.quantidade)]
+
+    # Faixa no índice de validade_chave
+    query = db.session.query(*projecao.colunas).select_from(Contagem).join(
+        Produto, Contagem.produto_id == Produto.id
+    ).filter(Contagem.validade_chave <= ate)
+    if de is not None:
+        query = query.filter(Contagem.validade_chave >= de)
+    if not incluir_zerados:
+        query = query.filter(Contagem.quantidade > 0)
+
+    query = query.order_by(Contagem.validade_chave, Produto.codigo, Contagem.lote)
+    return query, projecao, posicoes
+
+
+def gerar_json_vencimento(query, projecao, posicoes):
+    """
+    Gera o JSON da resposta em partes, lendo o cursor aos poucos: primeiro
+    os lotes, depois os totais por produto acumulados durante a leitura.
+    JSON compacto, como o das demais respostas (services/serializacao.py).
+    """
+    pos_id, pos_codigo, pos_nome, pos_quantidade = posicoes
+    totais = {}
+    total_quantidade = 0
+    total_lotes = 0
+
+    yield b'{"success":true,"contagens":['
+    # Os lotes são enviados em blocos de LOTE_LEITURA itens
+    bloco = []
+    separador = b''
+    for linha in query.yield_per(LOTE_LEITURA):
+        bloco.append(json_compacto(projecao.montar(linha)))
+        if len(bloco) == LOTE_LEITURA:
+            yield separador + b','.join(bloco)
+            bloco = []
+            separador = b','
+
+        total = totais.get(linha[pos_id])
+        if total is None:
+            total = totais[linha[pos_id]] = {
+                'produto': {'id': linha[pos_id], 'codigo': linha[pos_codigo], 'nome': linha[pos_nome]},
+                'quantidade': 0,
+                'lotes': 0
+            }
+        total['quantidade'] += linha[pos_quantidade]
+        total['lotes'] += 1
+        total_quantidade += linha[pos_quantidade]
+        total_lotes += 1
+
+    if bloco:
+        yield separador + b','.join(bloco)
+
+    produtos = sorted(totais.values(), key=lambda total: total['produto']['codigo'])
+    yield b'],"totais_produtos":' + json_compacto(produtos)
+    yield b',"total_quantidade":' + json_compacto(total_quantidade)
+    yield b',"total_lotes":' + json_compacto(total_lotes) + b'}\n'
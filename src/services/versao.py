@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from functools import wraps
+import secrets
+import threading
+from flask import g, has_app_context, request, make_response
+from sqlalchemy import event, select, update, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from src.database import db
+from src.models.alteracao import Sequencia, SEQUENCIA_ESTOQUE, SEQUENCIA_PRODUTOS
+
+# A versão do estoque fica no banco e muda a cada commit que altera produtos
+# ou contagens: vale para todos os workers e máquinas e sobrevive a reinícios.
+# No PostgreSQL é uma SEQUENCE incrementada (nextval) logo depois do commit:
+# nada fica travado, escritas simultâneas não esperam umas pelas outras, e o
+# novo valor só aparece quando os dados já estão visíveis. No SQLite, que tem
+# um único escritor por vez, é a linha sequencias.versao_estoque incrementada
+# na própria transação. A versão do catálogo (versao_produtos, chave do cache
+# de produtos em services/cache_produtos.py) funciona do mesmo jeito e só muda
+# com escritas em produtos.
+TABELAS_ESTOQUE = {'produtos', 'contagens'}
+
+# Respostas JSON guardadas por worker, válidas enquanto a versão não mudar
+MAX_RESPOSTAS = 64
+MAX_BYTES_RESPOSTAS = 64 * 1024 * 1024
+
+
+def usa_sequence(session):
+    return session.get_bind().dialect.name == 'postgresql'
+
+
+def versao_atual(nome=SEQUENCIA_ESTOQUE):
+    """Versão do estoque ou do catálogo (sem travas: last_value da sequence ou a linha pela chave primária)"""
+    if usa_sequence(db.session):
+        # Até o primeiro nextval, last_value é o valor inicial que ele vai retornar
+        return db.session.execute(
+            text(f'SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM {nome}')
+        ).scalar_one()
+    return db.session.execute(
+        select(Sequencia.valor).where(Sequencia.nome == nome)
+    ).scalar_one()
+
+
+def incrementar_versao(conexao, nome=SEQUENCIA_ESTOQUE):
+    """
+    Incrementa a versão. No PostgreSQL, nextval em uma conexão qualquer
+    (chamado depois do commit); no SQLite, na transação da conexão.
+    """
+    if conexao.dialect.name == 'postgresql':
+        conexao.execute(text(f"SELECT nextval('{nome}')"))
+    else:
+        conexao.execute(
+            update(Sequencia)
+            .where(Sequencia.nome == nome)
+            .values(valor=Sequencia.valor + 1)
+        )
+
+
+def versoes_alteradas(tabelas):
+    if 'produtos' in tabelas:
+        return (SEQUENCIA_ESTOQUE, SEQUENCIA_PRODUTOS)
+    return (SEQUENCIA_ESTOQUE,)
+
+
+def inicializar_versao():
+    """
+    Cria as versões do estoque e do catálogo em bancos novos ou anteriores
+    a elas. O valor inicial é aleatório: um banco recriado não repete as
+    versões de outro (ETags guardados nos navegadores, relatórios no cache
+    em disco, catálogos no cache dos workers).
+    """
+    for nome in (SEQUENCIA_ESTOQUE, SEQUENCIA_PRODUTOS):
+        inicial = secrets.randbits(40)
+        if usa_sequence(db.session):
+            db.session.execute(text(f'CREATE SEQUENCE IF NOT EXISTS {nome} START WITH {inicial}'))
+        elif db.session.get(Sequencia, nome) is None:
+            db.session.add(Sequencia(nome=nome, valor=inicial))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro worker criou a versão ao mesmo tempo
+        db.session.rollback()
+
+
+def marcar_alteracao(session, tabela):
+    if tabela in TABELAS_ESTOQUE:
+        session.info.setdefault('tabelas_alteradas', set()).add(tabela)
+
+
+def registrar_rastreamento():
+    """
+    Registra os eventos de sessão que detectam escritas em produtos e
+    contagens (ORM ou instruções INSERT/UPDATE/DELETE via session.execute)
+    e incrementam as versões do estoque e do catálogo (no commit ou logo
+    depois dele, ver incrementar_versao)
+    """
+    if event.contains(Session, 'after_commit', ao_commit):
+        return
+
+    event.listen(Session, 'after_flush', ao_flush)
+    event.listen(Session, 'do_orm_execute', ao_executar)
+    event.listen(Session, 'before_commit', antes_commit)
+    event.listen(Session, 'after_commit', ao_commit)
+    event.listen(Session, 'after_rollback', ao_rollback)
+
+
+def ao_flush(session, flush_context):
+    for instancia in (*session.new, *session.dirty, *session.deleted):
+        marcar_alteracao(session, getattr(instancia, '__tablename__', None))
+
+
+def ao_executar(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        tabela = getattr(orm_execute_state.statement, 'table', None)
+        marcar_alteracao(orm_execute_state.session, getattr(tabela, 'name', None))
+
+
+def antes_commit(session):
+    # O commit só envia ao banco as alterações pendentes depois deste evento
+    session.flush()
+    tabelas = session.info.get('tabelas_alteradas')
+    if tabelas and not usa_sequence(session):
+        for nome in versoes_alteradas(tabelas):
+            incrementar_versao(session.connection(), nome)
+
+
+def ao_commit(session):
+    tabelas = session.info.pop('tabelas_alteradas', None)
+    if not tabelas:
+        return
+    if usa_sequence(session):
+        # Conexão própria: a transação da sessão já terminou
+        with session.get_bind().connect() as conexao:
+            for nome in versoes_alteradas(tabelas):
+                incrementar_versao(conexao, nome)
+            conexao.commit()
+    if 'produtos' in tabelas and has_app_context():
+        # A requisição que alterou o catálogo volta a ler a versão (services/cache_produtos.py)
+        g.pop('versao_produtos', None)
+
+
+def ao_rollback(session):
+    session.info.pop('tabelas_alteradas', None)
+
+
+respostas = OrderedDict()
+trava_respostas = threading.Lock()
+bytes_respostas = 0
+
+
+def guardar_resposta(chave, versao, corpo):
+    """Guarda o corpo da resposta, descartando as menos usadas acima dos limites"""
+    global bytes_respostas
+
+    with trava_respostas:
+        anterior = respostas.pop(chave, None)
+        if anterior is not None:
+            bytes_respostas -= len(anterior[1])
+        if len(corpo) > MAX_BYTES_RESPOSTAS:
+            return
+        respostas[chave] = (versao, corpo)
+        bytes_respostas += len(corpo)
+        while len(respostas) > MAX_RESPOSTAS or bytes_respostas > MAX_BYTES_RESPOSTAS:
+            _, (_, descartado) = respostas.popitem(last=False)
+            bytes_respostas -= len(descartado)
+
+
+def resposta_condicional(view):
+    """
+    Decorator para listagens e resumos: envia ETag com a versão do estoque,
+    responde 304 quando If-None-Match confere e reaproveita o corpo já
+    gerado para a mesma URL enquanto a versão não mudar (sem consultar o banco)
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # A versão é lida antes da consulta: uma escrita concorrente apenas
+        # faz a próxima requisição gerar a resposta de novo
+        versao = versao_atual()
+        etag = f'estoque-{versao}'
+
+        # Comparação fraca: a resposta comprimida envia o mesmo ETag como W/"..."
+        if request.if_none_match.contains_weak(etag):
+            resposta = make_response('', 304)
+        else:
+            chave = request.full_path
+            with trava_respostas:
+                guardada = respostas.get(chave)
+                if guardada is not None:
+                    respostas.move_to_end(chave)
+
+            if guardada is not None and guardada[0] == versao:
+                resposta = make_response(guardada[1])
+                resposta.mimetype = 'application/json'
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code == 200 and not resposta.is_streamed:
+                    guardar_resposta(chave, versao, resposta.get_data())
+
+        if resposta.status_code in (200, 304):
+            resposta.set_etag(etag)
+            resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta
+
+    return wrapper
@@ -44,6 +44,7 @@ const elements = {
     editForm: document.getElementById('editForm'),
     loadingOverlay: document.getElementById('loadingOverlay'),
     toastContainer: document.getElementById('toastContainer'),
+    filaStatus: document.getElementById('filaStatus'),
     
     // Refresh
     refreshBtn: document.getElementById('refreshBtn')
@@ -58,6 +59,11 @@ function initializeApp() {
     setupEventListeners();
     loadProdutos();
     
+    // Envia as contagens que ficaram na fila (sem conexão ou página fechada antes do envio)
+    sincronizarFila();
+    setInterval(sincronizarFila, FILA_REPETIR_MS);
+    window.addEventListener('online', () => sincronizarFila());
+    
     // Ativar primeira tab
     showTab('produtos');
 }
@@ -136,15 +142,17 @@ function showTab(tabName) {
 
 // Funções de API
 async function apiCall(endpoint, options = {}) {
-    showLoading();
+    // silencioso: sem a tela de carregamento nem o aviso de erro (atualizações em segundo plano)
+    const { silencioso = false, ...fetchOptions } = options;
+    if (!silencioso) showLoading();
     
     try {
         const response = await fetch(`${API_BASE}${endpoint}`, {
             headers: {
                 'Content-Type': 'application/json',
-                ...options.headers
+                ...fetchOptions.headers
             },
-            ...options
+            ...fetchOptions
         });
         
         const data = await response.json();
@@ -156,10 +164,10 @@ async function apiCall(endpoint, options = {}) {
         return data;
     } catch (error) {
         console.error('Erro na API:', error);
-        showToast(error.message, 'error');
+        if (!silencioso) showToast(error.message, 'error');
         throw error;
     } finally {
-        hideLoading();
+        if (!silencioso) hideLoading();
     }
 }
 
@@ -293,9 +301,9 @@ function showProdutoEncontrado() {
     document.getElementById('lote').focus();
 }
 
-async function loadContagensProduto(codigo) {
+async function loadContagensProduto(codigo, silencioso = false) {
     try {
-        const response = await apiCall(`/contagens/produto/${codigo}`);
+        const response = await apiCall(`/contagens/produto/${codigo}`, { silencioso });
         contagens = response.contagens || [];
         renderContagens();
     } catch (error) {
@@ -346,37 +354,187 @@ async function handleContagemSubmit(e) {
     
     const formData = new FormData(e.target);
     const data = {
+        chave_idempotencia: gerarChaveIdempotencia(),
         codigo_produto: currentProduct.codigo,
-        lote: formData.get('lote'),
+        produto_nome: currentProduct.nome,
+        lote: formData.get('lote').trim().toUpperCase(),
         validade_mes: formData.get('validade_mes'),
         validade_ano: formData.get('validade_ano'),
         quantidade: formData.get('quantidade')
     };
     
     try {
-        const response = await apiCall('/contagens', {
-            method: 'POST',
-            body: JSON.stringify(data)
-        });
-        
-        // Exibir mensagem detalhada de sucesso
-        let toastMessage = `✅ Produto "${response.produto.nome}" (Código: ${response.produto.codigo})\n`;
-        if (response.criou_novo) {
-            toastMessage += `Lote: ${response.contagem.lote}\nQuantidade adicionada: ${response.contagem.quantidade}\nTotal no lote: ${response.contagem.quantidade}`;
-        } else {
-            toastMessage += `Lote: ${response.contagem.lote}\nQuantidade adicionada: ${response.quantidade_adicionada}\nQuantidade anterior: ${response.quantidade_anterior}\nNova quantidade total: ${response.contagem.quantidade}`;
-        }
-        showToast(toastMessage, 'success');
+        // A contagem fica gravada no aparelho e é enviada em segundo plano:
+        // o próximo item pode ser lido sem esperar o servidor
+        await filaAdicionar(data);
+        showToast(`Contagem na fila de envio\nLote: ${data.lote} | Quantidade: ${data.quantidade}`, 'success');
         
         // Limpar formulário
         elements.formContagem.reset();
         document.getElementById('lote').focus();
         
-        // Recarregar contagens
-        loadContagensProduto(currentProduct.codigo);
+        agendarSincronizacao();
         
     } catch (error) {
         console.error('Erro ao registrar contagem:', error);
+        showToast('Erro ao guardar a contagem no aparelho', 'error');
+    }
+}
+
+// Fila de Contagens (offline)
+// Cada contagem vai primeiro para o IndexedDB e é enviada em lotes para
+// POST /contagens/lote com uma chave de idempotência: um lote reenviado
+// (resposta perdida, queda do Wi-Fi) não soma a quantidade de novo.
+const FILA_BANCO = 'estoque_offline';
+const FILA_STORE = 'fila_contagens';
+const FILA_TAMANHO_LOTE = 200;
+const FILA_ESPERA_MS = 300;       // leituras seguidas do coletor saem em um único envio
+const FILA_REPETIR_MS = 15000;    // nova tentativa enquanto houver contagens pendentes
+
+let filaBanco = null;
+let filaMemoria = [];             // usada quando o IndexedDB não está disponível
+let filaSequencia = 0;
+let filaEnviando = false;
+let filaFalhou = false;
+let filaTimer = null;
+
+function gerarChaveIdempotencia() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    // Páginas sem HTTPS (rede local) não têm randomUUID
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function abrirFila() {
+    if (!filaBanco) {
+        filaBanco = new Promise(resolve => {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const pedido = indexedDB.open(FILA_BANCO, 1);
+            pedido.onupgradeneeded = () => {
+                // Chave autoincremento: getAll() retorna na ordem em que as contagens foram feitas
+                pedido.result.createObjectStore(FILA_STORE, { keyPath: 'id', autoIncrement: true });
+            };
+            pedido.onsuccess = () => resolve(pedido.result);
+            pedido.onerror = () => resolve(null);
+        });
+    }
+    return filaBanco;
+}
+
+function transacaoFila(banco, modo, operacao) {
+    return new Promise((resolve, reject) => {
+        const transacao = banco.transaction(FILA_STORE, modo);
+        const resultado = operacao(transacao.objectStore(FILA_STORE));
+        transacao.oncomplete = () => resolve(resultado && resultado.result);
+        transacao.onerror = () => reject(transacao.error);
+    });
+}
+
+async function filaAdicionar(contagem) {
+    const banco = await abrirFila();
+    if (!banco) {
+        filaMemoria.push({ ...contagem, id: ++filaSequencia });
+        return;
+    }
+    await transacaoFila(banco, 'readwrite', store => store.add(contagem));
+}
+
+async function filaListar() {
+    const banco = await abrirFila();
+    if (!banco) {
+        return filaMemoria.slice();
+    }
+    return transacaoFila(banco, 'readonly', store => store.getAll());
+}
+
+async function filaRemover(ids) {
+    const banco = await abrirFila();
+    if (!banco) {
+        const removidos = new Set(ids);
+        filaMemoria = filaMemoria.filter(contagem => !removidos.has(contagem.id));
+        return;
+    }
+    await transacaoFila(banco, 'readwrite', store => ids.forEach(id => store.delete(id)));
+}
+
+function agendarSincronizacao() {
+    clearTimeout(filaTimer);
+    filaTimer = setTimeout(sincronizarFila, FILA_ESPERA_MS);
+}
+
+function atualizarStatusFila(pendentes) {
+    if (!elements.filaStatus) return;
+    
+    if (pendentes === 0) {
+        elements.filaStatus.style.display = 'none';
+        return;
+    }
+    const aviso = filaFalhou ? ' (sem conexão, nova tentativa em instantes)' : '';
+    elements.filaStatus.innerHTML = `<i class="fas fa-cloud-upload-alt"></i> ${pendentes} contagem(ns) aguardando envio${aviso}`;
+    elements.filaStatus.style.display = 'block';
+}
+
+async function sincronizarFila() {
+    if (filaEnviando) return;
+    filaEnviando = true;
+    
+    let enviadas = 0;
+    const codigosEnviados = new Set();
+    
+    try {
+        while (true) {
+            const pendentes = await filaListar();
+            atualizarStatusFila(pendentes.length);
+            if (pendentes.length === 0) break;
+            
+            const lote = pendentes.slice(0, FILA_TAMANHO_LOTE);
+            const response = await fetch(`${API_BASE}/contagens/lote`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    contagens: lote.map(({ id, produto_nome, ...contagem }) => contagem)
+                })
+            });
+            if (!response.ok) {
+                // Erro no servidor: nada foi aplicado, o lote é reenviado depois
+                throw new Error(`Erro HTTP: ${response.status}`);
+            }
+            const data = await response.json();
+            
+            // Registradas, já registradas (reenvio) e recusadas saem da fila:
+            // uma recusa (produto inexistente, validade inválida) se repetiria
+            data.resultados.forEach((resultado, indice) => {
+                const contagem = lote[indice];
+                if (resultado.success) {
+                    codigosEnviados.add(contagem.codigo_produto);
+                } else {
+                    showToast(`Contagem não registrada: ${contagem.produto_nome} - Lote ${contagem.lote}\n${resultado.message}`, 'error');
+                }
+            });
+            await filaRemover(lote.map(contagem => contagem.id));
+            enviadas += data.total_registradas;
+        }
+        
+        if (filaFalhou && enviadas > 0) {
+            showToast(`${enviadas} contagem(ns) pendente(s) enviada(s)`, 'success');
+        }
+        filaFalhou = false;
+    } catch (error) {
+        // Sem conexão: a fila continua no aparelho até a próxima tentativa
+        console.warn('Contagens não enviadas:', error);
+        filaFalhou = true;
+        atualizarStatusFila((await filaListar()).length);
+    } finally {
+        filaEnviando = false;
+    }
+    
+    if (currentProduct && codigosEnviados.has(currentProduct.codigo)) {
+        loadContagensProduto(currentProduct.codigo, true);
     }
 }
 
@@ -554,14 +712,20 @@ async function handleUploadSubmit(e) {
             throw new Error(data.message || 'Erro ao importar arquivo');
         }
         
-        showToast(data.message, 'success');
+        // A importação roda em segundo plano no servidor
         hideUploadModal();
+        hideLoading();
+        showToast('Importação iniciada. Processando arquivo...', 'info');
+        
+        const resultado = await acompanharImportacao(data.tarefa_id);
+        
+        showToast(resultado.message, 'success');
         loadProdutos();
         
         // Mostrar detalhes se houver erros
-        if (data.detalhes && data.detalhes.erros.length > 0) {
-            console.warn('Erros na importação:', data.detalhes.erros);
-            showToast(`${data.detalhes.erros.length} erros encontrados. Verifique o console.`, 'warning');
+        if (resultado.detalhes && resultado.detalhes.erros.length > 0) {
+            console.warn('Erros na importação:', resultado.detalhes.erros);
+            showToast(`${resultado.detalhes.erros.length} erros encontrados. Verifique o console.`, 'warning');
         }
         
     } catch (error) {
@@ -572,6 +736,28 @@ async function handleUploadSubmit(e) {
     }
 }
 
+async function acompanharImportacao(tarefaId) {
+    // Consulta o progresso até a importação terminar
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        
+        const response = await fetch(`${API_BASE}/produtos/importar/${tarefaId}`);
+        const data = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(data.message || 'Erro ao consultar importação');
+        }
+        
+        if (data.status === 'concluida') {
+            return data;
+        }
+        
+        if (data.status === 'erro') {
+            throw new Error(`Erro ao importar produtos: ${data.message}`);
+        }
+    }
+}
+
 async function downloadTemplate() {
     try {
         const response = await fetch(`${API_BASE}/produtos/template`);